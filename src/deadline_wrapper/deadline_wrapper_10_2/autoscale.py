@@ -0,0 +1,401 @@
+"""
+Scale the number of local worker instances with demand and host load.
+
+Deadline runs several workers on one host as named instances
+(``deadlineworker -name <instance>``). :class:`Autoscaler` keeps between
+:attr:`AutoscaleConfig.min_workers` and :attr:`AutoscaleConfig.max_workers`
+of them running:
+
+- demand is the number of pending tasks reported by a pluggable
+  :class:`DemandSource` (a local file or an HTTP endpoint)
+- the host must have headroom to scale up: load average per CPU and
+  available memory are read from ``/proc``; under memory pressure an
+  instance is drained even if there is demand
+- hysteresis: a change has to be wanted for several consecutive checks and
+  changes are at least :attr:`AutoscaleConfig.cooldown` seconds apart
+- scaling down drains an instance (``-shutdown``, then SIGTERM and SIGKILL
+  after :attr:`AutoscaleConfig.drain_timeout`) instead of killing it; the
+  drain command runs in the background, so neither scaling nor draining all
+  instances on shutdown waits for it
+"""
+
+import abc
+import dataclasses
+import json
+import logging
+import math
+import os
+import pathlib
+import signal
+import subprocess
+import threading
+import time
+import urllib.request
+from typing import Callable, Dict, List, Optional
+
+from deadline_wrapper.deadline_wrapper_10_2.child import pump_output
+from deadline_wrapper.deadline_wrapper_10_2.watchdog import terminate
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+PROC = pathlib.Path("/proc")
+
+
+@dataclasses.dataclass
+class HostLoad:
+    # 1 minute load average
+    load: float
+    cpus: int
+    mem_total: int
+    mem_available: int
+
+    @property
+    def load_per_cpu(self) -> float:
+        return self.load / max(self.cpus, 1)
+
+    @property
+    def mem_available_fraction(self) -> float:
+        return self.mem_available / max(self.mem_total, 1)
+
+
+def read_host_load(proc: pathlib.Path = PROC) -> HostLoad:
+    """Load average and memory from ``/proc/loadavg`` and ``/proc/meminfo``."""
+    load = float((proc / "loadavg").read_text().split()[0])
+
+    meminfo = {}
+    for line in (proc / "meminfo").read_text().splitlines():
+        key, _, value = line.partition(":")
+        fields = value.split()
+        if fields:
+            meminfo[key] = int(fields[0]) * 1024
+
+    return HostLoad(
+        load=load,
+        cpus=os.cpu_count() or 1,
+        mem_total=meminfo.get("MemTotal", 0),
+        # MemAvailable is missing on kernels before 3.14
+        mem_available=meminfo.get("MemAvailable", meminfo.get("MemFree", 0)),
+    )
+
+
+def _parse_pending(data: bytes) -> int:
+    """``42`` or ``{"pending": 42}``."""
+    value = json.loads(data)
+    if isinstance(value, dict):
+        value = value["pending"]
+    pending = int(value)
+    if pending < 0:
+        raise ValueError(f"Negative demand {pending}")
+    return pending
+
+
+class DemandSource(abc.ABC):
+    """Number of pending tasks this host could work on.
+
+    Subclasses implement :meth:`pending`; ``None`` means unknown, in which
+    case the number of instances is left as it is.
+    """
+
+    @abc.abstractmethod
+    def pending(self) -> Optional[int]:
+        ...
+
+
+class FileDemand(DemandSource):
+    """Demand written to a local file, e.g. by a cron job querying Deadline."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+
+    def pending(self) -> Optional[int]:
+        try:
+            return _parse_pending(self.path.read_bytes())
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            _logger.warning("No demand from %s: %s", self.path.as_posix(), e)
+            return None
+
+
+class HttpDemand(DemandSource):
+    """Demand served over HTTP (GET, plain number or JSON)."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def pending(self) -> Optional[int]:
+        try:
+            with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+                return _parse_pending(response.read())
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            _logger.warning("No demand from %s: %s", self.url, e)
+            return None
+
+
+def demand_source(spec: str) -> DemandSource:
+    """:class:`HttpDemand` for ``http(s)://`` URLs, else :class:`FileDemand`."""
+    if spec.startswith(("http://", "https://")):
+        return HttpDemand(spec)
+    return FileDemand(pathlib.Path(spec))
+
+
+@dataclasses.dataclass
+class AutoscaleConfig:
+    min_workers: int = 0
+    max_workers: int = 1
+    # Pending tasks one instance is expected to work on
+    tasks_per_worker: int = 1
+    # No scaling up above this 1 minute load average per CPU
+    max_load_per_cpu: float = 0.9
+    # Drain an instance below this fraction of available memory
+    min_mem_available: float = 0.1
+    interval: float = 10.0
+    # Consecutive checks a change has to be wanted for
+    scale_up_after: int = 2
+    scale_down_after: int = 6
+    # Minimum seconds between two changes
+    cooldown: float = 60.0
+    drain_timeout: float = 300.0
+
+
+def desired_workers(
+        current: int,
+        pending: Optional[int],
+        load: HostLoad,
+        config: AutoscaleConfig,
+) -> int:
+    """Number of instances wanted right now, before hysteresis."""
+    if pending is None:
+        target = current
+    else:
+        target = math.ceil(pending / max(config.tasks_per_worker, 1))
+
+    if load.mem_available_fraction < config.min_mem_available:
+        target = min(target, current - 1)
+    elif load.load_per_cpu > config.max_load_per_cpu:
+        target = min(target, current)
+
+    return max(config.min_workers, min(config.max_workers, target))
+
+
+@dataclasses.dataclass
+class Instance:
+    name: str
+    proc: subprocess.Popen
+    thread: threading.Thread
+    started: float
+    draining: Optional[float] = None
+    # The drain command, while it runs
+    drainer: Optional[subprocess.Popen] = None
+
+
+class Autoscaler:
+    """Keep a demand driven number of worker instances running.
+
+    Args:
+      cmd (List[str]): worker command, ``-name <instance>`` is appended
+      demand (DemandSource): pending tasks
+      config (AutoscaleConfig): bounds and thresholds
+      instance_prefix (str): instances are named ``<prefix>-01``, ...
+      drain_cmd (Callable[[str], List[str]]): command asking the named
+          instance to shut down; ``None`` sends SIGTERM right away
+      read_load (Callable[[], HostLoad]): host load, for tests
+    """
+
+    def __init__(
+            self,
+            cmd: List[str],
+            demand: DemandSource,
+            config: AutoscaleConfig,
+            instance_prefix: str = "autoscale",
+            drain_cmd: Optional[Callable[[str], List[str]]] = None,
+            read_load: Callable[[], HostLoad] = read_host_load,
+    ):
+        assert 0 <= config.min_workers <= config.max_workers
+        self.cmd = cmd
+        self.demand = demand
+        self.config = config
+        self.instance_prefix = instance_prefix
+        self.drain_cmd = drain_cmd
+        self.read_load = read_load
+        self.instances: Dict[str, Instance] = {}
+        self._want_up = 0
+        self._want_down = 0
+        self._last_change = -math.inf
+        self._stop_event = threading.Event()
+
+    @property
+    def active(self) -> List[Instance]:
+        return [i for i in self.instances.values() if i.draining is None]
+
+    def _free_name(self) -> str:
+        index = 1
+        while f"{self.instance_prefix}-{index:02d}" in self.instances:
+            index += 1
+        return f"{self.instance_prefix}-{index:02d}"
+
+    def start_instance(self) -> Instance:
+        name = self._free_name()
+        proc = subprocess.Popen(
+            [*self.cmd, "-name", name],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            # Own process group, so draining stops the whole tree
+            start_new_session=True,
+        )
+        thread = threading.Thread(
+            target=pump_output,
+            args=(proc,),
+            kwargs=dict(functions=(
+                lambda line: _logger.info("[%s] %s", name, line),
+                lambda line: _logger.error("[%s] %s", name, line),
+            )),
+            name=f"instance-{name}",
+            daemon=True,
+        )
+        thread.start()
+        instance = Instance(
+            name=name,
+            proc=proc,
+            thread=thread,
+            started=time.monotonic(),
+        )
+        self.instances[name] = instance
+        _logger.info("Started instance %s (pid %s)", name, proc.pid)
+        return instance
+
+    def drain_instance(self, instance: Instance):
+        """Ask ``instance`` to shut down without waiting for it; it is
+        reaped (or stopped after the drain timeout) by :meth:`reap`."""
+        instance.draining = time.monotonic()
+        _logger.info("Draining instance %s (pid %s)", instance.name, instance.proc.pid)
+
+        if self.drain_cmd is not None:
+            try:
+                instance.drainer = subprocess.Popen(
+                    self.drain_cmd(instance.name),
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                return
+            except OSError as e:
+                _logger.warning("Could not drain %s: %s", instance.name, e)
+
+        self._signal(instance)
+
+    @staticmethod
+    def _signal(instance: Instance):
+        try:
+            os.killpg(instance.proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    @staticmethod
+    def _stop_drainer(instance: Instance):
+        if instance.drainer is not None:
+            if instance.drainer.poll() is None:
+                instance.drainer.kill()
+            instance.drainer.wait()
+            instance.drainer = None
+
+    def reap(self):
+        """Forget exited instances, fall back to SIGTERM where the drain
+        command failed and stop instances draining for too long."""
+        now = time.monotonic()
+        for name, instance in list(self.instances.items()):
+            if instance.proc.poll() is not None:
+                self._stop_drainer(instance)
+                instance.thread.join()
+                _logger.info(
+                    "Instance %s exited with %s", name, instance.proc.returncode,
+                )
+                del self.instances[name]
+                continue
+
+            if instance.drainer is not None and instance.drainer.poll() is not None:
+                if instance.drainer.returncode:
+                    _logger.warning(
+                        "Could not drain %s: drain command exited with %s",
+                        name, instance.drainer.returncode,
+                    )
+                    self._signal(instance)
+                instance.drainer = None
+
+            if (
+                    instance.draining is not None
+                    and now - instance.draining >= self.config.drain_timeout
+            ):
+                _logger.warning("Instance %s did not drain in time, stopping", name)
+                self._stop_drainer(instance)
+                terminate(instance.proc, timeout=30.0)
+
+    def step(self) -> int:
+        """One check: reap, measure, maybe scale. Returns the active count."""
+        self.reap()
+
+        active = self.active
+        current = len(active)
+        pending = self.demand.pending()
+        load = self.read_load()
+        target = desired_workers(current, pending, load, self.config)
+
+        _logger.debug(
+            "pending %s, load/cpu %.2f, mem available %.0f%%: %s -> %s instances",
+            pending, load.load_per_cpu, load.mem_available_fraction * 100,
+            current, target,
+        )
+
+        self._want_up = self._want_up + 1 if target > current else 0
+        self._want_down = self._want_down + 1 if target < current else 0
+        cooled_down = time.monotonic() - self._last_change >= self.config.cooldown
+        # Below the minimum or under memory pressure there is no waiting
+        urgent = (
+            current < self.config.min_workers
+            or load.mem_available_fraction < self.config.min_mem_available
+        )
+
+        scale_up = target > current and (
+            urgent or (cooled_down and self._want_up >= self.config.scale_up_after)
+        )
+        scale_down = target < current and (
+            urgent or (cooled_down and self._want_down >= self.config.scale_down_after)
+        )
+
+        if scale_up:
+            for _ in range(target - current):
+                self.start_instance()
+            self._last_change = time.monotonic()
+            self._want_up = 0
+        elif scale_down:
+            # The newest instances go first
+            for instance in sorted(active, key=lambda i: i.started)[target - current:]:
+                self.drain_instance(instance)
+            self._last_change = time.monotonic()
+            self._want_down = 0
+
+        return len(self.active)
+
+    def run(self):
+        """Check every :attr:`AutoscaleConfig.interval` seconds until
+        :meth:`stop`, then drain all instances."""
+        try:
+            while not self._stop_event.is_set():
+                self.step()
+                self._stop_event.wait(self.config.interval)
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def shutdown(self):
+        """Drain all instances and wait for them to exit."""
+        for instance in self.active:
+            self.drain_instance(instance)
+        while self.instances:
+            self.reap()
+            time.sleep(0.1)
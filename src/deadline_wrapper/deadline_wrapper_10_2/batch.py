@@ -0,0 +1,158 @@
+"""
+Execute a JSON-lines stream of operations in one process.
+
+Every line is one operation::
+
+    {"id": "repo", "sub_command": "install-repository", "installer": "...", ...}
+    {"sub_command": "install-client", "independent": true, ...}
+
+Operations run in order. Consecutive operations marked ``"independent":
+true`` run in parallel; any other operation waits for everything before it
+and blocks everything after it. One JSON result is written per operation as
+soon as it finishes::
+
+    {"index": 0, "id": "repo", "sub_command": "install-repository",
+     "exit_status": 0, "duration": 12.3, "result": ...}
+
+``exit_status`` is ``0`` on success, ``1`` if the operation failed and ``2``
+if it did not validate, matching the exit codes of the command line.
+"""
+
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional, TextIO
+
+from deadline_wrapper.deadline_wrapper_10_2.server import to_jsonable
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+RESERVED_FIELDS = ("id", "sub_command", "independent")
+
+
+class _Operation:
+
+    def __init__(self, index: int, line: str):
+        self.index = index
+        self.op = json.loads(line)
+        if not isinstance(self.op, dict):
+            raise ValueError("Expected a JSON object")
+        if "sub_command" not in self.op:
+            raise ValueError("Missing 'sub_command'")
+        self.sub_command = self.op["sub_command"]
+        self.independent = bool(self.op.get("independent", False))
+        self.fields = {k: v for k, v in self.op.items() if k not in RESERVED_FIELDS}
+        self.prepared = None
+
+    def result(self, **kwargs) -> dict:
+        return {
+            "index": self.index,
+            "id": self.op.get("id"),
+            "sub_command": self.sub_command,
+            **kwargs,
+        }
+
+
+def run_batch(
+        lines: Iterable[str],
+        validate: Callable[[str, dict], Any],
+        execute: Callable[[Any], Any],
+        output: TextIO,
+        jobs: Optional[int] = None,
+        exclusive: Iterable[str] = (),
+) -> int:
+    """Run the operations in ``lines`` and write one JSON result per line
+    to ``output``.
+
+    Args:
+      lines (Iterable[str]): JSON lines
+      validate (Callable[[str, dict], Any]): called with sub command and
+          fields, returns what ``execute`` receives, raises
+          :class:`ValueError` for invalid operations
+      execute (Callable[[Any], Any]): runs a validated operation
+      output (TextIO): stream to write the results to
+      jobs (int): maximum number of independent operations in parallel
+      exclusive (Iterable[str]): sub commands that never run concurrently
+          with each other, even if marked independent
+
+    Returns:
+      int: number of operations that did not succeed
+    """
+    exclusive = frozenset(exclusive)
+    exclusive_lock = threading.Lock()
+    failures = 0
+
+    def _write(result: dict):
+        nonlocal failures
+        if result["exit_status"]:
+            failures += 1
+        output.write(json.dumps(result, default=to_jsonable) + "\n")
+        output.flush()
+
+    def _execute(operation: _Operation) -> dict:
+        start = time.monotonic()
+        try:
+            if operation.sub_command in exclusive:
+                with exclusive_lock:
+                    result = execute(operation.prepared)
+            else:
+                result = execute(operation.prepared)
+        except Exception as e:
+            _logger.exception("Operation %s failed", operation.index)
+            return operation.result(
+                exit_status=1,
+                duration=time.monotonic() - start,
+                error=f"{type(e).__name__}: {e}",
+            )
+        return operation.result(
+            exit_status=0,
+            duration=time.monotonic() - start,
+            result=result,
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = set()
+
+        def _drain():
+            for future in concurrent.futures.as_completed(pending):
+                _write(future.result())
+            pending.clear()
+
+        for index, line in enumerate(line for line in lines if line.strip()):
+            try:
+                operation = _Operation(index, line)
+            except ValueError as e:
+                _write({
+                    "index": index,
+                    "exit_status": 2,
+                    "duration": 0.0,
+                    "error": str(e),
+                })
+                continue
+
+            try:
+                operation.prepared = validate(operation.sub_command, operation.fields)
+            except ValueError as e:
+                # Parsed, so the result can say which operation it was
+                _write(operation.result(exit_status=2, duration=0.0, error=str(e)))
+                continue
+
+            if operation.independent:
+                pending.add(executor.submit(_execute, operation))
+                for future in [f for f in pending if f.done()]:
+                    pending.remove(future)
+                    _write(future.result())
+            else:
+                _drain()
+                _write(_execute(operation))
+
+        _drain()
+
+    return failures
@@ -0,0 +1,255 @@
+"""
+Run a child process, forward its output line by line and summarize the run.
+
+Memory use does not depend on how much the child writes: every stream keeps
+only counters and a ring buffer of its last lines, and lines are cut at
+:data:`MAX_LINE_LENGTH`.
+
+A child running longer than ``timeout`` or silent for longer than
+``silence_timeout`` is stopped (its whole process group if it leads one)
+and the result records why, see :attr:`ChildResult.timed_out`.
+"""
+
+import collections
+import dataclasses
+import logging
+import pathlib
+import subprocess
+import threading
+import time
+from typing import Callable, Deque, List, Optional, Sequence
+
+from deadline_wrapper.deadline_wrapper_10_2.watchdog import terminate
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+TAIL_LINES = 100
+MAX_LINE_LENGTH = 8192
+# Seconds between SIGTERM and SIGKILL for a child that timed out
+TERM_TIMEOUT = 10.0
+
+
+@dataclasses.dataclass
+class RunLimits:
+    # Seconds one attempt may take
+    timeout: Optional[float] = None
+    # Seconds one attempt may go without output
+    silence_timeout: Optional[float] = None
+    # Seconds all attempts together may take, including the waits between
+    total_timeout: Optional[float] = None
+    # Attempts after the first one
+    retries: int = 0
+    # Seconds before the first retry, doubled for every further one
+    backoff: float = 10.0
+    max_backoff: float = 300.0
+
+    def wait(self, attempt: int) -> float:
+        """Seconds to wait after failed ``attempt`` (0 based)."""
+        return min(self.backoff * 2 ** attempt, self.max_backoff)
+
+
+@dataclasses.dataclass
+class StreamStats:
+    bytes: int = 0
+    lines: int = 0
+    tail: List[str] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class ChildResult:
+    cmd: List[str]
+    returncode: int
+    duration: float
+    stdout: StreamStats
+    stderr: StreamStats
+    # Last lines of both streams, interleaved in the order they arrived
+    tail: List[str]
+    log_path: Optional[pathlib.Path] = None
+    # "timeout" or "silence" if the child was stopped
+    timed_out: Optional[str] = None
+    # Earlier failed attempts of the same command, oldest first
+    attempts: List["ChildResult"] = dataclasses.field(default_factory=list)
+
+
+class ChildProcessFailed(RuntimeError):
+    """Raised when a child exited with a non-zero exit code.
+
+    Attributes:
+      result (ChildResult): summary of the failed run
+    """
+
+    def __init__(self, result: ChildResult):
+        self.result = result
+        tail = "\n".join(result.tail[-20:])
+        super().__init__(
+            f"{' '.join(result.cmd)} "
+            + (
+                f"was stopped ({result.timed_out}) "
+                if result.timed_out else
+                f"exited with {result.returncode} "
+            )
+            + f"after {result.duration:.1f}s"
+            + (
+                f" and {len(result.attempts)} earlier attempts"
+                if result.attempts else ""
+            )
+            + (f", log: {result.log_path}" if result.log_path else "")
+            + (f"\n{tail}" if tail else "")
+        )
+
+
+def _pump(
+        handle,
+        function: Callable[[str], None],
+        stats: StreamStats,
+        tail: Deque[str],
+        merged: Deque[str],
+        on_line: Optional[Callable[[str], None]],
+        last_output: List[float],
+):
+    with handle:
+        while True:
+            raw = handle.readline(MAX_LINE_LENGTH)
+            if not raw:
+                break
+            last_output[0] = time.monotonic()
+            stats.bytes += len(raw)
+            stats.lines += 1
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            tail.append(line)
+            merged.append(line)
+            if on_line is not None:
+                on_line(line)
+            function(line)
+
+
+def pump_output(
+        proc: subprocess.Popen,
+        functions: Sequence[Callable[[str], None]] = (_logger.info, _logger.error),
+        tail_lines: int = TAIL_LINES,
+        on_line: Optional[Callable[[str], None]] = None,
+        timeout: Optional[float] = None,
+        silence_timeout: Optional[float] = None,
+) -> ChildResult:
+    """Forward stdout and stderr of ``proc`` until both are closed, then
+    wait for it to exit.
+
+    Args:
+      proc (subprocess.Popen): child started with ``stdout`` and ``stderr``
+          set to :data:`subprocess.PIPE`
+      functions (Sequence[Callable[[str], None]]): called with every line of
+          stdout and stderr respectively
+      tail_lines (int): number of lines to keep per stream
+      on_line (Callable[[str], None]): additionally called with every line
+      timeout (float): stop the child after this many seconds
+      silence_timeout (float): stop the child after this many seconds
+          without output
+
+    Returns:
+      :obj:`ChildResult`
+    """
+    start = time.monotonic()
+    last_output = [start]
+    merged = collections.deque(maxlen=tail_lines)
+    streams = []
+    threads = []
+
+    for handle, function in zip((proc.stdout, proc.stderr), functions):
+        stats = StreamStats()
+        tail = collections.deque(maxlen=tail_lines)
+        streams.append((stats, tail))
+        thread = threading.Thread(
+            target=_pump,
+            args=(handle, function, stats, tail, merged, on_line, last_output),
+            name=f"pump-{proc.pid}",
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+
+    timed_out = None
+    if timeout is None and silence_timeout is None:
+        for thread in threads:
+            thread.join()
+    else:
+        while True:
+            alive = [thread for thread in threads if thread.is_alive()]
+            if not alive:
+                break
+            alive[0].join(0.1)
+            now = time.monotonic()
+            if timeout is not None and now - start >= timeout:
+                timed_out = "timeout"
+            elif (
+                    silence_timeout is not None
+                    and now - last_output[0] >= silence_timeout
+            ):
+                timed_out = "silence"
+            else:
+                continue
+            _logger.error(
+                "%s (pid %s) %s after %.1fs, stopping it",
+                proc.args, proc.pid,
+                "timed out" if timed_out == "timeout" else "went silent",
+                now - start,
+            )
+            terminate(proc, TERM_TIMEOUT)
+            for thread in threads:
+                # Grandchildren outside the process group may keep the
+                # pipes open
+                thread.join(TERM_TIMEOUT)
+            break
+    returncode = proc.wait()
+
+    for stats, tail in streams:
+        stats.tail = list(tail)
+
+    return ChildResult(
+        cmd=list(map(str, proc.args)),
+        returncode=returncode,
+        duration=time.monotonic() - start,
+        stdout=streams[0][0],
+        stderr=streams[1][0],
+        tail=list(merged),
+        timed_out=timed_out,
+    )
+
+
+def run_child(
+        cmd: List[str],
+        functions: Sequence[Callable[[str], None]] = (_logger.info, _logger.error),
+        tail_lines: int = TAIL_LINES,
+        on_line: Optional[Callable[[str], None]] = None,
+        timeout: Optional[float] = None,
+        silence_timeout: Optional[float] = None,
+        **kwargs,
+) -> ChildResult:
+    """Start ``cmd`` and :func:`pump_output` it. ``kwargs`` go to
+    :class:`subprocess.Popen`."""
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **kwargs,
+    )
+    return pump_output(
+        proc,
+        functions=functions,
+        tail_lines=tail_lines,
+        on_line=on_line,
+        timeout=timeout,
+        silence_timeout=silence_timeout,
+    )
+
+
+def check_result(result: ChildResult) -> ChildResult:
+    """Raise :class:`ChildProcessFailed` if ``result`` has a non-zero exit
+    code or was stopped."""
+    if result.returncode or result.timed_out:
+        raise ChildProcessFailed(result)
+    return result
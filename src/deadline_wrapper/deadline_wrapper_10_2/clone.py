@@ -0,0 +1,250 @@
+"""
+Clone an installed client prefix into sibling prefixes.
+
+Immutable files (binaries, libraries, ...) are hardlinked, so a clone costs
+one directory walk instead of a full installer run. Files matching
+:data:`MUTABLE_PATTERNS` are copied and passed through a rewrite callback, so
+per-instance settings can differ between clones.
+
+Note:
+    Hardlinked files share their inode with the golden install. They must
+    never be modified in place, neither in the source nor in a clone.
+
+Note:
+    An installed client keeps its settings, ports included, in
+    :data:`HOST_INI`, outside the prefix. Every clone therefore gets its own
+    :data:`INSTANCE_INI` built from it by :func:`instance_ini`, which
+    ``run --deadline-ini`` hands to the daemon via :data:`CONFIG_ENV`.
+"""
+
+import dataclasses
+import errno
+import fnmatch
+import logging
+import os
+import pathlib
+import re
+import shutil
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from deadline_wrapper.deadline_wrapper_10_2.fsutil import is_reserved
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+MUTABLE_PATTERNS = (
+    "*.ini",
+    "*.conf",
+    "*.cfg",
+    "*.config",
+    "*.json",
+    "*.log",
+)
+
+# install_client option -> deadline.ini key
+PORT_KEYS = {
+    "httpport": "HttpListenPort",
+    "webservice_httpport": "WebServiceHttpListenPort",
+}
+
+# Settings of the client installed on this host
+HOST_INI = pathlib.Path("/var/lib/Thinkbox/Deadline10/deadline.ini")
+
+# Settings of a clone, relative to its prefix
+INSTANCE_INI = "deadline.ini"
+
+# Points a Deadline daemon at another deadline.ini than HOST_INI
+CONFIG_ENV = "DEADLINE_CONFIG_FILE"
+
+
+@dataclasses.dataclass
+class CloneStats:
+    target: pathlib.Path
+    linked: int = 0
+    copied: int = 0
+    symlinks: int = 0
+
+
+def is_mutable(
+        relpath: str,
+        patterns: Iterable[str] = MUTABLE_PATTERNS,
+) -> bool:
+    name = os.path.basename(relpath)
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def rewrite_ini_ports(
+        data: bytes,
+        ports: Dict[str, int],
+        applied: Optional[Set[str]] = None,
+) -> bytes:
+    """Replace the values of the :data:`PORT_KEYS` entries in ini content.
+
+    Args:
+      data (bytes): file content
+      ports (Dict[str, int]): ``install_client`` option name -> port
+      applied (Set[str]): the options found in ``data`` are added to it
+    """
+    for option, port in ports.items():
+        key = re.escape(PORT_KEYS[option]).encode()
+        data, count = re.subn(
+            rb"^(\s*" + key + rb"\s*=\s*)\d+",
+            lambda m: m.group(1) + str(port).encode(),
+            data,
+            flags=re.MULTILINE,
+        )
+        if count and applied is not None:
+            applied.add(option)
+    return data
+
+
+def retarget_link(
+        link: str,
+        old: str,
+        new: str,
+) -> str:
+    """``link`` with the leading path ``old`` replaced by ``new``, if it is
+    an absolute link to ``old`` or below."""
+    if os.path.isabs(link) and (link == old or link.startswith(old + os.sep)):
+        return new + link[len(old):]
+    return link
+
+
+def replace_path(
+        data: bytes,
+        old: pathlib.Path,
+        new: pathlib.Path,
+) -> bytes:
+    """Replace the path ``old`` with ``new`` in ``data``, only where it is a
+    whole path (or the start of one): ``/opt/D`` leaves ``/opt/Deadline10``
+    alone."""
+    pattern = (
+        rb"(?<![\w.\-/])"
+        + re.escape(old.as_posix().encode())
+        + rb"(?![\w.\-])"
+    )
+    replacement = new.as_posix().encode()
+    return re.sub(pattern, lambda m: replacement, data)
+
+
+def instance_ini(
+        data: bytes,
+        ports: Dict[str, int],
+) -> bytes:
+    """``deadline.ini`` content with ``ports`` set, added to the
+    ``[Deadline]`` section where ``data`` has no entry for them."""
+    applied = set()
+    data = rewrite_ini_ports(data, ports, applied)
+
+    missing = b"".join(
+        f"{PORT_KEYS[option]}={port}\n".encode()
+        for option, port in ports.items()
+        if option not in applied
+    )
+    if not missing:
+        return data
+
+    section = re.search(rb"^\[Deadline\][ \t]*\r?\n?", data, flags=re.MULTILINE)
+    if section is None:
+        if data and not data.endswith(b"\n"):
+            data += b"\n"
+        return data + b"[Deadline]\n" + missing
+    head = data[:section.end()]
+    if not head.endswith(b"\n"):
+        head += b"\n"
+    return head + missing + data[section.end():]
+
+
+def _link_or_copy(src: str, dst: str) -> bool:
+    try:
+        os.link(src, dst)
+        return True
+    except OSError as e:
+        # Different filesystem or hardlinks not permitted
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copy2(src, dst)
+        return False
+
+
+def clone_tree(
+        source: pathlib.Path,
+        target: pathlib.Path,
+        rewrite: Optional[Callable[[str, bytes], bytes]] = None,
+        mutable_patterns: Iterable[str] = MUTABLE_PATTERNS,
+) -> CloneStats:
+    """Clone ``source`` into the (empty or missing) directory ``target``.
+
+    Args:
+      source (pathlib.Path): golden install
+      target (pathlib.Path): clone destination
+      rewrite (Callable[[str, bytes], bytes]): called with the relative
+          path and content of every mutable file, returns the new content
+      mutable_patterns (Iterable[str]): file name patterns to copy
+          instead of hardlink
+
+    Returns:
+      :obj:`CloneStats`
+    """
+    mutable_patterns = tuple(mutable_patterns)
+    stats = CloneStats(target=target)
+    source_str = os.fspath(source)
+    target_str = os.fspath(target)
+
+    target.mkdir(parents=True, exist_ok=True)
+    shutil.copystat(source, target)
+
+    for root, dirs, files in os.walk(source):
+        # Each clone gets its own lock, never a hardlink to the source's
+        dirs[:] = [name for name in dirs if not is_reserved(name)]
+        files[:] = [name for name in files if not is_reserved(name)]
+        rel_root = os.path.relpath(root, source)
+        target_root = os.path.normpath(os.path.join(target, rel_root))
+
+        for name in list(dirs):
+            src = os.path.join(root, name)
+            dst = os.path.join(target_root, name)
+            if os.path.islink(src):
+                # os.walk does not descend into symlinked dirs
+                files.append(name)
+                continue
+            os.mkdir(dst)
+            shutil.copystat(src, dst)
+
+        for name in files:
+            src = os.path.join(root, name)
+            dst = os.path.join(target_root, name)
+            rel = os.path.normpath(os.path.join(rel_root, name))
+
+            if os.path.islink(src):
+                link = retarget_link(os.readlink(src), source_str, target_str)
+                os.symlink(link, dst)
+                stats.symlinks += 1
+
+            elif is_mutable(rel, mutable_patterns):
+                with open(src, "rb") as fo:
+                    data = fo.read()
+                if rewrite is not None:
+                    data = rewrite(rel, data)
+                with open(dst, "wb") as fo:
+                    fo.write(data)
+                shutil.copystat(src, dst)
+                stats.copied += 1
+
+            elif _link_or_copy(src, dst):
+                stats.linked += 1
+
+            else:
+                stats.copied += 1
+
+    _logger.debug(
+        "Cloned %s -> %s (%s linked, %s copied, %s symlinks)",
+        source.as_posix(), target.as_posix(),
+        stats.linked, stats.copied, stats.symlinks,
+    )
+
+    return stats
@@ -27,10 +27,94 @@ import sys
 import pathlib
 import subprocess
 import shutil
-
-from dagster.dagster_shared.shared.helpers import *
+import signal
+import threading
+import time
+import collections
+import concurrent.futures
+import cProfile
+import contextlib
+import functools
+from typing import Callable, Iterable, List, Optional
 
 from deadline_wrapper.deadline_wrapper_10_2 import __version__
+from deadline_wrapper.deadline_wrapper_10_2.autoscale import (
+    AutoscaleConfig,
+    Autoscaler,
+    demand_source,
+)
+from deadline_wrapper.deadline_wrapper_10_2.batch import run_batch
+from deadline_wrapper.deadline_wrapper_10_2.child import (
+    ChildProcessFailed,
+    ChildResult,
+    RunLimits,
+    check_result,
+    pump_output,
+    run_child,
+)
+from deadline_wrapper.deadline_wrapper_10_2.clone import (
+    CONFIG_ENV,
+    HOST_INI,
+    INSTANCE_INI,
+    CloneStats,
+    clone_tree,
+    instance_ini,
+    replace_path,
+    rewrite_ini_ports,
+)
+from deadline_wrapper.deadline_wrapper_10_2.server import (
+    DEFAULT_SOCKET,
+    Service,
+    serve as server_serve,
+)
+from deadline_wrapper.deadline_wrapper_10_2.sync import (
+    SyncStats,
+    sync_tree,
+)
+from deadline_wrapper.deadline_wrapper_10_2.tail import (
+    DEFAULT_LOG_DIR,
+    LogTailer,
+)
+from deadline_wrapper.deadline_wrapper_10_2.upgrade import (
+    REPOSITORY_PRESERVE,
+    TreeDiff,
+    apply_diff,
+    diff_trees,
+    relocate,
+    staging_dir,
+)
+from deadline_wrapper.deadline_wrapper_10_2.watchdog import (
+    Watchdog,
+    WatchdogConfig,
+)
+from deadline_wrapper.deadline_wrapper_10_2.instrumentation import (
+    TRACER,
+    load_entry_point_hooks,
+    phase,
+    traced,
+)
+from deadline_wrapper.deadline_wrapper_10_2.health import (
+    DEFAULT_STATE_FILE,
+    RunnerState,
+)
+from deadline_wrapper.deadline_wrapper_10_2.fsutil import (
+    atomic_write_bytes,
+    is_empty_dir,
+    is_reserved,
+)
+from deadline_wrapper.deadline_wrapper_10_2.installer_cache import (
+    default_cache_dir,
+    stage_installer,
+)
+from deadline_wrapper.deadline_wrapper_10_2.locking import PrefixLock
+from deadline_wrapper.deadline_wrapper_10_2.profiles import (
+    available_versions,
+    get_profile,
+)
+from deadline_wrapper.deadline_wrapper_10_2.preflight import (
+    PREFLIGHT_MODES,
+    wait_for_db,
+)
 
 __author__ = "Michael Mussato"
 __copyright__ = "Michael Mussato"
@@ -41,10 +125,46 @@ _logger = logging.getLogger(__name__)
 
 # INSTALLER_DIR = "{installers_root}/Deadline-{deadline_version}-linux-installers"
 
+INSTALLER_LOG = pathlib.Path("/tmp/installbuilder_installer.log")
+
+# Where the executables of ``run`` and ``autoscale`` are installed
+CLIENT_PREFIX = pathlib.Path("/opt/Thinkbox/Deadline10")
+
+# Daemons ``run`` can start, see VersionProfile.binaries
+RUN_ROLES = ("rcs", "webservice", "pulse", "worker")
+
 
 # ---- Python API ----
 
 
+def resolve_executable(
+        deadline_version: str,
+        executable: Optional[pathlib.Path] = None,
+        roles: Iterable[str] = RUN_ROLES,
+        prefix: pathlib.Path = CLIENT_PREFIX,
+) -> pathlib.Path:
+    """``executable``, checked to be the binary of one of ``roles`` in
+    Deadline ``deadline_version`` (in any prefix, clones included). Without
+    ``executable``, the binary of the first role in ``prefix``.
+
+    Raises:
+      ValueError: if ``executable`` is not one of those binaries
+    """
+    profile = get_profile(deadline_version)
+    roles = tuple(roles)
+
+    if executable is None:
+        return profile.binary(prefix, roles[0])
+
+    names = [profile.binaries[role] for role in roles]
+    if executable.name not in names:
+        raise ValueError(
+            f"{executable} is not a Deadline {deadline_version} "
+            f"{', '.join(names)} executable"
+        )
+    return executable
+
+
 # Todo
 #  - [ ] Forward all output (stdout, stderr; install, run) to console for docker logging
 
@@ -53,6 +173,9 @@ def empty_dir(
         path: pathlib.Path,
 ) -> pathlib.Path:
     for item in os.scandir(path):
+        # The prefix lock and upgrade staging dir belong to the wrapper
+        if is_reserved(item.name):
+            continue
         if item.is_dir():
             shutil.rmtree(item.path)
         else:
@@ -62,11 +185,16 @@ def empty_dir(
     return path
 
 
-def version_tuple(version: str) -> tuple:
-    return tuple(map(int, str(version).split(".")))
+def _validate_client_ports(
+        httpport: int,
+        webservice_httpport: int,
+):
+    assert 8000 <= httpport <= 65535
+    assert 8000 <= webservice_httpport <= 65535
+    assert httpport != webservice_httpport
 
 
-def install_repository(
+def _repository_cmd(
         installer: pathlib.Path,
         deadline_version: str,
         prefix: pathlib.Path,
@@ -74,84 +202,365 @@ def install_repository(
         dbhost: str,
         dbport: int,
         dbname: str,
-        force_reinstall: bool = False,
-):
+) -> List[str]:
 
-    assert installer.exists(), f"Installer {installer} does not exist"
-    assert 8000 <= dbport <= 65535
-    assert deadline_version in [
-        "10.2.1.1",
-        "10.4.0.10",
-    ]
+    profile = get_profile(deadline_version)
 
-    installer_log = pathlib.Path("/tmp/installbuilder_installer.log")
+    cmd = list()
 
-    if installer_log.exists():
-        shutil.rmtree(installer_log, ignore_errors=True)
-        _logger.debug("%s removed" % installer.as_posix())
+    cmd.append(installer.as_posix())
+    cmd.extend(profile.installer_args(
+        "repository",
+        prefix=prefix.as_posix(),
+        dbtype=dbtype,
+        dbhost=dbhost,
+        dbport=dbport,
+        dbname=dbname,
+    ))
 
-    if prefix.exists():
-        is_empty = not any(prefix.iterdir())
+    return cmd
 
-        if not is_empty:
-            if force_reinstall:
-                _logger.debug("Forcing reinstall...")
-                empty_dir(prefix)
 
-            else:
-                _logger.info("Re-using existing installation in %s", prefix.as_posix())
-                return
+def _client_cmd(
+        installer: pathlib.Path,
+        deadline_version: str,
+        prefix: pathlib.Path,
+        repositorydir: pathlib.Path,
+        httpport: int,
+        webservice_httpport: int,
+) -> List[str]:
+
+    profile = get_profile(deadline_version)
 
     cmd = list()
 
     cmd.append(installer.as_posix())
-    cmd.extend(["--mode", "unattended"])
-    cmd.extend(["--prefix", prefix.as_posix()])
-    cmd.extend(["--setpermissions", "true"])
-    cmd.extend(["--dbtype", dbtype])
-    cmd.extend(["--installmongodb", "false"])
-    cmd.extend(["--dbhost", dbhost])
-    cmd.extend(["--dbport", str(dbport)])
-    cmd.extend(["--dbname", dbname])
-    cmd.extend(["--dbauth", "false"])
-    cmd.extend(["--dbssl", "false"])
-    cmd.extend(["--installSecretsManagement", "false"])
-    cmd.extend(["--importrepositorysettings", "false"])
-
-    _logger.debug("cmd = %s" % " ".join(cmd))
-    print("cmd = %s" % " ".join(cmd))
-
-    proc = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        # cwd=prefix.as_posix(),
-    )
+    cmd.extend(profile.installer_args(
+        "client",
+        prefix=prefix.as_posix(),
+        # binariesonly=str(binariesonly).lower(),
+        repositorydir=repositorydir.as_posix(),
+        httpport=httpport,
+        webservice_httpport=webservice_httpport,
+    ))
 
-    # Todo:
-    #  - [ ] Something like:
-    #        if proc.returncode:
-    #            raise Exception("bla")
+    return cmd
 
-    handles = (proc.stdout, proc.stderr)
-    functions = (_logger.info, _logger.error)
-    iterate_fds_original(
-        handles=handles,
-        functions=functions,
-    )
 
-    print("here")
+def _run_installer(
+        cmd: List[str],
+        prefix: pathlib.Path,
+        timeout: Optional[float] = None,
+        silence_timeout: Optional[float] = None,
+) -> ChildResult:
+    """Run the installer and move its log into ``prefix``.
+
+    An installer exceeding ``timeout`` or silent for ``silence_timeout``
+    seconds (e.g. waiting on a prompt) is stopped with its process group.
+
+    Raises:
+      ChildProcessFailed: if the installer failed or was stopped, with the
+          tail of its output
+    """
+
+    INSTALLER_LOG.unlink(missing_ok=True)
 
-    # shutil.Error: Destination path '/opt/Thinkbox/DeadlineRepository10/installbuilder_installer.log' already exists
-    # If the filename is included in the destination path (relative or absolute) shutil will overwrite.
-    shutil.move(installer_log, prefix / "installbuilder_installer.log")
+    with phase("installer", prefix=prefix.as_posix()):
+        result = run_child(
+            cmd,
+            timeout=timeout,
+            silence_timeout=silence_timeout,
+            # cwd=prefix.as_posix(),
+            # Own process group, so a timeout stops the whole tree
+            start_new_session=timeout is not None or silence_timeout is not None,
+        )
+
+    if INSTALLER_LOG.exists():
+        result.log_path = INSTALLER_LOG
+        # A failed installer may not have created the prefix
+        if prefix.is_dir():
+            with phase("log_move"):
+                # shutil.Error: Destination path '/opt/Thinkbox/DeadlineRepository10/installbuilder_installer.log' already exists
+                # If the filename is included in the destination path (relative or absolute) shutil will overwrite.
+                shutil.move(INSTALLER_LOG, prefix / "installbuilder_installer.log")
+            result.log_path = prefix / "installbuilder_installer.log"
 
     # with open(prefix / "installbuilder_installer.log", "r") as fo:
     #     _logger.info(fo.read())
 
-    return installer_log
+    _logger.info(
+        "Installer exited with %s after %.1fs%s (%s lines stdout, %s lines stderr)",
+        result.returncode, result.duration,
+        f", stopped ({result.timed_out})" if result.timed_out else "",
+        result.stdout.lines, result.stderr.lines,
+    )
+
+    return check_result(result)
+
+
+def _upgrade_prefix(
+        prefix: pathlib.Path,
+        cmd_for_prefix: Callable[[pathlib.Path], List[str]],
+        preserve: Iterable[str] = (),
+        timeout: Optional[float] = None,
+        silence_timeout: Optional[float] = None,
+) -> TreeDiff:
+    """Install into a staging dir inside ``prefix`` and apply only the
+    differences to ``prefix``, see
+    :mod:`deadline_wrapper.deadline_wrapper_10_2.upgrade`.
+
+    A failed apply leaves ``prefix`` mixed; the exception marks the install
+    ``failed``, so the next install reinstalls.
+    """
+
+    staging = staging_dir(prefix)
+
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir(parents=True)
+
+    try:
+        _run_installer(
+            cmd_for_prefix(staging),
+            staging,
+            timeout=timeout,
+            silence_timeout=silence_timeout,
+        )
+
+        with phase("upgrade_diff"):
+            relocate(staging, staging, prefix)
+            diff = diff_trees(new=staging, live=prefix, preserve=preserve)
+
+        _logger.info(
+            "Upgrading %s: %s added, %s changed, %s removed, %s unchanged",
+            prefix.as_posix(),
+            len(diff.added), len(diff.changed), len(diff.removed), diff.unchanged,
+        )
+
+        with phase("upgrade_apply"):
+            try:
+                apply_diff(diff, new=staging, live=prefix)
+            except BaseException:
+                _logger.error(
+                    "Upgrade of %s failed half way, the next install reinstalls",
+                    prefix.as_posix(),
+                )
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return diff
+
+
+def _install(
+        installer: pathlib.Path,
+        prefix: pathlib.Path,
+        cmd_for_prefix: Callable[[pathlib.Path, pathlib.Path], List[str]],
+        force_reinstall: bool,
+        upgrade: bool,
+        preserve: Iterable[str] = (),
+        preflight: Optional[Callable[[], None]] = None,
+        lock_timeout: Optional[float] = None,
+        installer_cache: Optional[pathlib.Path] = None,
+        installer_sha256: Optional[str] = None,
+        limits: Optional[RunLimits] = None,
+):
+    """Install into ``prefix`` while holding its
+    :class:`~deadline_wrapper.deadline_wrapper_10_2.locking.PrefixLock`.
+
+    Concurrent wrappers wait for the lock and then reuse what the first one
+    installed. A prefix left half installed by a holder that died or failed
+    is reinstalled.
+
+    ``cmd_for_prefix`` is called with the prefix and the installer to run,
+    which is a local copy in ``installer_cache`` if given, see
+    :mod:`deadline_wrapper.deadline_wrapper_10_2.installer_cache`.
+
+    A failed or stopped installer is retried as ``limits`` allow, after
+    emptying the partial prefix. The returned :obj:`ChildResult` lists the
+    failed attempts.
+    """
+
+    limits = limits or RunLimits()
+    deadline = None
+    if limits.total_timeout is not None:
+        deadline = time.monotonic() + limits.total_timeout
+
+    def _remaining() -> Optional[float]:
+        """Seconds left of ``total_timeout``, raises once there are none."""
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            # An installer started with no time left would be killed at once
+            raise TimeoutError(
+                f"Install into {prefix} ran out of its "
+                f"{limits.total_timeout}s before the installer could start"
+            )
+        return remaining
+
+    with PrefixLock(prefix, timeout=lock_timeout) as lock:
+
+        is_empty = is_empty_dir(prefix)
+
+        if not is_empty and lock.interrupted and not force_reinstall:
+            _logger.warning(
+                "Install into %s by %s (pid %s) did not complete, reinstalling",
+                prefix.as_posix(),
+                lock.previous.get("host"), lock.previous.get("pid"),
+            )
+            force_reinstall, upgrade = True, False
+
+        if not is_empty and not (force_reinstall or upgrade):
+            _logger.info("Re-using existing installation in %s", prefix.as_posix())
+            lock.set_state("complete")
+            return
+
+        if preflight is not None:
+            preflight()
+
+        with phase("stage_installer"):
+            staged = stage_installer(
+                installer,
+                cache_dir=installer_cache,
+                sha256=installer_sha256,
+            )
+
+        # Waiting for the lock may have used it all, leave the prefix alone
+        _remaining()
+
+        lock.set_state("installing")
+
+        upgrading = not is_empty and upgrade
+
+        if not is_empty and not upgrading:
+            _logger.debug("Forcing reinstall...")
+            with phase("empty_dir"):
+                empty_dir(prefix)
+
+        failed = []
+
+        for attempt in range(limits.retries + 1):
+            timeout = limits.timeout
+            remaining = _remaining()
+            if remaining is not None:
+                timeout = remaining if timeout is None else min(timeout, remaining)
+
+            try:
+                if upgrading:
+                    result = _upgrade_prefix(
+                        prefix=prefix,
+                        cmd_for_prefix=lambda _prefix: cmd_for_prefix(_prefix, staged),
+                        preserve=preserve,
+                        timeout=timeout,
+                        silence_timeout=limits.silence_timeout,
+                    )
+                else:
+                    cmd = cmd_for_prefix(prefix, staged)
+
+                    _logger.info(f"{' '.join(cmd) = }")
+
+                    result = _run_installer(
+                        cmd,
+                        prefix,
+                        timeout=timeout,
+                        silence_timeout=limits.silence_timeout,
+                    )
+                break
+            except ChildProcessFailed as e:
+                e.result.attempts = list(failed)
+                failed.append(e.result)
+
+                wait = limits.wait(attempt)
+                out_of_time = (
+                    deadline is not None and time.monotonic() + wait >= deadline
+                )
+                if attempt >= limits.retries or out_of_time:
+                    raise
+
+                _logger.warning(
+                    "Installer attempt %s/%s failed, retrying in %.0fs",
+                    attempt + 1, limits.retries + 1, wait,
+                )
+                time.sleep(wait)
+
+                # Upgrades install into a fresh staging dir every time
+                if not upgrading and prefix.is_dir():
+                    with phase("empty_dir"):
+                        empty_dir(prefix)
+
+        if isinstance(result, ChildResult):
+            result.attempts = failed
+
+        lock.set_state("complete")
+
+        return result
+
+
+@traced("install_repository")
+def install_repository(
+        installer: pathlib.Path,
+        deadline_version: str,
+        prefix: pathlib.Path,
+        dbtype: str,
+        dbhost: str,
+        dbport: int,
+        dbname: str,
+        force_reinstall: bool = False,
+        db_preflight: str = "tcp",
+        wait_for_db_timeout: float = 0.0,
+        upgrade: bool = False,
+        lock_timeout: Optional[float] = None,
+        installer_cache: Optional[pathlib.Path] = None,
+        installer_sha256: Optional[str] = None,
+        limits: Optional[RunLimits] = None,
+):
+
+    assert installer.exists(), f"Installer {installer} does not exist"
+    assert 8000 <= dbport <= 65535
+    assert db_preflight in PREFLIGHT_MODES
+    assert not (force_reinstall and upgrade)
+    # Raises ValueError for unknown versions
+    get_profile(deadline_version)
+
+    def cmd_for_prefix(_prefix, _installer):
+        return _repository_cmd(
+            installer=_installer,
+            deadline_version=deadline_version,
+            prefix=_prefix,
+            dbtype=dbtype,
+            dbhost=dbhost,
+            dbport=dbport,
+            dbname=dbname,
+        )
+
+    def preflight():
+        if db_preflight != "none":
+            with phase("db_preflight", mode=db_preflight):
+                # Fail fast instead of waiting for the installer's internal timeout
+                wait_for_db(
+                    host=dbhost,
+                    port=dbport,
+                    hello=db_preflight == "hello",
+                    wait=wait_for_db_timeout,
+                )
+
+    return _install(
+        installer=installer,
+        prefix=prefix,
+        cmd_for_prefix=cmd_for_prefix,
+        force_reinstall=force_reinstall,
+        upgrade=upgrade,
+        preserve=REPOSITORY_PRESERVE,
+        preflight=preflight,
+        lock_timeout=lock_timeout,
+        installer_cache=installer_cache,
+        installer_sha256=installer_sha256,
+        limits=limits,
+    )
 
 
+@traced("install_client")
 def install_client(
         installer: pathlib.Path,
         deadline_version: str,
@@ -161,98 +570,167 @@ def install_client(
         webservice_httpport: int,
         # binariesonly: bool,
         force_reinstall: bool = False,
+        upgrade: bool = False,
+        lock_timeout: Optional[float] = None,
+        installer_cache: Optional[pathlib.Path] = None,
+        installer_sha256: Optional[str] = None,
+        limits: Optional[RunLimits] = None,
 ):
 
     assert installer.exists(), f"Installer {installer} does not exist"
-    assert 8000 <= httpport <= 65535
-    assert 8000 <= webservice_httpport <= 65535
-    assert httpport != webservice_httpport
-    assert deadline_version in [
-        "10.2.1.1",
-        "10.4.0.10",
-    ]
+    _validate_client_ports(httpport, webservice_httpport)
+    assert not (force_reinstall and upgrade)
+    # Raises ValueError for unknown versions
+    get_profile(deadline_version)
+
+    def cmd_for_prefix(_prefix, _installer):
+        return _client_cmd(
+            installer=_installer,
+            deadline_version=deadline_version,
+            prefix=_prefix,
+            repositorydir=repositorydir,
+            httpport=httpport,
+            webservice_httpport=webservice_httpport,
+        )
+
+    return _install(
+        installer=installer,
+        prefix=prefix,
+        cmd_for_prefix=cmd_for_prefix,
+        force_reinstall=force_reinstall,
+        upgrade=upgrade,
+        lock_timeout=lock_timeout,
+        installer_cache=installer_cache,
+        installer_sha256=installer_sha256,
+        limits=limits,
+    )
+
 
-    installer_log = pathlib.Path("/tmp/installbuilder_installer.log")
+def clone_client(
+        source: pathlib.Path,
+        targets: List[pathlib.Path],
+        httpports: List[int],
+        webservice_httpports: List[int],
+        force_reinstall: bool = False,
+        jobs: Optional[int] = None,
+        host_ini: pathlib.Path = HOST_INI,
+) -> List[CloneStats]:
+    """Clone an installed client prefix into several per-instance prefixes.
+
+    Immutable files are hardlinked and mutable files (ini, config, ...) are
+    copied with the per-instance ports rewritten, see
+    :mod:`deadline_wrapper.deadline_wrapper_10_2.clone`.
+
+    Every target gets its own ``<target>/deadline.ini``, built from
+    ``host_ini`` (or the ``deadline.ini`` of ``source`` if there is none on
+    this host) with its ports set. Start its daemons with
+    ``run --deadline-ini <target>/deadline.ini``.
+    """
 
-    if installer_log.exists():
-        shutil.rmtree(installer_log, ignore_errors=True)
+    assert source.exists(), f"Source {source} does not exist"
+    assert not is_empty_dir(source), f"Source {source} is empty"
+    assert len(targets) == len(httpports) == len(webservice_httpports), \
+        "Expected one --httpport and --webservice-httpport per target"
+    assert len(set(targets)) == len(targets), "Targets must be unique"
+    assert source not in targets
 
-    if prefix.exists():
-        is_empty = not any(prefix.iterdir())
+    for httpport, webservice_httpport in zip(httpports, webservice_httpports):
+        _validate_client_ports(httpport, webservice_httpport)
 
-        if not is_empty:
+    all_ports = [*httpports, *webservice_httpports]
+    assert len(set(all_ports)) == len(all_ports), \
+        "Ports must be unique across all cloned instances"
+
+    def _clone(target, httpport, webservice_httpport):
+        if not is_empty_dir(target):
             if force_reinstall:
-                empty_dir(prefix)
+                _logger.debug("Forcing reinstall of %s...", target.as_posix())
+                empty_dir(target)
             else:
-                _logger.info("Re-using existing installation in %s", prefix.as_posix())
-                return
+                _logger.info("Re-using existing installation in %s", target.as_posix())
+                return CloneStats(target=target)
+
+        ports = {
+            "httpport": httpport,
+            "webservice_httpport": webservice_httpport,
+        }
+
+        stats = clone_tree(
+            source=source,
+            target=target,
+            rewrite=lambda rel, data: rewrite_ini_ports(
+                replace_path(data, source, target), ports
+            ),
+        )
 
-    cmd = list()
+        template = host_ini if host_ini.exists() else source / INSTANCE_INI
+        data = template.read_bytes() if template.exists() else b""
+        atomic_write_bytes(
+            target / INSTANCE_INI,
+            instance_ini(replace_path(data, source, target), ports),
+        )
 
-    cmd.append(installer.as_posix())
-    cmd.extend(["--mode", "unattended"])
-    cmd.extend(["--prefix", prefix.as_posix()])
-    # cmd.extend(["--binariesonly", str(binariesonly).lower()])
-    cmd.extend(["--setpermissionsclient", "true"])
-    cmd.extend(["--repositorydir", repositorydir.as_posix()])
-    cmd.extend(["--launcherdaemon", "false"])
-    cmd.extend(["--httpport", str(httpport)])
-    cmd.extend(["--enabletls", "false"])
-    cmd.extend(["--proxyalwaysrunning", "false"])
-    cmd.extend(["--blockautoupdateoverride", "NotBlocked"])
-    cmd.extend(["--webserviceuser", "root"])
-    cmd.extend(["--webservice_httpport", str(webservice_httpport)])
-    cmd.extend(["--webservice_enabletls", "false"])
-
-    if (10, 4) <= version_tuple(deadline_version) <= (10, 5):
-        # This is new in 10.4
-        cmd.extend(["--remotecontrol", "NotBlocked"])
-
-    _logger.info(f"{' '.join(cmd) = }")
-
-    proc = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        # cwd=prefix.as_posix(),
-    )
-
-    handles = (proc.stdout, proc.stderr)
-    functions = (_logger.info, _logger.error)
-    iterate_fds_original(
-        handles=handles,
-        functions=functions,
-    )
+        return stats
 
-    # for _label, _function in zip(labels, functions):
-    #     if bool(logs[_label]):
-    #         _function(logs[_label].decode("utf-8"))
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=jobs or len(targets),
+    ) as executor:
+        results = list(executor.map(_clone, targets, httpports, webservice_httpports))
 
-    # stdout, stderr = proc.communicate()
-    #
-    # _logger.info(stdout.decode("utf-8"))
-    # _logger.error(stderr.decode("utf-8"))
+    for stats in results:
+        _logger.info(
+            "%s: %s linked, %s copied",
+            stats.target.as_posix(), stats.linked, stats.copied,
+        )
 
-    # shutil.Error: Destination path '/opt/Thinkbox/DeadlineRepository10/installbuilder_installer.log' already exists
-    # If the filename is included in the destination path (relative or absolute) shutil will overwrite.
-    shutil.move(installer_log, prefix / "installbuilder_installer.log")
+    return results
 
-    # with open(prefix / "installbuilder_installer.log", "r") as fo:
-    #     _logger.info(fo.read())
 
-    return installer_log
+def sync_custom(
+        source: pathlib.Path,
+        repositorydir: pathlib.Path,
+        delete: bool = False,
+        index: Optional[pathlib.Path] = None,
+        jobs: Optional[int] = None,
+) -> SyncStats:
+    """Incrementally sync custom plugins, events and scripts into
+    ``<repositorydir>/custom``.
+
+    ``source`` mirrors the layout of ``custom/`` (``plugins/``, ``events/``,
+    ``scripts/``, ...).
+    """
+
+    assert source.is_dir(), f"Source {source} does not exist"
+    assert repositorydir.is_dir(), f"Repository {repositorydir} does not exist"
 
+    stats = sync_tree(
+        source=source,
+        destination=repositorydir / "custom",
+        index_path=index,
+        delete=delete,
+        jobs=jobs,
+    )
 
-def runner(
+    _logger.info(
+        "Synced %s -> %s: %s scanned, %s hashed, %s copied, %s deleted in %.3fs",
+        source.as_posix(), (repositorydir / "custom").as_posix(),
+        stats.scanned, stats.hashed, stats.copied, stats.deleted, stats.duration,
+    )
+
+    return stats
+
+
+def _runner_cmd(
         executable: pathlib.Path,
         nogui: bool,
         nosplash: bool,
-):
+        deadline_ini: Optional[pathlib.Path] = None,
+) -> List[str]:
 
     assert executable.exists(), f"Executable {executable} does not exist"
     # Todo:
     #  - [ ] deadline.ini to .env
-    deadline_ini = pathlib.Path("/var/lib/Thinkbox/Deadline10/deadline.ini")
+    deadline_ini = deadline_ini or HOST_INI
     assert deadline_ini.exists(), f"{deadline_ini} does not exist"
 
     cmd = list()
@@ -262,19 +740,144 @@ def runner(
     if nosplash:
         cmd.append("-nosplash")
 
-    proc = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        # cwd=prefix.as_posix(),
-    )
+    return cmd
+
+
+def _runner_env(
+        deadline_ini: Optional[pathlib.Path] = None,
+) -> Optional[dict]:
+    """Environment for a daemon using ``deadline_ini`` instead of the
+    host's, e.g. the one of a clone; ``None`` inherits ours."""
+    if deadline_ini is None:
+        return None
+    return {**os.environ, CONFIG_ENV: deadline_ini.absolute().as_posix()}
 
-    handles = (proc.stdout, proc.stderr)
-    functions = (_logger.info, _logger.error)
-    iterate_fds_original(
-        handles=handles,
-        functions=functions,
+
+@traced("runner")
+def runner(
+        executable: pathlib.Path,
+        nogui: bool,
+        nosplash: bool,
+        tail_logs: Optional[pathlib.Path] = None,
+        watchdog: Optional[WatchdogConfig] = None,
+        state_file: Optional[pathlib.Path] = None,
+        ready_pattern: Optional[str] = None,
+        deadline_ini: Optional[pathlib.Path] = None,
+):
+    """Run a Deadline executable and forward its output to the log.
+
+    With ``deadline_ini``, the executable uses that ``deadline.ini`` instead
+    of the host's, e.g. the one ``clone-client`` wrote for an instance.
+
+    With ``tail_logs``, the log files the daemon writes to that directory
+    (usually :data:`~deadline_wrapper.deadline_wrapper_10_2.tail.DEFAULT_LOG_DIR`)
+    are forwarded as well, tagged with their file name.
+
+    With ``watchdog``, a child that stops producing output and CPU load
+    (see :mod:`deadline_wrapper.deadline_wrapper_10_2.watchdog`) is stopped
+    and restarted up to ``watchdog.max_restarts`` times.
+
+    With ``state_file``, the child's pid, status, last output time and
+    readiness (a line matching ``ready_pattern``, if given) are kept in that
+    file for ``deadline-wrapper-health``, see
+    :mod:`deadline_wrapper.deadline_wrapper_10_2.health`.
+    """
+
+    cmd = _runner_cmd(
+        executable=executable,
+        nogui=nogui,
+        nosplash=nosplash,
+        deadline_ini=deadline_ini,
     )
+    env = _runner_env(deadline_ini)
+
+    current = None
+    tail = collections.deque(maxlen=watchdog.tail_lines if watchdog else 1)
+
+    state = None
+    if state_file is not None:
+        state = RunnerState(state_file, ready_pattern=ready_pattern)
+
+    def _on_line(line):
+        if current is not None:
+            current.touch(line)
+        if state is not None:
+            state.output(line)
+
+    def _emit(source, line):
+        tagged = f"[{source}] {line}"
+        if current is not None:
+            current.touch(tagged)
+        if state is not None:
+            # Workers log mostly to files, so this is their liveness (and
+            # where the ready line shows up)
+            state.output(tagged)
+        _logger.info("[%s] %s", source, line)
+
+    tailer = None
+    if tail_logs is not None:
+        tailer = LogTailer(
+            directory=tail_logs,
+            emit=_emit,
+        )
+        tailer.start()
+
+    restarts = 0
+
+    try:
+        while True:
+            if state is not None:
+                state.update(
+                    status="restarting" if restarts else "starting",
+                    restarts=restarts,
+                )
+
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=env,
+                # cwd=prefix.as_posix(),
+                # Own process group, so the watchdog can stop the whole tree
+                start_new_session=watchdog is not None,
+            )
+
+            if state is not None:
+                state.update(status="running", child_pid=proc.pid)
+
+            if watchdog is not None:
+                current = Watchdog(proc=proc, config=watchdog, tail=tail)
+                current.start()
+
+            with phase("child", pid=proc.pid, restart=restarts):
+                result = pump_output(proc, on_line=_on_line)
+            _logger.info("%s exited with %s", cmd, result.returncode)
+
+            if state is not None:
+                state.update(status="exited", returncode=result.returncode)
+
+            if current is None:
+                break
+
+            current.stop()
+            if not current.fired:
+                break
+            if watchdog.max_restarts is not None and restarts >= watchdog.max_restarts:
+                _logger.error("Giving up after %s restarts", restarts)
+                break
+
+            restarts += 1
+            _logger.warning(
+                "Restarting %s (%s/%s)",
+                cmd, restarts, watchdog.max_restarts or "unlimited",
+            )
+    finally:
+        if current is not None:
+            current.stop()
+        if tailer is not None:
+            tailer.stop(timeout=5.0)
+
+    return result
 
     # for _label, _function in zip(labels, functions):
     #     if bool(logs[_label]):
@@ -286,20 +889,266 @@ def runner(
     # _logger.error(stderr.decode("utf-8"))
 
 
+def autoscale(
+        executable: pathlib.Path,
+        nogui: bool,
+        nosplash: bool,
+        demand: str,
+        config: AutoscaleConfig,
+        instance_prefix: str = "autoscale",
+        drain: str = "shutdown",
+):
+    """Run a demand driven number of worker instances until SIGTERM or
+    SIGINT, see :mod:`deadline_wrapper.deadline_wrapper_10_2.autoscale`.
+
+    ``demand`` is a file or ``http(s)://`` URL reporting pending tasks.
+    With ``drain="shutdown"``, an instance is stopped with
+    ``<executable> -shutdown -name <instance>``, with ``"signal"`` by
+    SIGTERM.
+    """
+
+    assert drain in ("shutdown", "signal")
+
+    cmd = _runner_cmd(
+        executable=executable,
+        nogui=nogui,
+        nosplash=nosplash,
+    )
+
+    def drain_cmd(name):
+        return [executable.as_posix(), "-shutdown", "-name", name]
+
+    scaler = Autoscaler(
+        cmd=cmd,
+        demand=demand_source(demand),
+        config=config,
+        instance_prefix=instance_prefix,
+        drain_cmd=drain_cmd if drain == "shutdown" else None,
+    )
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: scaler.stop())
+
+    try:
+        scaler.run()
+    except KeyboardInterrupt:
+        _logger.info("Interrupted, draining all instances")
+        scaler.shutdown()
+
+
+# Sub commands that can be dispatched from JSON fields
+SERVICE_OPERATIONS = (
+    "install-repository",
+    "install-client",
+    "clone-client",
+    "sync-custom",
+)
+
+BATCH_OPERATIONS = (
+    *SERVICE_OPERATIONS,
+    "run",
+)
+
+# The run fields serve honours: its children are plain processes, without
+# the watchdog, state file and log tailing of runner()
+SERVE_RUN_FIELDS = frozenset((
+    "executable",
+    "nogui",
+    "nosplash",
+    "deadline_version",
+    "deadline_ini",
+))
+
+# They share INSTALLER_LOG
+EXCLUSIVE_OPERATIONS = (
+    "install-repository",
+    "install-client",
+)
+
+
+def serve(
+        socket_path: pathlib.Path = DEFAULT_SOCKET,
+):
+    """Keep one wrapper process resident and accept JSON commands on
+    ``socket_path``, see :mod:`deadline_wrapper.deadline_wrapper_10_2.server`.
+
+    Commands are the sub commands (with the same fields as their command
+    line options, validated by :func:`args_from_fields`) plus ``stop``,
+    ``status`` and ``metrics``. ``run`` starts the executable in the
+    background and returns its id for ``stop`` and ``status``; it takes
+    only the :data:`SERVE_RUN_FIELDS` (and ``name``).
+    """
+
+    def _operation(sub_command):
+        def _handler(fields):
+            return dispatch(args_from_fields(sub_command, fields))
+        return _handler
+
+    def _run(fields):
+        fields = dict(fields)
+        name = fields.pop("name", None)
+        unsupported = sorted(
+            key for key in fields if key.replace("-", "_") not in SERVE_RUN_FIELDS
+        )
+        if unsupported:
+            raise ValueError(
+                f"serve does not support {', '.join(unsupported)} for run, "
+                f"use the run sub command"
+            )
+        args = args_from_fields("run", fields)
+        return service.start_child(
+            _runner_cmd(
+                executable=resolve_executable(args.deadline_version, args.executable),
+                nogui=args.nogui,
+                nosplash=args.nosplash,
+                deadline_ini=args.deadline_ini,
+            ),
+            name=name,
+            env=_runner_env(args.deadline_ini),
+        )
+
+    service = Service(
+        handlers={
+            **{
+                sub_command: _operation(sub_command)
+                for sub_command in SERVICE_OPERATIONS
+            },
+            "run": _run,
+        },
+        exclusive=EXCLUSIVE_OPERATIONS,
+    )
+
+    server_serve(socket_path, service)
+
+
+def batch(
+        source: str = "-",
+        results: str = "-",
+        jobs: Optional[int] = None,
+) -> int:
+    """Run a JSON-lines stream of operations in this process, see
+    :mod:`deadline_wrapper.deadline_wrapper_10_2.batch`.
+
+    The fields of every operation are validated by :func:`args_from_fields`,
+    i.e. exactly like the command line options of its sub command.
+
+    Args:
+      source (str): file to read operations from, ``-`` for stdin
+      results (str): file to write results to, ``-`` for stdout
+      jobs (int): maximum number of independent operations in parallel
+
+    Returns:
+      int: number of operations that did not succeed
+    """
+
+    def _validate(sub_command, fields):
+        if sub_command not in BATCH_OPERATIONS:
+            raise ValueError(f"Unsupported sub_command {sub_command!r}")
+        return args_from_fields(sub_command, fields)
+
+    with contextlib.ExitStack() as stack:
+        lines = sys.stdin
+        if source != "-":
+            lines = stack.enter_context(open(source, "r"))
+        output = sys.stdout
+        if results != "-":
+            output = stack.enter_context(open(results, "w"))
+
+        return run_batch(
+            lines=lines,
+            validate=_validate,
+            execute=dispatch,
+            output=output,
+            jobs=jobs,
+            exclusive=EXCLUSIVE_OPERATIONS,
+        )
+
+
 # ---- CLI ----
 
 
-def parse_args(args):
-    """Parse command line parameters
+def _add_installer_arguments(subparser):
+    """Options shared by the install sub commands"""
+
+    subparser.add_argument(
+        "--installer-cache",
+        dest="installer_cache",
+        type=pathlib.Path,
+        nargs="?",
+        const=default_cache_dir(),
+        default=None,
+        metavar="DIR",
+        help="run a local copy of the installer, cached in DIR "
+             f"({default_cache_dir().as_posix()} if no value is given)",
+    )
+
+    subparser.add_argument(
+        "--installer-sha256",
+        dest="installer_sha256",
+        type=str,
+        default=None,
+        metavar="HEX",
+        help="verify the installer (or its cached copy) against this sha256",
+    )
+
+    subparser.add_argument(
+        "--installer-timeout",
+        dest="installer_timeout",
+        type=float,
+        default=RunLimits.timeout,
+        metavar="SECONDS",
+        help="stop an installer attempt after SECONDS",
+    )
+
+    subparser.add_argument(
+        "--installer-silence-timeout",
+        dest="installer_silence_timeout",
+        type=float,
+        default=RunLimits.silence_timeout,
+        metavar="SECONDS",
+        help="stop an installer attempt without output for SECONDS, "
+             "e.g. one waiting on a prompt",
+    )
+
+    subparser.add_argument(
+        "--install-timeout",
+        dest="install_timeout",
+        type=float,
+        default=RunLimits.total_timeout,
+        metavar="SECONDS",
+        help="give up after SECONDS for all attempts together",
+    )
+
+    subparser.add_argument(
+        "--installer-retries",
+        dest="installer_retries",
+        type=int,
+        default=RunLimits.retries,
+        help="retry a failed or stopped installer this many times, "
+             "emptying the prefix in between",
+    )
+
+    subparser.add_argument(
+        "--installer-retry-backoff",
+        dest="installer_retry_backoff",
+        type=float,
+        default=RunLimits.backoff,
+        metavar="SECONDS",
+        help="wait before the first retry, doubled for every further one",
+    )
+
+
+def build_parser(parser_class=argparse.ArgumentParser):
+    """Build the command line parser
 
     Args:
-      args (List[str]): command line parameters as list of strings
-          (for example  ``["--help"]``).
+      parser_class (type): :class:`argparse.ArgumentParser` (sub)class,
+          also used for the sub command parsers
 
     Returns:
-      :obj:`argparse.Namespace`: command line parameters namespace
+      :obj:`argparse.ArgumentParser`: command line parser
     """
-    parser = argparse.ArgumentParser(description="An AWS/Thinkbox Deadline Wrapper.")
+    parser = parser_class(description="An AWS/Thinkbox Deadline Wrapper.")
 
     parser.add_argument(
         "--version",
@@ -330,6 +1179,42 @@ def parse_args(args):
         help="force deletion and then install",
     )
 
+    parser.add_argument(
+        "--trace",
+        dest="trace",
+        type=pathlib.Path,
+        default=None,
+        metavar="FILE",
+        help="write the timing of all phases to FILE as Chrome trace JSON",
+    )
+
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        type=pathlib.Path,
+        default=None,
+        metavar="FILE",
+        help="run under cProfile and dump the stats to FILE",
+    )
+
+    parser.add_argument(
+        "--lock-timeout",
+        dest="lock_timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="give up if another wrapper holds the prefix lock for longer "
+             "than SECONDS (default: wait forever)",
+    )
+
+    parser.add_argument(
+        "--upgrade",
+        dest="upgrade",
+        action="store_true",
+        help="upgrade an existing installation in place: install into a "
+             "staging dir and apply only the changed files",
+    )
+
     subparsers = parser.add_subparsers(
         dest="sub_command",
     )
@@ -350,6 +1235,8 @@ def parse_args(args):
         help="Deadline Installer",
     )
 
+    _add_installer_arguments(subparser_repository)
+
     subparser_repository.add_argument(
         "--deadline-version",
         dest="deadline_version",
@@ -357,6 +1244,7 @@ def parse_args(args):
         # Todo:
         #  - [ ] os.environ
         default="10.2.1.1",
+        choices=available_versions(),
         help="Deadline version",
     )
 
@@ -414,6 +1302,30 @@ def parse_args(args):
         help="db name",
     )
 
+    subparser_repository.add_argument(
+        "--db-preflight",
+        dest="db_preflight",
+        required=False,
+        type=str,
+        default="tcp",
+        choices=PREFLIGHT_MODES,
+        help="check that the db is reachable before running the installer "
+             "(tcp: connect only, hello: connect and send a MongoDB hello)",
+    )
+
+    subparser_repository.add_argument(
+        "--wait-for-db",
+        dest="wait_for_db",
+        required=False,
+        type=float,
+        nargs="?",
+        const=60.0,
+        default=0.0,
+        metavar="SECONDS",
+        help="keep retrying the db pre-flight for up to SECONDS "
+             "(60 if no value is given)",
+    )
+
     ## Client
 
     subparser_client = subparsers.add_parser(
@@ -428,6 +1340,8 @@ def parse_args(args):
         help="Deadline Installer",
     )
 
+    _add_installer_arguments(subparser_client)
+
     subparser_client.add_argument(
         "--deadline-version",
         dest="deadline_version",
@@ -435,6 +1349,7 @@ def parse_args(args):
         # Todo:
         #  - [ ] os.environ
         default="10.2.1.1",
+        choices=available_versions(),
         help="Deadline version",
     )
 
@@ -495,46 +1410,152 @@ def parse_args(args):
         help="webservice http port",
     )
 
-    # Runner
+    ## Clone Client
 
-    subparser_run = subparsers.add_parser(
-        "run",
+    subparser_clone_client = subparsers.add_parser(
+        "clone-client",
     )
 
-    subparser_run.add_argument(
-        "--executable",
-        dest="executable",
+    subparser_clone_client.add_argument(
+        "--from",
+        dest="source",
         required=True,
         type=pathlib.Path,
-        # Todo:
-        #  - [ ] os.environ
-        choices=[
-            pathlib.Path("/opt/Thinkbox/Deadline10/bin/deadlinercs"),
-            pathlib.Path("/opt/Thinkbox/Deadline10/bin/deadlinewebservice"),
-            pathlib.Path("/opt/Thinkbox/Deadline10/bin/deadlinepulse"),
-            pathlib.Path("/opt/Thinkbox/Deadline10/bin/deadlineworker"),
-        ],
-        default=None,
-        help="run executable",
+        help="installed client prefix to clone",
     )
 
-    """
-    "--force-reinstall",
-    dest="force_reinstall",
-    action="store_true",
-    help="force deletion and then install",
-    """
-
-    subparser_run.add_argument(
-        "--nogui",
-        dest="nogui",
-        required=False,
-        action="store_true",
-        # nargs="+",
-        help="--nogui",
+    subparser_clone_client.add_argument(
+        "--to",
+        dest="targets",
+        required=True,
+        nargs="+",
+        type=pathlib.Path,
+        help="prefixes to clone into",
     )
 
-    subparser_run.add_argument(
+    subparser_clone_client.add_argument(
+        "--httpport",
+        dest="httpports",
+        required=True,
+        nargs="+",
+        type=int,
+        help="rcs http port, one per target",
+    )
+
+    subparser_clone_client.add_argument(
+        "--webservice-httpport",
+        dest="webservice_httpports",
+        required=True,
+        nargs="+",
+        type=int,
+        help="webservice http port, one per target",
+    )
+
+    subparser_clone_client.add_argument(
+        "--jobs",
+        dest="jobs",
+        required=False,
+        type=int,
+        default=None,
+        help="number of targets to clone in parallel (default: all)",
+    )
+
+    ## Sync Custom
+
+    subparser_sync_custom = subparsers.add_parser(
+        "sync-custom",
+    )
+
+    subparser_sync_custom.add_argument(
+        "--source",
+        dest="source",
+        required=True,
+        type=pathlib.Path,
+        help="local directory laid out like the repository's custom/ tree",
+    )
+
+    subparser_sync_custom.add_argument(
+        "--repositorydir",
+        dest="repositorydir",
+        required=True,
+        type=pathlib.Path,
+        # Todo:
+        #  - [ ] os.environ
+        default=pathlib.Path("/opt/Thinkbox/DeadlineRepository10"),
+        help="repository directory",
+    )
+
+    subparser_sync_custom.add_argument(
+        "--delete",
+        dest="delete",
+        required=False,
+        action="store_true",
+        help="delete previously synced files that no longer exist in --source",
+    )
+
+    subparser_sync_custom.add_argument(
+        "--index",
+        dest="index",
+        required=False,
+        type=pathlib.Path,
+        default=None,
+        help="sync index file (default: in $XDG_CACHE_HOME/deadline-wrapper/sync)",
+    )
+
+    subparser_sync_custom.add_argument(
+        "--jobs",
+        dest="jobs",
+        required=False,
+        type=int,
+        default=None,
+        help="number of threads to hash and copy with",
+    )
+
+    # Runner
+
+    subparser_run = subparsers.add_parser(
+        "run",
+    )
+
+    subparser_run.add_argument(
+        "--executable",
+        dest="executable",
+        required=True,
+        type=pathlib.Path,
+        # Todo:
+        #  - [ ] os.environ
+        default=None,
+        help="run executable: the rcs, webservice, pulse or worker of "
+             "--deadline-version, e.g. "
+             f"{(CLIENT_PREFIX / 'bin' / 'deadlineworker').as_posix()}",
+    )
+
+    subparser_run.add_argument(
+        "--deadline-version",
+        dest="deadline_version",
+        required=False,
+        default="10.2.1.1",
+        choices=available_versions(),
+        help="Deadline version of --executable",
+    )
+
+    """
+    "--force-reinstall",
+    dest="force_reinstall",
+    action="store_true",
+    help="force deletion and then install",
+    """
+
+    subparser_run.add_argument(
+        "--nogui",
+        dest="nogui",
+        required=False,
+        action="store_true",
+        # nargs="+",
+        help="--nogui",
+    )
+
+    subparser_run.add_argument(
         "--nosplash",
         dest="nosplash",
         required=False,
@@ -543,14 +1564,426 @@ def parse_args(args):
         help="extra arguments",
     )
 
-    return parser.parse_args(args)
+    subparser_run.add_argument(
+        "--watchdog-silence",
+        dest="watchdog_silence",
+        required=False,
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="enable the hang watchdog: restart the executable after SECONDS "
+             "without output, CPU use or (with --watchdog-port) open port",
+    )
+
+    subparser_run.add_argument(
+        "--watchdog-cpu-threshold",
+        dest="watchdog_cpu_threshold",
+        required=False,
+        type=float,
+        default=WatchdogConfig.cpu_threshold,
+        help="CPU use as fraction of one core above which the executable "
+             "counts as busy",
+    )
+
+    subparser_run.add_argument(
+        "--watchdog-port",
+        dest="watchdog_port",
+        required=False,
+        type=int,
+        default=None,
+        help="local port that counts as sign of life while it accepts connections",
+    )
+
+    subparser_run.add_argument(
+        "--watchdog-interval",
+        dest="watchdog_interval",
+        required=False,
+        type=float,
+        default=WatchdogConfig.interval,
+        help="seconds between watchdog checks",
+    )
+
+    subparser_run.add_argument(
+        "--watchdog-term-timeout",
+        dest="watchdog_term_timeout",
+        required=False,
+        type=float,
+        default=WatchdogConfig.term_timeout,
+        help="seconds between SIGTERM and SIGKILL",
+    )
+
+    subparser_run.add_argument(
+        "--watchdog-max-restarts",
+        dest="watchdog_max_restarts",
+        required=False,
+        type=int,
+        default=WatchdogConfig.max_restarts,
+        help="restarts before giving up, -1 for unlimited",
+    )
+
+    subparser_run.add_argument(
+        "--watchdog-incidents",
+        dest="watchdog_incidents",
+        required=False,
+        type=pathlib.Path,
+        default=None,
+        help="JSON lines file to record hang incidents in",
+    )
+
+    subparser_run.add_argument(
+        "--state-file",
+        dest="state_file",
+        required=False,
+        type=pathlib.Path,
+        nargs="?",
+        const=DEFAULT_STATE_FILE,
+        default=None,
+        metavar="FILE",
+        help="keep the state of the executable in FILE for deadline-wrapper-health "
+             f"(default: {DEFAULT_STATE_FILE.as_posix()})",
+    )
+
+    subparser_run.add_argument(
+        "--ready-pattern",
+        dest="ready_pattern",
+        required=False,
+        type=str,
+        default=None,
+        metavar="REGEX",
+        help="the executable is ready once a line of its output matches REGEX "
+             "(default: as soon as it runs)",
+    )
+
+    subparser_run.add_argument(
+        "--deadline-ini",
+        dest="deadline_ini",
+        required=False,
+        type=pathlib.Path,
+        default=None,
+        metavar="FILE",
+        help="use FILE instead of the host's deadline.ini, e.g. the one "
+             "clone-client wrote into a clone "
+             f"(default: {HOST_INI.as_posix()})",
+    )
+
+    subparser_run.add_argument(
+        "--tail-logs",
+        dest="tail_logs",
+        required=False,
+        type=pathlib.Path,
+        nargs="?",
+        const=DEFAULT_LOG_DIR,
+        default=None,
+        metavar="DIR",
+        help="also forward the log files written to DIR "
+             f"(default: {DEFAULT_LOG_DIR.as_posix()})",
+    )
 
+    # Autoscaler
 
-def setup_logging(loglevel):
+    subparser_autoscale = subparsers.add_parser(
+        "autoscale",
+    )
+
+    subparser_autoscale.add_argument(
+        "--executable",
+        dest="executable",
+        required=False,
+        type=pathlib.Path,
+        # Todo:
+        #  - [ ] os.environ
+        default=None,
+        help="worker executable "
+             f"(default: the worker of --deadline-version in {CLIENT_PREFIX})",
+    )
+
+    subparser_autoscale.add_argument(
+        "--deadline-version",
+        dest="deadline_version",
+        required=False,
+        default="10.2.1.1",
+        choices=available_versions(),
+        help="Deadline version of --executable",
+    )
+
+    subparser_autoscale.add_argument(
+        "--nogui",
+        dest="nogui",
+        required=False,
+        action="store_true",
+        help="--nogui",
+    )
+
+    subparser_autoscale.add_argument(
+        "--nosplash",
+        dest="nosplash",
+        required=False,
+        action="store_true",
+        help="extra arguments",
+    )
+
+    subparser_autoscale.add_argument(
+        "--demand",
+        dest="demand",
+        required=True,
+        type=str,
+        metavar="FILE_OR_URL",
+        help="file or http(s) URL reporting the number of pending tasks, "
+             'as a plain number or {"pending": N}',
+    )
+
+    subparser_autoscale.add_argument(
+        "--min-workers",
+        dest="min_workers",
+        required=False,
+        type=int,
+        default=AutoscaleConfig.min_workers,
+        help="instances to keep running without demand",
+    )
+
+    subparser_autoscale.add_argument(
+        "--max-workers",
+        dest="max_workers",
+        required=False,
+        type=int,
+        default=AutoscaleConfig.max_workers,
+        help="most instances to run",
+    )
+
+    subparser_autoscale.add_argument(
+        "--tasks-per-worker",
+        dest="tasks_per_worker",
+        required=False,
+        type=int,
+        default=AutoscaleConfig.tasks_per_worker,
+        help="pending tasks per instance",
+    )
+
+    subparser_autoscale.add_argument(
+        "--max-load-per-cpu",
+        dest="max_load_per_cpu",
+        required=False,
+        type=float,
+        default=AutoscaleConfig.max_load_per_cpu,
+        help="do not scale up above this 1 minute load average per CPU",
+    )
+
+    subparser_autoscale.add_argument(
+        "--min-mem-available",
+        dest="min_mem_available",
+        required=False,
+        type=float,
+        default=AutoscaleConfig.min_mem_available,
+        help="drain an instance below this fraction of available memory",
+    )
+
+    subparser_autoscale.add_argument(
+        "--interval",
+        dest="interval",
+        required=False,
+        type=float,
+        default=AutoscaleConfig.interval,
+        help="seconds between checks",
+    )
+
+    subparser_autoscale.add_argument(
+        "--scale-up-after",
+        dest="scale_up_after",
+        required=False,
+        type=int,
+        default=AutoscaleConfig.scale_up_after,
+        help="consecutive checks with more demand before scaling up",
+    )
+
+    subparser_autoscale.add_argument(
+        "--scale-down-after",
+        dest="scale_down_after",
+        required=False,
+        type=int,
+        default=AutoscaleConfig.scale_down_after,
+        help="consecutive checks with less demand before scaling down",
+    )
+
+    subparser_autoscale.add_argument(
+        "--cooldown",
+        dest="cooldown",
+        required=False,
+        type=float,
+        default=AutoscaleConfig.cooldown,
+        help="minimum seconds between two changes",
+    )
+
+    subparser_autoscale.add_argument(
+        "--drain-timeout",
+        dest="drain_timeout",
+        required=False,
+        type=float,
+        default=AutoscaleConfig.drain_timeout,
+        help="seconds a draining instance gets before it is stopped",
+    )
+
+    subparser_autoscale.add_argument(
+        "--drain",
+        dest="drain",
+        required=False,
+        type=str,
+        default="shutdown",
+        choices=["shutdown", "signal"],
+        help="drain with '<executable> -shutdown -name <instance>' or SIGTERM",
+    )
+
+    subparser_autoscale.add_argument(
+        "--instance-prefix",
+        dest="instance_prefix",
+        required=False,
+        type=str,
+        default="autoscale",
+        help="instances are named <prefix>-01, <prefix>-02, ...",
+    )
+
+    # Server
+
+    subparser_serve = subparsers.add_parser(
+        "serve",
+    )
+
+    subparser_serve.add_argument(
+        "--socket",
+        dest="socket",
+        required=False,
+        type=pathlib.Path,
+        default=DEFAULT_SOCKET,
+        help="unix domain socket to listen on",
+    )
+
+    # Batch
+
+    subparser_batch = subparsers.add_parser(
+        "batch",
+    )
+
+    subparser_batch.add_argument(
+        "--input",
+        dest="input",
+        required=False,
+        type=str,
+        default="-",
+        help="JSON lines file with one operation per line (default: stdin)",
+    )
+
+    subparser_batch.add_argument(
+        "--results",
+        dest="results",
+        required=False,
+        type=str,
+        default="-",
+        help="file to write one JSON result per operation to (default: stdout)",
+    )
+
+    subparser_batch.add_argument(
+        "--jobs",
+        dest="jobs",
+        required=False,
+        type=int,
+        default=None,
+        help="maximum number of independent operations to run in parallel",
+    )
+
+    return parser
+
+
+def parse_args(args):
+    """Parse command line parameters
+
+    Args:
+      args (List[str]): command line parameters as list of strings
+          (for example  ``["--help"]``).
+
+    Returns:
+      :obj:`argparse.Namespace`: command line parameters namespace
+    """
+    return build_parser().parse_args(args)
+
+
+class _RaisingArgumentParser(argparse.ArgumentParser):
+    """Parses requests (batch, serve): never prints and never exits."""
+
+    def error(self, message):
+        raise ValueError(f"{self.prog}: {message}")
+
+    def exit(self, status=0, message=None):
+        # Reached through --help and --version
+        raise ValueError(f"{self.prog}: {message or 'option not supported here'}")
+
+    def _print_message(self, message, file=None):
+        pass
+
+
+# Options that act on the whole process, not on one request
+_PROCESS_FIELDS = frozenset(("help", "version", "trace", "profile"))
+
+
+@functools.lru_cache(maxsize=None)
+def _fields_parser():
+    parser = build_parser(parser_class=_RaisingArgumentParser)
+    global_options = frozenset(
+        option for action in parser._actions for option in action.option_strings
+    )
+    return parser, global_options
+
+
+def args_from_fields(
+        sub_command: str,
+        fields: dict,
+) -> argparse.Namespace:
+    """Validate a mapping of option names to values like :func:`parse_args`
+
+    Keys are the long option names without the leading ``--``, ``-`` or
+    ``_`` separated (``deadline_version`` or ``deadline-version``).
+    ``True`` adds a flag, ``False`` and ``None`` omit the option and lists
+    become multiple values.
+
+    Args:
+      sub_command (str): sub command, e.g. ``"install-client"``
+      fields (dict): option name -> value
+
+    Returns:
+      :obj:`argparse.Namespace`: command line parameters namespace
+
+    Raises:
+      ValueError: if the fields do not validate or contain a process wide
+          option (``help``, ``version``, ``trace``, ``profile``)
+    """
+    parser, global_options = _fields_parser()
+
+    global_args = list()
+    sub_command_args = list()
+
+    for key, value in fields.items():
+        if key.replace("-", "_") in _PROCESS_FIELDS:
+            raise ValueError(f"Field {key!r} is not supported in a request")
+        option = f"--{key.replace('_', '-')}"
+        args = global_args if option in global_options else sub_command_args
+
+        if value is True:
+            args.append(option)
+        elif value is False or value is None:
+            continue
+        elif isinstance(value, (list, tuple)):
+            args.append(option)
+            args.extend(str(v) for v in value)
+        else:
+            args.extend([option, str(value)])
+
+    return parser.parse_args([*global_args, sub_command, *sub_command_args])
+
+
+def setup_logging(loglevel, stream=sys.stdout):
     """Setup basic logging
 
     Args:
       loglevel (int): minimum loglevel for emitting messages
+      stream (TextIO): stream to log to
     """
 
     # handler = logging.StreamHandler(sys.stdout)
@@ -560,7 +1993,7 @@ def setup_logging(loglevel):
     logformat = "[%(asctime)s] %(levelname)s:%(name)s:%(message)s"
     # logformatter = logging.Formatter(logformat)
     logging.basicConfig(
-        level=loglevel, stream=sys.stdout, format=logformat, datefmt="%Y-%m-%d %H:%M:%S"
+        level=loglevel, stream=stream, format=logformat, datefmt="%Y-%m-%d %H:%M:%S"
     )
     # handler.setFormatter(logformatter)
     # _logger.addHandler(handler)
@@ -577,10 +2010,75 @@ def main(args):
           (for example  ``["--verbose", "42"]``).
     """
     args = parse_args(args)
-    setup_logging(args.loglevel)
 
+    if args.sub_command == "batch":
+        # stdout carries the results
+        setup_logging(args.loglevel, stream=sys.stderr)
+    else:
+        setup_logging(args.loglevel)
+
+    load_entry_point_hooks()
+    TRACER.record = args.trace is not None
+
+    profiler = None
+    if args.profile is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        with phase("main", sub_command=args.sub_command):
+            result = dispatch(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            _logger.info("Wrote profile to %s", args.profile.as_posix())
+        if args.trace is not None:
+            TRACER.write_chrome_trace(args.trace)
+
+    if args.sub_command == "batch" and result:
+        sys.exit(1)
+
+
+def _installer_limits(args) -> RunLimits:
+    return RunLimits(
+        timeout=args.installer_timeout,
+        silence_timeout=args.installer_silence_timeout,
+        total_timeout=args.install_timeout,
+        retries=args.installer_retries,
+        backoff=args.installer_retry_backoff,
+    )
+
+
+def _watchdog_config(args) -> Optional[WatchdogConfig]:
+    if args.watchdog_silence is None:
+        return None
+
+    return WatchdogConfig(
+        silence_timeout=args.watchdog_silence,
+        cpu_threshold=args.watchdog_cpu_threshold,
+        port=args.watchdog_port,
+        interval=args.watchdog_interval,
+        term_timeout=args.watchdog_term_timeout,
+        max_restarts=(
+            None if args.watchdog_max_restarts < 0 else args.watchdog_max_restarts
+        ),
+        incidents=args.watchdog_incidents,
+    )
+
+
+def dispatch(args):
+    """Call the Python API function for a parsed sub command
+
+    Args:
+      args (:obj:`argparse.Namespace`): as returned by :func:`parse_args`
+          or :func:`args_from_fields`
+
+    Returns:
+      the return value of the API function
+    """
     if args.sub_command == "install-client":
-        install_client(
+        return install_client(
             installer=args.installer,
             deadline_version=args.deadline_version,
             prefix=args.prefix,
@@ -588,10 +2086,15 @@ def main(args):
             httpport=args.httpport,
             webservice_httpport=args.webservice_httpport,
             force_reinstall=args.force_reinstall,
+            upgrade=args.upgrade,
+            lock_timeout=args.lock_timeout,
+            installer_cache=args.installer_cache,
+            installer_sha256=args.installer_sha256,
+            limits=_installer_limits(args),
         )
 
     elif args.sub_command == "install-repository":
-        install_repository(
+        return install_repository(
             installer=args.installer,
             deadline_version=args.deadline_version,
             prefix=args.prefix,
@@ -600,13 +2103,80 @@ def main(args):
             dbport=args.dbport,
             dbname=args.dbname,
             force_reinstall=args.force_reinstall,
+            db_preflight=args.db_preflight,
+            wait_for_db_timeout=args.wait_for_db,
+            upgrade=args.upgrade,
+            lock_timeout=args.lock_timeout,
+            installer_cache=args.installer_cache,
+            installer_sha256=args.installer_sha256,
+            limits=_installer_limits(args),
+        )
+
+    elif args.sub_command == "clone-client":
+        return clone_client(
+            source=args.source,
+            targets=args.targets,
+            httpports=args.httpports,
+            webservice_httpports=args.webservice_httpports,
+            force_reinstall=args.force_reinstall,
+            jobs=args.jobs,
+        )
+
+    elif args.sub_command == "sync-custom":
+        return sync_custom(
+            source=args.source,
+            repositorydir=args.repositorydir,
+            delete=args.delete,
+            index=args.index,
+            jobs=args.jobs,
         )
 
     elif args.sub_command == "run":
-        runner(
-            executable=args.executable,
+        return runner(
+            executable=resolve_executable(args.deadline_version, args.executable),
+            nogui=args.nogui,
+            nosplash=args.nosplash,
+            tail_logs=args.tail_logs,
+            watchdog=_watchdog_config(args),
+            state_file=args.state_file,
+            ready_pattern=args.ready_pattern,
+            deadline_ini=args.deadline_ini,
+        )
+
+    elif args.sub_command == "autoscale":
+        return autoscale(
+            executable=resolve_executable(
+                args.deadline_version, args.executable, roles=("worker",),
+            ),
             nogui=args.nogui,
             nosplash=args.nosplash,
+            demand=args.demand,
+            config=AutoscaleConfig(
+                min_workers=args.min_workers,
+                max_workers=args.max_workers,
+                tasks_per_worker=args.tasks_per_worker,
+                max_load_per_cpu=args.max_load_per_cpu,
+                min_mem_available=args.min_mem_available,
+                interval=args.interval,
+                scale_up_after=args.scale_up_after,
+                scale_down_after=args.scale_down_after,
+                cooldown=args.cooldown,
+                drain_timeout=args.drain_timeout,
+            ),
+            instance_prefix=args.instance_prefix,
+            drain=args.drain,
+        )
+
+    elif args.sub_command == "serve":
+        return serve(
+            socket_path=args.socket,
+        )
+
+    elif args.sub_command == "batch":
+        return batch(
+            source=args.input,
+            results=args.results,
+            jobs=args.jobs,
         )
 
 
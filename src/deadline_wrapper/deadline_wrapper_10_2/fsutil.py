@@ -0,0 +1,127 @@
+"""
+Small filesystem helpers shared by the tree operations.
+"""
+
+import functools
+import hashlib
+import os
+import pathlib
+import secrets
+import shutil
+import socket
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(
+        path: os.PathLike,
+        algorithm: str = "sha256",
+) -> str:
+    """Hex digest of a file, read in :data:`CHUNK_SIZE` chunks.
+
+    Digests are cached per process by inode, size, mtime and ctime, so a long-lived
+    process (see :mod:`deadline_wrapper.deadline_wrapper_10_2.server`) only
+    re-reads files that changed.
+    """
+    st = os.stat(path)
+    return _cached_digest(
+        os.path.abspath(path),
+        (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns),
+        algorithm,
+    )
+
+
+@functools.lru_cache(maxsize=65536)
+def _cached_digest(path: str, key: tuple, algorithm: str) -> str:
+    digest = hashlib.new(algorithm)
+    with open(path, "rb", buffering=0) as fo:
+        buffer = bytearray(CHUNK_SIZE)
+        view = memoryview(buffer)
+        while True:
+            read = fo.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+    return digest.hexdigest()
+
+
+def temp_path(path: pathlib.Path) -> pathlib.Path:
+    """Hidden sibling of ``path`` to write to before renaming it into place.
+
+    Unique across hosts sharing the directory: containers on different
+    nodes usually all run as pid 1.
+    """
+    token = f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(4)}"
+    return path.with_name(f".{path.name}.tmp-{token}")
+
+
+def atomic_copy(
+        src: pathlib.Path,
+        dst: pathlib.Path,
+) -> pathlib.Path:
+    """Copy ``src`` to ``dst`` so that readers never see a partial file.
+
+    The data is copied into a temporary sibling of ``dst`` which is then
+    renamed over ``dst``.
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = temp_path(dst)
+    try:
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return dst
+
+
+def atomic_write_bytes(
+        path: pathlib.Path,
+        data: bytes,
+) -> pathlib.Path:
+    """Write ``data`` to ``path`` via a temporary file and a rename."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = temp_path(path)
+    try:
+        with open(tmp, "xb") as fo:
+            fo.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return path
+
+
+def prune_empty_dirs(
+        path: pathlib.Path,
+        root: pathlib.Path,
+):
+    """Remove ``path`` and its parents up to (excluding) ``root`` while empty."""
+    while path != root and root in path.parents:
+        try:
+            path.rmdir()
+        except OSError:
+            return
+        path = path.parent
+
+
+# Entries the wrapper itself keeps inside a prefix (lock file, upgrade
+# staging dir); tree operations on the prefix leave them alone
+RESERVED_PREFIX = ".deadline-wrapper."
+
+
+def is_reserved(name: str) -> bool:
+    return name.startswith(RESERVED_PREFIX)
+
+
+def is_empty_dir(path: pathlib.Path) -> bool:
+    """Whether ``path`` is missing or holds nothing but reserved entries."""
+    if not path.exists():
+        return True
+    with os.scandir(path) as it:
+        return all(is_reserved(entry.name) for entry in it)
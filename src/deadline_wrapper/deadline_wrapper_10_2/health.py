@@ -0,0 +1,217 @@
+"""
+Runner state file and the health probe reading it.
+
+:func:`~deadline_wrapper.deadline_wrapper_10_2.deadline_wrapper.runner`
+keeps a small JSON file up to date (replaced atomically, so readers never
+see a partial write)::
+
+    {"pid": 12, "child_pid": 34, "status": "running", "ready": true,
+     "restarts": 0, "started": ..., "last_output": ..., "updated": ...}
+
+``deadline-wrapper-health`` reads it and exits with 0 (healthy) or 1, for
+Docker's ``HEALTHCHECK``::
+
+    HEALTHCHECK --interval=5s CMD deadline-wrapper-health --max-silence 600
+
+Keep this module free of anything but the standard library and of imports
+of the rest of the package: the probe has to start in a few milliseconds.
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import re
+import sys
+import threading
+import time
+from typing import List, Optional
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+
+DEFAULT_STATE_FILE = pathlib.Path("/tmp/deadline-wrapper-state.json")
+
+STATUSES = ("starting", "running", "restarting", "exited")
+
+
+class RunnerState:
+    """Writer of the state file.
+
+    Args:
+      path (pathlib.Path): state file
+      ready_pattern (str): regular expression; the child is ready once a
+          line of output matches. Without one, it is ready once running.
+      min_interval (float): least seconds between writes caused by output
+    """
+
+    def __init__(
+            self,
+            path: pathlib.Path,
+            ready_pattern: Optional[str] = None,
+            min_interval: float = 1.0,
+    ):
+        self.path = path
+        self.ready_pattern = re.compile(ready_pattern) if ready_pattern else None
+        self.min_interval = min_interval
+        self.state = {
+            "pid": os.getpid(),
+            "child_pid": None,
+            "status": "starting",
+            "ready": False,
+            "restarts": 0,
+            "returncode": None,
+            "started": time.time(),
+            "last_output": None,
+            "updated": None,
+        }
+        self._written = 0.0
+        self._lock = threading.Lock()
+
+    def _write(self):
+        self.state["updated"] = time.time()
+        tmp = self.path.with_name(f".{self.path.name}.tmp-{os.getpid()}")
+        with open(tmp, "w") as fo:
+            json.dump(self.state, fo)
+        os.replace(tmp, self.path)
+        self._written = time.monotonic()
+
+    def update(self, **fields):
+        assert fields.get("status", "running") in STATUSES
+        with self._lock:
+            self.state.update(fields)
+            if fields.get("status") == "running" and self.ready_pattern is None:
+                self.state["ready"] = True
+            elif "status" in fields and fields["status"] != "running":
+                self.state["ready"] = False
+            self._write()
+
+    def output(self, line: str):
+        """Record output of the child, written at most every ``min_interval``."""
+        with self._lock:
+            self.state["last_output"] = time.time()
+            became_ready = (
+                not self.state["ready"]
+                and self.state["status"] == "running"
+                and self.ready_pattern is not None
+                and self.ready_pattern.search(line) is not None
+            )
+            if became_ready:
+                self.state["ready"] = True
+            if became_ready or time.monotonic() - self._written >= self.min_interval:
+                self._write()
+
+    def remove(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def check(
+        path: pathlib.Path = DEFAULT_STATE_FILE,
+        max_silence: Optional[float] = None,
+        require_ready: bool = True,
+) -> Optional[str]:
+    """Reason the runner is unhealthy, ``None`` if it is healthy."""
+    try:
+        with open(path, "rb") as fo:
+            state = json.loads(fo.read())
+    except FileNotFoundError:
+        return f"{path} does not exist"
+    except (OSError, ValueError) as e:
+        return f"cannot read {path}: {e}"
+
+    if state.get("status") != "running":
+        return f"status {state.get('status')}"
+
+    child_pid = state.get("child_pid")
+    if not isinstance(child_pid, int) or not _pid_alive(child_pid):
+        return f"child {child_pid} is not running"
+
+    if require_ready and not state.get("ready"):
+        return "not ready"
+
+    if max_silence is not None:
+        last = state.get("last_output") or state.get("started") or 0
+        silence = time.time() - last
+        if silence > max_silence:
+            return f"no output for {silence:.0f}s"
+
+    return None
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Exit with 0 if the deadline-wrapper runner is healthy, else 1",
+    )
+
+    parser.add_argument(
+        "--state-file",
+        dest="state_file",
+        type=pathlib.Path,
+        default=DEFAULT_STATE_FILE,
+        help="state file written by 'deadline-wrapper run --state-file'",
+    )
+
+    parser.add_argument(
+        "--max-silence",
+        dest="max_silence",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="unhealthy if the child has not written output for SECONDS",
+    )
+
+    parser.add_argument(
+        "--no-require-ready",
+        dest="require_ready",
+        action="store_false",
+        help="healthy while running, even before the child is ready",
+    )
+
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        dest="quiet",
+        action="store_true",
+        help="do not print the reason",
+    )
+
+    return parser.parse_args(args)
+
+
+def main(args: List[str]) -> int:
+    args = parse_args(args)
+
+    reason = check(
+        path=args.state_file,
+        max_silence=args.max_silence,
+        require_ready=args.require_ready,
+    )
+
+    if not args.quiet:
+        print("healthy" if reason is None else f"unhealthy: {reason}")
+
+    return 0 if reason is None else 1
+
+
+def run():
+    """Entry point for console_scripts"""
+    sys.exit(main(sys.argv[1:]))
+
+
+if __name__ == "__main__":
+    run()
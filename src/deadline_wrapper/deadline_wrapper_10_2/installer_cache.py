@@ -0,0 +1,221 @@
+"""
+Keep a local copy of the installer.
+
+In production ``--installer`` usually points at a ``.run`` file on shared
+storage, which the installer would otherwise read over the network for
+every install. :func:`cache_installer` copies it once per host into a
+local cache directory:
+
+- large sequential reads, hashed while copying
+- an interrupted copy is resumed from the ``.part`` file it left behind,
+  if there is a ``sha256`` to verify the result against; without one a
+  damaged ``.part`` file would go unnoticed, so the copy starts over
+- the copy is verified against ``sha256`` (if given) before it is renamed
+  into place, so the cache only ever contains complete files
+- concurrent invocations serialize on a
+  :class:`~deadline_wrapper.deadline_wrapper_10_2.locking.PrefixLock`:
+  one copies, the others wait and use its result
+"""
+
+import hashlib
+import logging
+import os
+import pathlib
+import time
+from typing import Optional
+
+from deadline_wrapper.deadline_wrapper_10_2.fsutil import CHUNK_SIZE, file_digest
+from deadline_wrapper.deadline_wrapper_10_2.locking import PrefixLock
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+# Reads from network storage, larger than the local CHUNK_SIZE
+COPY_CHUNK_SIZE = 8 * CHUNK_SIZE
+
+
+def default_cache_dir() -> pathlib.Path:
+    cache = pathlib.Path(
+        os.environ.get("XDG_CACHE_HOME", pathlib.Path.home() / ".cache")
+    )
+    return cache / "deadline-wrapper" / "installers"
+
+
+def cache_path(
+        installer: pathlib.Path,
+        cache_dir: pathlib.Path,
+        sha256: Optional[str] = None,
+) -> pathlib.Path:
+    """Where ``installer`` is cached.
+
+    With ``sha256`` the content decides, otherwise the path, size and mtime
+    of the source, so a replaced installer is copied again.
+    """
+    if sha256 is not None:
+        key = sha256.lower()
+    else:
+        st = os.stat(installer)
+        source = f"{installer.resolve().as_posix()}\0{st.st_size}\0{st.st_mtime_ns}"
+        key = hashlib.sha256(source.encode()).hexdigest()
+    return cache_dir / f"{key[:16]}-{installer.name}"
+
+
+def _resume_digest(
+        part: pathlib.Path,
+        size: int,
+) -> "hashlib._Hash":
+    """Digest of the first ``size`` bytes of ``part`` (local reads)."""
+    digest = hashlib.sha256()
+    remaining = size
+    if not remaining:
+        return digest
+    with open(part, "rb", buffering=0) as fo:
+        while remaining:
+            chunk = fo.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest
+
+
+def _copy(
+        src: pathlib.Path,
+        part: pathlib.Path,
+        chunk_size: int,
+        resume: bool = True,
+) -> str:
+    """Append what is missing from ``src`` to ``part``, return the sha256.
+
+    With ``resume=False`` an existing ``part`` is discarded.
+    """
+    size = os.stat(src).st_size
+
+    offset = part.stat().st_size if part.exists() else 0
+    if offset > size or (offset and not resume):
+        # Left over from a different file, or nothing to verify it against
+        part.unlink()
+        offset = 0
+
+    if offset:
+        _logger.info(
+            "Resuming copy of %s at %s/%s bytes",
+            src.as_posix(), offset, size,
+        )
+    digest = _resume_digest(part, offset)
+
+    start = time.monotonic()
+    src_fd = os.open(src, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(src_fd, offset, 0, os.POSIX_FADV_SEQUENTIAL)
+        with open(part, "ab", buffering=0) as fo:
+            while True:
+                chunk = os.pread(src_fd, chunk_size, offset)
+                if not chunk:
+                    break
+                fo.write(chunk)
+                digest.update(chunk)
+                offset += len(chunk)
+            os.fsync(fo.fileno())
+    finally:
+        os.close(src_fd)
+
+    duration = time.monotonic() - start
+    _logger.info(
+        "Copied %s (%.1f MiB) in %.1fs",
+        src.as_posix(), size / 2 ** 20, duration,
+    )
+
+    return digest.hexdigest()
+
+
+def cache_installer(
+        installer: pathlib.Path,
+        cache_dir: Optional[pathlib.Path] = None,
+        sha256: Optional[str] = None,
+        chunk_size: int = COPY_CHUNK_SIZE,
+        lock_timeout: Optional[float] = None,
+) -> pathlib.Path:
+    """Local, verified copy of ``installer``.
+
+    Args:
+      installer (pathlib.Path): installer, usually on shared storage
+      cache_dir (pathlib.Path): defaults to :func:`default_cache_dir`
+      sha256 (str): expected hex digest of the installer
+      chunk_size (int): bytes per read from ``installer``
+      lock_timeout (float): seconds to wait for a concurrent copy
+
+    Returns:
+      :obj:`pathlib.Path`: the cached installer
+
+    Raises:
+      ValueError: if the copy does not match ``sha256``
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    target = cache_path(installer, cache_dir, sha256)
+
+    if target.exists():
+        _logger.info("Using cached installer %s", target.as_posix())
+        return target
+
+    with PrefixLock(
+            target,
+            timeout=lock_timeout,
+            path=target.with_name(f".{target.name}.lock"),
+    ) as lock:
+        # Copied by whoever held the lock before us
+        if target.exists():
+            _logger.info("Using cached installer %s", target.as_posix())
+            lock.set_state("complete")
+            return target
+
+        lock.set_state("installing")
+
+        part = target.with_name(f".{target.name}.part")
+        before = os.stat(installer)
+        # Only a checksum can tell whether the bytes already copied are intact
+        digest = _copy(installer, part, chunk_size, resume=sha256 is not None)
+        after = os.stat(installer)
+
+        if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+            part.unlink()
+            raise ValueError(f"{installer} changed while it was copied")
+
+        if sha256 is not None and digest != sha256.lower():
+            part.unlink()
+            raise ValueError(
+                f"Checksum mismatch for {installer}: "
+                f"expected {sha256.lower()}, got {digest}"
+            )
+
+        os.chmod(part, before.st_mode & 0o777 | 0o500)
+        os.replace(part, target)
+        lock.set_state("complete")
+
+    return target
+
+
+def stage_installer(
+        installer: pathlib.Path,
+        cache_dir: Optional[pathlib.Path] = None,
+        sha256: Optional[str] = None,
+) -> pathlib.Path:
+    """The installer to run: the cached copy with ``cache_dir``, otherwise
+    ``installer`` itself, verified against ``sha256`` if given."""
+    if cache_dir is not None:
+        return cache_installer(installer, cache_dir=cache_dir, sha256=sha256)
+
+    if sha256 is not None:
+        digest = file_digest(installer)
+        if digest != sha256.lower():
+            raise ValueError(
+                f"Checksum mismatch for {installer}: "
+                f"expected {sha256.lower()}, got {digest}"
+            )
+
+    return installer
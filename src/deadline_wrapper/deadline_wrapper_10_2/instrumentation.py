@@ -0,0 +1,172 @@
+"""
+Named phase spans and hooks around install and run.
+
+Code marks its phases with :func:`phase`::
+
+    with phase("installer", prefix=prefix.as_posix()):
+        ...
+
+Every registered hook gets ``on_phase_start`` and ``on_phase_end`` calls.
+An exception raised by a hook is logged and otherwise ignored, it never
+aborts or masks the phase it observes.
+Hooks are registered with :func:`register_hook` or discovered through the
+``deadline_wrapper.phase_hooks`` entry point group, see
+:func:`load_entry_point_hooks`. With recording enabled (``--trace``), the
+spans are also kept and can be written as Chrome trace JSON, viewable in
+``chrome://tracing`` or https://ui.perfetto.dev.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+HOOKS_ENTRY_POINT_GROUP = "deadline_wrapper.phase_hooks"
+
+
+class PhaseHook:
+    """Base class for phase hooks. Override what you need."""
+
+    def on_phase_start(self, name: str, attrs: Dict[str, Any]):
+        pass
+
+    def on_phase_end(
+            self,
+            name: str,
+            duration: float,
+            attrs: Dict[str, Any],
+            error: Optional[BaseException],
+    ):
+        pass
+
+
+class Tracer:
+
+    def __init__(self):
+        self.hooks: List[PhaseHook] = []
+        self.record = False
+        self.events: List[dict] = []
+        self._lock = threading.Lock()
+
+    def register_hook(self, hook: PhaseHook) -> PhaseHook:
+        self.hooks.append(hook)
+        return hook
+
+    def unregister_hook(self, hook: PhaseHook):
+        self.hooks.remove(hook)
+
+    @staticmethod
+    def _call_hook(hook: PhaseHook, method: str, *args):
+        try:
+            getattr(hook, method)(*args)
+        except Exception:
+            _logger.exception("Phase hook %r failed in %s", hook, method)
+
+    @contextlib.contextmanager
+    def phase(self, name: str, **attrs):
+        for hook in self.hooks:
+            self._call_hook(hook, "on_phase_start", name, attrs)
+
+        start = time.perf_counter_ns()
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            end = time.perf_counter_ns()
+            duration = (end - start) / 1e9
+            _logger.debug("Phase %s took %.3fs", name, duration)
+
+            if self.record:
+                event = {
+                    "name": name,
+                    "cat": "deadline-wrapper",
+                    "ph": "X",
+                    "ts": start / 1e3,
+                    "dur": (end - start) / 1e3,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": {k: str(v) for k, v in attrs.items()},
+                }
+                if error is not None:
+                    event["args"]["error"] = repr(error)
+                with self._lock:
+                    self.events.append(event)
+
+            for hook in self.hooks:
+                self._call_hook(hook, "on_phase_end", name, duration, attrs, error)
+
+    def write_chrome_trace(self, path: pathlib.Path):
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as fo:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fo)
+        _logger.info("Wrote %s spans to %s", len(events), path.as_posix())
+
+
+TRACER = Tracer()
+
+phase = TRACER.phase
+register_hook = TRACER.register_hook
+unregister_hook = TRACER.unregister_hook
+
+
+def traced(name: str):
+    """Decorator running the whole function in :func:`phase` ``name``."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def load_entry_point_hooks(
+        group: str = HOOKS_ENTRY_POINT_GROUP,
+        tracer: Tracer = TRACER,
+) -> List[PhaseHook]:
+    """Register the hooks advertised by installed packages, e.g.::
+
+        [options.entry_points]
+        deadline_wrapper.phase_hooks =
+            statsd = my_package.hooks:StatsdHook
+
+    Classes are instantiated without arguments.
+    """
+    from importlib.metadata import entry_points
+
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=group)
+    else:  # pragma: no cover
+        # Python < 3.10
+        eps = eps.get(group, [])
+
+    hooks = []
+    for ep in eps:
+        try:
+            hook = ep.load()
+            if isinstance(hook, type):
+                hook = hook()
+        except Exception:
+            _logger.exception("Failed to load phase hook %s", ep.name)
+            continue
+        hooks.append(tracer.register_hook(hook))
+    return hooks
@@ -0,0 +1,259 @@
+"""
+Coordinate wrappers installing into the same (shared) prefix.
+
+Many nodes starting at once against one repository prefix would otherwise
+all see an empty prefix and run the installer at the same time, or empty a
+prefix another node is installing into. :class:`PrefixLock` holds an
+exclusive :func:`fcntl.flock` on a lock file inside the prefix: the first
+wrapper installs, the others wait and then find a complete installation to
+reuse. Inside, because shared storage is often mounted at the prefix itself
+(e.g. a compose volume at ``/opt/Thinkbox/DeadlineRepository10``), so a lock
+file next to it would be on each node's local disk. Tree operations on the
+prefix skip the lock file, see
+:func:`~deadline_wrapper.deadline_wrapper_10_2.fsutil.is_reserved`.
+
+The lock file also records its holder and the state of the prefix::
+
+    {"host": "node-01", "boot_id": ..., "pidns": "pid:[4026531836]",
+     "pid": 4242, "state": "installing", "time": ...}
+
+A lock is released by the kernel when its holder dies, so a waiter that
+gets the lock and still finds ``installing`` (or ``failed``) knows the
+previous install did not complete, see :attr:`PrefixLock.interrupted`.
+Some network file systems keep locks of dead processes around; a lock held
+by a pid that does not exist anymore is considered stale and broken, but
+only if the holder ran in our PID namespace on the same boot of the same
+host. Containers may share a hostname (``network_mode: host``) while their
+pids mean nothing to each other.
+"""
+
+import errno
+import fcntl
+import json
+import logging
+import os
+import pathlib
+import socket
+import time
+from typing import Optional
+
+from deadline_wrapper.deadline_wrapper_10_2.fsutil import RESERVED_PREFIX
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+STATES = ("installing", "complete", "failed")
+
+LOCK_NAME = f"{RESERVED_PREFIX}lock"
+
+
+def lock_path(prefix: pathlib.Path) -> pathlib.Path:
+    """Lock file inside ``prefix``, on the same storage as the prefix."""
+    return prefix / LOCK_NAME
+
+
+def _read_link(path: str) -> Optional[str]:
+    try:
+        return os.readlink(path)
+    except OSError:
+        return None
+
+
+def _read_boot_id() -> Optional[str]:
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as fo:
+            return fo.read().strip() or None
+    except OSError:
+        return None
+
+
+def _namespace() -> dict:
+    """Identifies where our pids are meaningful: host, boot, PID namespace."""
+    return {
+        "host": socket.gethostname(),
+        "boot_id": _read_boot_id(),
+        "pidns": _read_link("/proc/self/ns/pid"),
+    }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_record(fd: int) -> dict:
+    try:
+        data = os.pread(fd, 64 * 1024, 0)
+        record = json.loads(data) if data else {}
+    except (OSError, ValueError):
+        return {}
+    return record if isinstance(record, dict) else {}
+
+
+class PrefixLock:
+    """Exclusive lock on ``prefix`` for the duration of a ``with`` block.
+
+    Args:
+      prefix (pathlib.Path): prefix to lock, does not need to exist
+      timeout (float): seconds to wait for the lock, ``None`` waits forever
+      poll (float): first wait between attempts, doubled up to ``max_poll``
+      max_poll (float): longest wait between attempts
+      path (pathlib.Path): lock file, defaults to :func:`lock_path`
+
+    Raises:
+      TimeoutError: if the lock could not be acquired within ``timeout``
+    """
+
+    def __init__(
+            self,
+            prefix: pathlib.Path,
+            timeout: Optional[float] = None,
+            poll: float = 0.1,
+            max_poll: float = 2.0,
+            path: Optional[pathlib.Path] = None,
+    ):
+        self.prefix = prefix
+        self.path = path or lock_path(prefix)
+        self.timeout = timeout
+        self.poll = poll
+        self.max_poll = max_poll
+        # Record of the previous holder, read once the lock is acquired
+        self.previous: dict = {}
+        self.state: Optional[str] = None
+        self._fd: Optional[int] = None
+
+    @property
+    def interrupted(self) -> bool:
+        """Whether the previous holder left the prefix half installed."""
+        return self.previous.get("state") in ("installing", "failed")
+
+    def _open(self) -> int:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        return os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o666)
+
+    def _is_stale(self, record: dict) -> bool:
+        namespace = _namespace()
+        # Without a boot id or PID namespace to compare, a pid proves nothing
+        if None in namespace.values():
+            return False
+        return (
+            all(record.get(key) == value for key, value in namespace.items())
+            and isinstance(record.get("pid"), int)
+            and record["pid"] != os.getpid()
+            and not _pid_alive(record["pid"])
+        )
+
+    def acquire(self):
+        start = time.monotonic()
+        wait = self.poll
+        waiting_logged = False
+
+        while True:
+            fd = self._open()
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    os.close(fd)
+                    raise
+            else:
+                # The file may have been replaced by a stale lock breaker
+                # between open and flock
+                try:
+                    same = os.stat(self.path).st_ino == os.fstat(fd).st_ino
+                except FileNotFoundError:
+                    same = False
+                if same:
+                    break
+                os.close(fd)
+                continue
+
+            record = _read_record(fd)
+
+            if self._is_stale(record):
+                _logger.warning(
+                    "Breaking stale lock %s of dead pid %s",
+                    self.path.as_posix(), record["pid"],
+                )
+                try:
+                    # Only if nobody broke it and locked a new file meanwhile
+                    if os.stat(self.path).st_ino == os.fstat(fd).st_ino:
+                        self.path.unlink()
+                except FileNotFoundError:
+                    pass
+                os.close(fd)
+                continue
+
+            os.close(fd)
+
+            if not waiting_logged:
+                _logger.info(
+                    "Waiting for %s, locked by %s (pid %s, %s)",
+                    self.prefix.as_posix(),
+                    record.get("host", "?"), record.get("pid", "?"),
+                    record.get("state", "?"),
+                )
+                waiting_logged = True
+
+            elapsed = time.monotonic() - start
+            if self.timeout is not None and elapsed + wait > self.timeout:
+                raise TimeoutError(
+                    f"Timed out after {self.timeout}s waiting for "
+                    f"{self.path.as_posix()}, held by {record.get('host', '?')} "
+                    f"(pid {record.get('pid', '?')})"
+                )
+
+            time.sleep(wait)
+            wait = min(wait * 2, self.max_poll)
+
+        self._fd = fd
+        self.previous = _read_record(fd)
+        if waiting_logged:
+            _logger.info(
+                "Acquired %s after %.1fs",
+                self.path.as_posix(), time.monotonic() - start,
+            )
+        # Announce the new holder, the prefix is as the previous one left it
+        state = self.previous.get("state")
+        self.set_state(state if state in STATES else None)
+
+    def set_state(self, state: Optional[str]):
+        assert state is None or state in STATES
+        assert self._fd is not None, "Lock not held"
+
+        data = json.dumps({
+            **_namespace(),
+            "pid": os.getpid(),
+            "state": state,
+            "time": time.time(),
+        }).encode()
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, data, 0)
+        os.fsync(self._fd)
+        self.state = state
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "PrefixLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is not None and self.state == "installing":
+                self.set_state("failed")
+        finally:
+            self.release()
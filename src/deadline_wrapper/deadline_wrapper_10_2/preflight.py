@@ -0,0 +1,171 @@
+"""
+Database reachability pre-flight for ``install-repository``.
+
+The Deadline installer only finds out that MongoDB is not reachable after its
+own (long) internal timeout. These helpers do a quick TCP connect, optionally
+followed by a minimal MongoDB wire-protocol ``hello``, so that an unreachable
+database fails in well under a second, or can be waited for with fast backoff.
+"""
+
+import itertools
+import logging
+import os
+import socket
+import struct
+import time
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+PREFLIGHT_MODES = ("none", "tcp", "hello")
+
+# https://www.mongodb.com/docs/manual/reference/mongodb-wire-protocol/#op_msg
+OP_MSG = 2013
+_HEADER = struct.Struct("<iiii")
+_MAX_REPLY = 16 * 1024 * 1024
+
+_request_ids = itertools.count(os.getpid() & 0xFFFF)
+
+
+class DatabaseUnreachable(ConnectionError):
+    """Raised when the database did not answer the pre-flight in time."""
+
+
+def _bson_cstring(value: str) -> bytes:
+    return value.encode("utf-8") + b"\x00"
+
+
+def _bson_document(fields: dict) -> bytes:
+    # Just enough BSON for a command document: int32 and string values.
+    body = b""
+    for key, value in fields.items():
+        if isinstance(value, int):
+            body += b"\x10" + _bson_cstring(key) + struct.pack("<i", value)
+        else:
+            encoded = _bson_cstring(str(value))
+            body += (
+                b"\x02" + _bson_cstring(key)
+                + struct.pack("<i", len(encoded)) + encoded
+            )
+    return struct.pack("<i", len(body) + 5) + body + b"\x00"
+
+
+def hello_message(request_id: int) -> bytes:
+    """Build an ``OP_MSG`` carrying ``{hello: 1, $db: "admin"}``."""
+    document = _bson_document({"hello": 1, "$db": "admin"})
+    # flagBits (uint32) + section kind 0 (body) + document
+    payload = struct.pack("<I", 0) + b"\x00" + document
+    return _HEADER.pack(_HEADER.size + len(payload), request_id, 0, OP_MSG) + payload
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise DatabaseUnreachable("Connection closed during hello")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def probe_db(
+        host: str,
+        port: int,
+        timeout: float = 1.0,
+        hello: bool = True,
+) -> float:
+    """Check once whether ``host:port`` accepts connections.
+
+    With ``hello``, a minimal ``OP_MSG`` is sent and the reply header is
+    validated. Any well-formed reply counts, even a command error, because
+    it proves a MongoDB-compatible server is answering.
+
+    Returns:
+        float: round trip in seconds
+
+    Raises:
+        DatabaseUnreachable: if the check failed
+    """
+    start = time.monotonic()
+
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            if hello:
+                request_id = next(_request_ids) & 0x7FFFFFFF
+                sock.sendall(hello_message(request_id))
+                length, _, response_to, op_code = _HEADER.unpack(
+                    _recv_exactly(sock, _HEADER.size)
+                )
+                if op_code != OP_MSG or response_to != request_id:
+                    raise DatabaseUnreachable(
+                        f"Unexpected reply from {host}:{port} "
+                        f"(opCode={op_code}, responseTo={response_to})"
+                    )
+                if not _HEADER.size < length <= _MAX_REPLY:
+                    raise DatabaseUnreachable(
+                        f"Invalid reply length {length} from {host}:{port}"
+                    )
+                _recv_exactly(sock, length - _HEADER.size)
+    except DatabaseUnreachable:
+        raise
+    except OSError as e:
+        raise DatabaseUnreachable(f"{host}:{port} is not reachable: {e}") from e
+
+    return time.monotonic() - start
+
+
+def wait_for_db(
+        host: str,
+        port: int,
+        timeout: float = 1.0,
+        hello: bool = True,
+        retries: int = 3,
+        wait: float = 0.0,
+        backoff: float = 0.05,
+        max_backoff: float = 1.0,
+) -> float:
+    """Probe the database with bounded retries.
+
+    Args:
+      host (str): db host
+      port (int): db port
+      timeout (float): timeout of a single probe in seconds
+      hello (bool): send a wire-protocol ``hello`` after connecting
+      retries (int): retries after the first failed probe
+      wait (float): if > 0, keep retrying until this many seconds have
+          passed, regardless of ``retries``
+      backoff (float): initial sleep between probes, doubled each time
+      max_backoff (float): upper bound for the sleep between probes
+
+    Returns:
+        float: seconds until the database answered
+
+    Raises:
+        DatabaseUnreachable: if the database did not answer in time
+    """
+    start = time.monotonic()
+    deadline = start + wait
+
+    for attempt in itertools.count():
+        try:
+            latency = probe_db(host=host, port=port, timeout=timeout, hello=hello)
+        except DatabaseUnreachable as e:
+            now = time.monotonic()
+            if (wait > 0 and now >= deadline) or (wait <= 0 and attempt >= retries):
+                raise DatabaseUnreachable(
+                    f"{e} (gave up after {attempt + 1} attempts, "
+                    f"{now - start:.2f}s)"
+                ) from e
+            _logger.debug("Attempt %s: %s", attempt + 1, e)
+            sleep = min(backoff * 2 ** attempt, max_backoff)
+            if wait > 0:
+                sleep = min(sleep, max(deadline - now, 0.0))
+            time.sleep(sleep)
+        else:
+            _logger.debug("%s:%s answered in %.3fs", host, port, latency)
+            return time.monotonic() - start
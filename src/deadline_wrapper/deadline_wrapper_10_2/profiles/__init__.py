@@ -0,0 +1,149 @@
+"""
+What differs between Deadline versions, as data.
+
+Every supported version has a :class:`VersionProfile`: the options its
+installers accept, the values we always pass and the names of its binaries.
+The versions shipped with this package are listed in
+:data:`BUILTIN_PROFILES`. Another package can add a version without touching
+this one by registering it in the ``deadline_wrapper.version_profiles``
+entry point group (name: the version, value: the profile object)::
+
+    [options.entry_points]
+    deadline_wrapper.version_profiles =
+        10.4.1.0 = my_package.profiles:DEADLINE_10_4_1
+
+Only the profile that is asked for gets imported.
+"""
+
+import dataclasses
+import functools
+import importlib
+import logging
+import pathlib
+from typing import Dict, FrozenSet, List, Mapping, Tuple
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+PROFILES_ENTRY_POINT_GROUP = "deadline_wrapper.version_profiles"
+
+# The versions of this package; entry points of other packages add to them
+# (and take precedence)
+BUILTIN_PROFILES = {
+    "10.2.1.1": "deadline_wrapper.deadline_wrapper_10_2.profiles.v10_2:PROFILE",
+    "10.4.0.10": "deadline_wrapper.deadline_wrapper_10_2.profiles.v10_4:PROFILE",
+}
+
+COMPONENTS = ("repository", "client")
+
+
+@dataclasses.dataclass(frozen=True)
+class VersionProfile:
+    version: str
+    # Options passed with the same value on every install
+    repository_defaults: Tuple[Tuple[str, str], ...]
+    client_defaults: Tuple[Tuple[str, str], ...]
+    # Options the installers accept, without the leading ``--``
+    repository_options: FrozenSet[str]
+    client_options: FrozenSet[str]
+    # Role -> file name in ``<prefix>/bin``
+    binaries: Mapping[str, str]
+
+    def installer_args(
+            self,
+            component: str,
+            **values,
+    ) -> List[str]:
+        """Installer arguments for ``component`` (``repository`` or
+        ``client``): the defaults of this version followed by ``values``.
+
+        Raises:
+          ValueError: if an option is not supported by this version
+        """
+        assert component in COMPONENTS
+
+        defaults = getattr(self, f"{component}_defaults")
+        options = getattr(self, f"{component}_options")
+
+        args = ["--mode", "unattended"]
+        for option, value in (*defaults, *values.items()):
+            if option not in options:
+                raise ValueError(
+                    f"The Deadline {self.version} {component} installer "
+                    f"does not support --{option}"
+                )
+            args.extend([f"--{option}", str(value)])
+
+        return args
+
+    def binary(
+            self,
+            prefix: pathlib.Path,
+            role: str,
+    ) -> pathlib.Path:
+        return prefix / "bin" / self.binaries[role]
+
+
+def _load(reference: str):
+    module, _, attr = reference.partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+@functools.lru_cache(maxsize=None)
+def _registry() -> Dict[str, object]:
+    """Version -> entry point or ``module:attr`` reference, nothing loaded."""
+    from importlib.metadata import entry_points
+
+    registry: Dict[str, object] = dict(BUILTIN_PROFILES)
+
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=PROFILES_ENTRY_POINT_GROUP)
+    else:  # pragma: no cover
+        # Python < 3.10
+        eps = eps.get(PROFILES_ENTRY_POINT_GROUP, [])
+
+    for ep in eps:
+        registry[ep.name] = ep
+
+    return registry
+
+
+def available_versions() -> List[str]:
+    return sorted(
+        _registry(),
+        key=lambda v: tuple(int(p) if p.isdigit() else 0 for p in v.split(".")),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_profile(version: str) -> VersionProfile:
+    """Load the profile of Deadline ``version``.
+
+    Raises:
+      ValueError: if there is no profile for ``version``
+    """
+    try:
+        reference = _registry()[str(version)]
+    except KeyError:
+        raise ValueError(
+            f"Unsupported Deadline version {version}, "
+            f"expected one of {', '.join(available_versions())}"
+        ) from None
+
+    if isinstance(reference, str):
+        profile = _load(reference)
+    else:
+        profile = reference.load()
+
+    assert isinstance(profile, VersionProfile), f"{reference} is not a VersionProfile"
+    assert profile.version == version, \
+        f"{reference} is the profile of {profile.version}, not {version}"
+
+    _logger.debug("Loaded profile of Deadline %s", version)
+
+    return profile
@@ -0,0 +1,65 @@
+"""Deadline 10.2"""
+
+from deadline_wrapper.deadline_wrapper_10_2.profiles import VersionProfile
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+
+REPOSITORY_DEFAULTS = (
+    ("setpermissions", "true"),
+    ("installmongodb", "false"),
+    ("dbauth", "false"),
+    ("dbssl", "false"),
+    ("installSecretsManagement", "false"),
+    ("importrepositorysettings", "false"),
+)
+
+REPOSITORY_OPTIONS = frozenset({
+    "prefix",
+    "dbtype",
+    "dbhost",
+    "dbport",
+    "dbname",
+    *(option for option, _ in REPOSITORY_DEFAULTS),
+})
+
+CLIENT_DEFAULTS = (
+    ("setpermissionsclient", "true"),
+    ("launcherdaemon", "false"),
+    ("enabletls", "false"),
+    ("proxyalwaysrunning", "false"),
+    ("blockautoupdateoverride", "NotBlocked"),
+    ("webserviceuser", "root"),
+    ("webservice_enabletls", "false"),
+)
+
+CLIENT_OPTIONS = frozenset({
+    "prefix",
+    "binariesonly",
+    "repositorydir",
+    "httpport",
+    "webservice_httpport",
+    *(option for option, _ in CLIENT_DEFAULTS),
+})
+
+BINARIES = {
+    "launcher": "deadlinelauncher",
+    "worker": "deadlineworker",
+    "rcs": "deadlinercs",
+    "webservice": "deadlinewebservice",
+    "pulse": "deadlinepulse",
+    "monitor": "deadlinemonitor",
+    "command": "deadlinecommand",
+}
+
+
+PROFILE = VersionProfile(
+    version="10.2.1.1",
+    repository_defaults=REPOSITORY_DEFAULTS,
+    client_defaults=CLIENT_DEFAULTS,
+    repository_options=REPOSITORY_OPTIONS,
+    client_options=CLIENT_OPTIONS,
+    binaries=BINARIES,
+)
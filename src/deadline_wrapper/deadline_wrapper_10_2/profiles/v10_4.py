@@ -0,0 +1,27 @@
+"""Deadline 10.4"""
+
+from deadline_wrapper.deadline_wrapper_10_2.profiles import VersionProfile
+from deadline_wrapper.deadline_wrapper_10_2.profiles import v10_2
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+
+# New in 10.4
+CLIENT_DEFAULTS = (
+    *v10_2.CLIENT_DEFAULTS,
+    ("remotecontrol", "NotBlocked"),
+)
+
+CLIENT_OPTIONS = v10_2.CLIENT_OPTIONS | {"remotecontrol"}
+
+
+PROFILE = VersionProfile(
+    version="10.4.0.10",
+    repository_defaults=v10_2.REPOSITORY_DEFAULTS,
+    client_defaults=CLIENT_DEFAULTS,
+    repository_options=v10_2.REPOSITORY_OPTIONS,
+    client_options=CLIENT_OPTIONS,
+    binaries=v10_2.BINARIES,
+)
@@ -0,0 +1,326 @@
+"""
+Long-lived wrapper process with a JSON control API on a Unix domain socket.
+
+Clients send one JSON object per line and receive one JSON object per line::
+
+    {"command": "status"}
+    {"ok": true, "result": {...}, "duration": 0.0001}
+
+The server keeps its state between requests: registered handlers, the
+children started with :meth:`Service.start_child` and request metrics. The
+handlers for the wrapper's operations are registered by
+:func:`deadline_wrapper.deadline_wrapper_10_2.deadline_wrapper.serve`.
+"""
+
+import collections
+import dataclasses
+import itertools
+import json
+import logging
+import os
+import pathlib
+import signal
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+DEFAULT_SOCKET = pathlib.Path("/tmp/deadline-wrapper.sock")
+
+TAIL_LINES = 200
+
+# Exited children kept for ``status``, the oldest are forgotten first
+KEEP_EXITED = 32
+
+
+def to_jsonable(obj: Any) -> Any:
+    """``default`` for :func:`json.dumps`: dataclasses, paths and sets."""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, os.PathLike):
+        return os.fspath(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+@dataclasses.dataclass
+class Child:
+    id: str
+    cmd: List[str]
+    proc: subprocess.Popen
+    started: float
+    tail: collections.deque = dataclasses.field(
+        default_factory=lambda: collections.deque(maxlen=TAIL_LINES)
+    )
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "pid": self.proc.pid,
+            "cmd": self.cmd,
+            "running": self.proc.poll() is None,
+            "returncode": self.proc.returncode,
+            "uptime": time.monotonic() - self.started,
+        }
+
+
+class Service:
+    """Dispatches requests to handlers and owns the long-lived state.
+
+    Args:
+      handlers (Dict[str, Callable[[dict], Any]]): command name -> callable
+          receiving the request fields (without ``command``)
+      exclusive (Iterable[str]): commands that must not run concurrently
+          with each other, e.g. installs sharing the installer log
+    """
+
+    def __init__(
+            self,
+            handlers: Dict[str, Callable[[dict], Any]],
+            exclusive=(),
+    ):
+        self.handlers = dict(handlers)
+        self.handlers.update(
+            stop=self._stop,
+            status=self._status,
+            metrics=self._metrics,
+        )
+        self.exclusive = frozenset(exclusive)
+        self.children: Dict[str, Child] = {}
+        self.started = time.monotonic()
+
+        self._exclusive_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._requests = collections.Counter()
+        self._errors = collections.Counter()
+        self._durations = collections.Counter()
+
+    # ---- children ----
+
+    def start_child(
+            self,
+            cmd: List[str],
+            name: Optional[str] = None,
+            env: Optional[Dict[str, str]] = None,
+    ) -> dict:
+        """Start ``cmd`` in the background and forward its output to the log."""
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+        )
+        with self._lock:
+            self._prune()
+            child_id = f"{name or pathlib.Path(cmd[0]).name}-{next(self._ids)}"
+            child = Child(id=child_id, cmd=cmd, proc=proc, started=time.monotonic())
+            self.children[child_id] = child
+
+        for handle, function in (
+                (proc.stdout, _logger.info),
+                (proc.stderr, _logger.error),
+        ):
+            threading.Thread(
+                target=self._pump,
+                args=(child, handle, function),
+                name=f"{child_id}-pump",
+                daemon=True,
+            ).start()
+
+        _logger.info("Started %s (pid %s)", child_id, proc.pid)
+        return child.status()
+
+    def _prune(self):
+        """Forget all but the :data:`KEEP_EXITED` latest exited children,
+        with ``_lock`` held."""
+        exited = [
+            child_id for child_id, child in self.children.items()
+            if child.proc.poll() is not None
+        ]
+        for child_id in exited[:max(len(exited) - KEEP_EXITED, 0)]:
+            del self.children[child_id]
+
+    def _children(self) -> List[Child]:
+        with self._lock:
+            return list(self.children.values())
+
+    def _child(self, child_id: str) -> Child:
+        with self._lock:
+            return self.children[child_id]
+
+    @staticmethod
+    def _pump(child: Child, handle, function):
+        with handle:
+            for raw in handle:
+                line = raw.decode("utf-8", errors="replace").rstrip("\n")
+                child.tail.append(line)
+                function("[%s] %s", child.id, line)
+
+    def _stop(self, fields: dict) -> dict:
+        child = self._child(fields["id"])
+        timeout = float(fields.get("timeout", 10.0))
+
+        if child.proc.poll() is None:
+            child.proc.send_signal(signal.SIGTERM)
+            try:
+                child.proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                child.proc.kill()
+                child.proc.wait()
+
+        return child.status()
+
+    def _status(self, fields: dict) -> dict:
+        if "id" in fields:
+            child = self._child(fields["id"])
+            lines = int(fields.get("lines", 20))
+            return {**child.status(), "tail": list(child.tail)[-lines:]}
+        return {
+            "pid": os.getpid(),
+            "uptime": time.monotonic() - self.started,
+            "children": [child.status() for child in self._children()],
+        }
+
+    def _metrics(self, fields: dict) -> dict:
+        with self._lock:
+            metrics = {
+                "requests": dict(self._requests),
+                "errors": dict(self._errors),
+                "duration": dict(self._durations),
+            }
+        return {
+            "uptime": time.monotonic() - self.started,
+            **metrics,
+            "children_running": sum(
+                child.proc.poll() is None for child in self._children()
+            ),
+        }
+
+    # ---- requests ----
+
+    def handle(self, request: dict) -> dict:
+        start = time.monotonic()
+        command = request.get("command")
+        fields = {k: v for k, v in request.items() if k != "command"}
+
+        try:
+            handler = self.handlers[command]
+        except KeyError:
+            return {"ok": False, "error": f"Unknown command {command!r}"}
+
+        with self._lock:
+            self._requests[command] += 1
+        try:
+            if command in self.exclusive:
+                with self._exclusive_lock:
+                    result = handler(fields)
+            else:
+                result = handler(fields)
+        except Exception as e:
+            with self._lock:
+                self._errors[command] += 1
+            _logger.exception("%s failed", command)
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        else:
+            response = {"ok": True, "result": result}
+        finally:
+            duration = time.monotonic() - start
+            with self._lock:
+                self._durations[command] += duration
+
+        response["duration"] = duration
+        return response
+
+    def shutdown(self, timeout: float = 10.0):
+        for child in self._children():
+            if child.proc.poll() is None:
+                self._stop({"id": child.id, "timeout": timeout})
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Expected a JSON object")
+            except ValueError as e:
+                response = {"ok": False, "error": f"Invalid request: {e}"}
+            else:
+                response = self.server.service.handle(request)
+            self.wfile.write(json.dumps(response, default=to_jsonable).encode() + b"\n")
+            self.wfile.flush()
+
+
+class WrapperServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: pathlib.Path, service: Service):
+        self.service = service
+        _remove_stale_socket(socket_path)
+        super().__init__(os.fspath(socket_path), _RequestHandler)
+        os.chmod(socket_path, 0o600)
+
+
+def _remove_stale_socket(socket_path: pathlib.Path):
+    if not socket_path.exists():
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(os.fspath(socket_path))
+        except OSError:
+            socket_path.unlink()
+        else:
+            raise RuntimeError(f"Another server is listening on {socket_path}")
+
+
+def serve(
+        socket_path: pathlib.Path,
+        service: Service,
+):
+    """Serve ``service`` on ``socket_path`` until SIGTERM/SIGINT."""
+    server = WrapperServer(socket_path, service)
+
+    def _shutdown(signum, frame):
+        _logger.info("Received signal %s, shutting down", signum)
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    _logger.info("Listening on %s", socket_path.as_posix())
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+        service.shutdown()
+
+
+def request(
+        socket_path: pathlib.Path,
+        command: str,
+        **fields,
+) -> dict:
+    """Send a single request to a running server and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(os.fspath(socket_path))
+        with sock.makefile("rwb") as fo:
+            request = json.dumps({"command": command, **fields}, default=to_jsonable)
+            fo.write(request.encode() + b"\n")
+            fo.flush()
+            return json.loads(fo.readline())
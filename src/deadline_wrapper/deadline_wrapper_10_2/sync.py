@@ -0,0 +1,203 @@
+"""
+Incremental sync of a local directory into the repository's ``custom/`` tree.
+
+A local index remembers size, mtime and digest of every source file that was
+pushed. On resync only files whose size or mtime changed are hashed, and only
+files whose digest changed are copied. Copies are atomic (temporary file and
+rename), so workers never load a half-written plugin.
+
+The destination is trusted to still hold what was synced before. Remove the
+index file to force a full resync.
+"""
+
+import concurrent.futures
+import dataclasses
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from deadline_wrapper.deadline_wrapper_10_2.fsutil import (
+    atomic_copy,
+    atomic_write_bytes,
+    file_digest,
+    prune_empty_dirs,
+)
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+INDEX_VERSION = 1
+
+EXCLUDE_PATTERNS = (
+    ".git",
+    "__pycache__",
+    "*.pyc",
+    ".*.tmp-*",
+)
+
+
+@dataclasses.dataclass
+class SyncStats:
+    scanned: int = 0
+    hashed: int = 0
+    copied: int = 0
+    deleted: int = 0
+    duration: float = 0.0
+
+
+def default_index_path(
+        source: pathlib.Path,
+        destination: pathlib.Path,
+) -> pathlib.Path:
+    cache = pathlib.Path(
+        os.environ.get("XDG_CACHE_HOME", pathlib.Path.home() / ".cache")
+    )
+    key = hashlib.sha1(
+        f"{source.resolve().as_posix()}\0{destination.resolve().as_posix()}".encode()
+    ).hexdigest()
+    return cache / "deadline-wrapper" / "sync" / f"{key}.json"
+
+
+def load_index(path: pathlib.Path) -> Dict[str, list]:
+    """``{relpath: [size, mtime_ns, digest]}`` or an empty dict."""
+    try:
+        with open(path, "r") as fo:
+            index = json.load(fo)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != INDEX_VERSION:
+        return {}
+    return index.get("files", {})
+
+
+def save_index(
+        path: pathlib.Path,
+        files: Dict[str, list],
+):
+    atomic_write_bytes(
+        path,
+        json.dumps({"version": INDEX_VERSION, "files": files}).encode(),
+    )
+
+
+def scan(
+        root: pathlib.Path,
+        exclude: Iterable[str] = EXCLUDE_PATTERNS,
+) -> Iterator[Tuple[str, os.stat_result]]:
+    """Yield ``(relpath, stat)`` for every regular file below ``root``."""
+    exclude = tuple(exclude)
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for entry in it:
+                if any(fnmatch.fnmatch(entry.name, pattern) for pattern in exclude):
+                    continue
+                rel = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(rel)
+                elif entry.is_file():
+                    yield rel, entry.stat()
+
+
+def sync_tree(
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        index_path: Optional[pathlib.Path] = None,
+        delete: bool = False,
+        jobs: Optional[int] = None,
+        exclude: Iterable[str] = EXCLUDE_PATTERNS,
+) -> SyncStats:
+    """Copy new and changed files from ``source`` to ``destination``.
+
+    Args:
+      source (pathlib.Path): local tree
+      destination (pathlib.Path): tree to update
+      index_path (pathlib.Path): index file, see :func:`default_index_path`
+      delete (bool): remove files from ``destination`` that were synced
+          before but no longer exist in ``source``. Files that were never
+          synced by us are left alone.
+      jobs (int): threads used to hash and copy
+      exclude (Iterable[str]): file and directory name patterns to skip
+
+    Returns:
+      :obj:`SyncStats`
+    """
+    start = time.monotonic()
+    stats = SyncStats()
+
+    if index_path is None:
+        index_path = default_index_path(source, destination)
+
+    previous = load_index(index_path)
+    current: Dict[str, list] = {}
+    candidates = []
+
+    for rel, st in scan(source, exclude=exclude):
+        stats.scanned += 1
+        entry = previous.get(rel)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            current[rel] = entry
+        else:
+            candidates.append((rel, st))
+
+    def _hash(item):
+        rel, st = item
+        return rel, [st.st_size, st.st_mtime_ns, file_digest(source / rel)]
+
+    def _copy(rel):
+        atomic_copy(source / rel, destination / rel)
+        return rel
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        changed = []
+        for rel, entry in executor.map(_hash, candidates):
+            stats.hashed += 1
+            old = previous.get(rel)
+            if old is not None and old[2] == entry[2]:
+                # Touched but identical
+                current[rel] = entry
+            else:
+                changed.append((rel, entry))
+
+        futures = {executor.submit(_copy, rel): entry for rel, entry in changed}
+        errors = []
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                rel = future.result()
+            except OSError as e:
+                # Not recorded in the index, so it is retried next time
+                errors.append(e)
+                _logger.error("Failed to sync: %s", e)
+            else:
+                current[rel] = futures[future]
+                stats.copied += 1
+                _logger.debug("%s synced", rel)
+
+    stale = previous.keys() - current.keys() - {rel for rel, _ in candidates}
+    for rel in sorted(stale):
+        if delete:
+            path = destination / rel
+            path.unlink(missing_ok=True)
+            prune_empty_dirs(path.parent, destination)
+            stats.deleted += 1
+            _logger.debug("%s deleted", rel)
+        else:
+            current[rel] = previous[rel]
+
+    save_index(index_path, current)
+    stats.duration = time.monotonic() - start
+
+    if errors:
+        raise OSError(f"{len(errors)} file(s) failed to sync, first error: {errors[0]}")
+
+    return stats
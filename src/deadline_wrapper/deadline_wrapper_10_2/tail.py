@@ -0,0 +1,259 @@
+"""
+Follow the log files Deadline daemons write to disk.
+
+The daemons log in detail to files under :data:`DEFAULT_LOG_DIR`, not to the
+stdout :func:`~deadline_wrapper.deadline_wrapper_10_2.deadline_wrapper.runner`
+captures. :class:`LogTailer` watches that directory with inotify (or polls if
+inotify is not available), reads appended bytes with large unbuffered reads
+and hands every complete line to a callback together with the file name it
+came from. Rotated (renamed, deleted or truncated) files are followed to
+their replacement.
+"""
+
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import pathlib
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, Optional, Set
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+DEFAULT_LOG_DIR = pathlib.Path("/var/log/Thinkbox/Deadline10")
+
+READ_SIZE = 1024 * 1024
+# Longest partial line kept while waiting for its newline
+MAX_LINE = 1024 * 1024
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+
+_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Minimal inotify binding for a single directory."""
+
+    MASK = (
+        IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    )
+
+    def __init__(self, directory: pathlib.Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, os.strerror(errno), os.fspath(directory))
+
+    def read(self, timeout: float) -> Optional[Set[str]]:
+        """Names of the files with events, ``None`` if a rescan is needed."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        names = set()
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF):
+                return None
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _TrackedFile:
+
+    def __init__(self, path: pathlib.Path, from_start: bool):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        st = os.fstat(self.fd)
+        self.inode = (st.st_dev, st.st_ino)
+        self.offset = 0 if from_start else st.st_size
+        self.partial = b""
+
+    def read(self, emit: Callable[[str, str], None], final: bool = False):
+        """Emit every complete line appended since the last read."""
+        while True:
+            chunk = os.pread(self.fd, READ_SIZE, self.offset)
+            if not chunk:
+                break
+            self.offset += len(chunk)
+            lines = (self.partial + chunk).split(b"\n")
+            self.partial = lines.pop()
+            if len(self.partial) > MAX_LINE:
+                lines.append(self.partial)
+                self.partial = b""
+            for line in lines:
+                text = line.decode("utf-8", errors="replace").rstrip("\r")
+                emit(self.path.name, text)
+
+        if final and self.partial:
+            emit(self.path.name, self.partial.decode("utf-8", errors="replace"))
+            self.partial = b""
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LogTailer(threading.Thread):
+    """Tail all files matching ``pattern`` in ``directory``.
+
+    Args:
+      directory (pathlib.Path): directory to watch, may not exist yet
+      emit (Callable[[str, str], None]): called with file name and line
+      pattern (str): file name pattern to follow
+      poll_interval (float): seconds between checks without inotify, and
+          between full rescans with inotify
+      from_start (bool): emit the existing content of files found at start
+          (files appearing later are always read from the start)
+    """
+
+    def __init__(
+            self,
+            directory: pathlib.Path,
+            emit: Callable[[str, str], None],
+            pattern: str = "*.log",
+            poll_interval: float = 0.5,
+            from_start: bool = False,
+    ):
+        super().__init__(name=f"tail-{directory.name}", daemon=True)
+        self.directory = directory
+        self.emit = emit
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.from_start = from_start
+        self.files: Dict[str, _TrackedFile] = {}
+        self._stop_event = threading.Event()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Read what is left, then stop the thread."""
+        self._stop_event.set()
+        self.join(timeout)
+
+    def _check(self, name: str, new: bool):
+        path = self.directory / name
+        tracked = self.files.get(name)
+
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            st = None
+
+        if tracked is not None:
+            if st is not None and (st.st_dev, st.st_ino) == tracked.inode:
+                if st.st_size < tracked.offset:
+                    _logger.debug("%s truncated", path)
+                    tracked.offset = 0
+                    tracked.partial = b""
+                tracked.read(self.emit)
+                return
+            # Rotated away or deleted: drain the old file, follow the new one
+            tracked.read(self.emit, final=True)
+            tracked.close()
+            del self.files[name]
+            new = True
+
+        if st is not None and fnmatch.fnmatch(name, self.pattern):
+            try:
+                tracked = _TrackedFile(path, from_start=new)
+            except FileNotFoundError:
+                return
+            self.files[name] = tracked
+            tracked.read(self.emit)
+
+    def _rescan(self, initial: bool = False):
+        names = set(self.files)
+        if self.directory.is_dir():
+            names.update(
+                entry.name for entry in os.scandir(self.directory)
+                if entry.is_file() and fnmatch.fnmatch(entry.name, self.pattern)
+            )
+        for name in sorted(names):
+            self._check(
+                name,
+                new=self.from_start if initial else name not in self.files,
+            )
+
+    def _watch(self) -> Optional[_Inotify]:
+        try:
+            return _Inotify(self.directory)
+        except (OSError, AttributeError) as e:
+            # AttributeError: libc without inotify
+            _logger.debug("inotify not available (%s), polling %s", e, self.directory)
+            return None
+
+    def run(self):
+        while not self.directory.is_dir():
+            if self._stop_event.wait(self.poll_interval):
+                return
+
+        self._rescan(initial=True)
+        inotify = self._watch()
+        last_rescan = time.monotonic()
+
+        try:
+            while not self._stop_event.is_set():
+                if inotify is None:
+                    self._stop_event.wait(self.poll_interval)
+                    self._rescan()
+                    continue
+
+                names = inotify.read(self.poll_interval)
+                if names is None:
+                    # Overflow or the directory itself went away
+                    inotify.close()
+                    inotify = self._watch() if self.directory.is_dir() else None
+                    self._rescan()
+                    last_rescan = time.monotonic()
+                    continue
+
+                for name in sorted(names):
+                    self._check(name, new=name not in self.files)
+
+                if time.monotonic() - last_rescan >= self.poll_interval * 10:
+                    self._rescan()
+                    last_rescan = time.monotonic()
+
+            self._rescan()
+        finally:
+            if inotify is not None:
+                inotify.close()
+            for tracked in self.files.values():
+                tracked.read(self.emit, final=True)
+                tracked.close()
+            self.files.clear()
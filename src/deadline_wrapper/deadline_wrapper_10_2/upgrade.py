@@ -0,0 +1,227 @@
+"""
+In-place upgrade of an installed prefix from a freshly installed staging tree.
+
+The staging tree is compared to the live prefix by size and digest, and only
+added, changed and removed files are applied. Files are moved into place with
+:func:`os.replace`, which is atomic per file: running daemons keep the inodes
+they already have open and never see a partially written file.
+
+:func:`staging_dir` is inside the prefix (and skipped by :func:`diff_trees`),
+so it is on the same filesystem even when the prefix is a mount point. A
+file that still ends up on another filesystem (a nested mount) is copied
+next to its destination and renamed from there.
+
+There is no rollback: if applying fails half way, the prefix is a mix of
+both versions. The install is then marked ``failed`` in the prefix lock and
+the next install reinstalls from scratch, see
+:attr:`~deadline_wrapper.deadline_wrapper_10_2.locking.PrefixLock.interrupted`.
+"""
+
+import dataclasses
+import errno
+import fnmatch
+import logging
+import os
+import pathlib
+import shutil
+from typing import Dict, Iterable, List, Tuple
+
+from deadline_wrapper.deadline_wrapper_10_2.clone import (
+    MUTABLE_PATTERNS,
+    is_mutable,
+    replace_path,
+    retarget_link,
+)
+from deadline_wrapper.deadline_wrapper_10_2.fsutil import (
+    RESERVED_PREFIX,
+    atomic_copy,
+    file_digest,
+    is_reserved,
+    temp_path,
+)
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+# Local state in the repository that the installer must not touch
+REPOSITORY_PRESERVE = (
+    "custom/*",
+    "jobs/*",
+    "jobsArchived/*",
+    "reports/*",
+)
+
+
+@dataclasses.dataclass
+class TreeDiff:
+    added: List[str] = dataclasses.field(default_factory=list)
+    changed: List[str] = dataclasses.field(default_factory=list)
+    removed: List[str] = dataclasses.field(default_factory=list)
+    unchanged: int = 0
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+
+def staging_dir(prefix: pathlib.Path) -> pathlib.Path:
+    return prefix / f"{RESERVED_PREFIX}upgrade"
+
+
+def relocate(
+        root: pathlib.Path,
+        old: pathlib.Path,
+        new: pathlib.Path,
+        patterns: Iterable[str] = MUTABLE_PATTERNS,
+) -> int:
+    """Replace the path ``old`` with ``new`` in the mutable files and the
+    absolute symlinks below ``root``, so a tree installed into the staging
+    dir refers to the prefix.
+
+    Returns:
+        int: number of rewritten files and symlinks
+    """
+    patterns = tuple(patterns)
+    rewritten = 0
+
+    for dirpath, dirs, files in os.walk(root):
+        for name in [*dirs, *files]:
+            path = os.path.join(dirpath, name)
+            if not os.path.islink(path):
+                continue
+            link = os.readlink(path)
+            target = retarget_link(link, os.fspath(old), os.fspath(new))
+            if target != link:
+                os.unlink(path)
+                os.symlink(target, path)
+                rewritten += 1
+
+        for name in files:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path) or not is_mutable(name, patterns):
+                continue
+            with open(path, "rb") as fo:
+                data = fo.read()
+            relocated = replace_path(data, old, new)
+            if relocated != data:
+                with open(path, "wb") as fo:
+                    fo.write(relocated)
+                rewritten += 1
+
+    return rewritten
+
+
+def _walk(
+        root: pathlib.Path,
+        preserve: Tuple[str, ...],
+) -> Dict[str, Tuple[str, object]]:
+    """``{relpath: (kind, detail)}`` with kind ``dir``, ``link`` or ``file``."""
+    entries = {}
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for entry in it:
+                if is_reserved(entry.name):
+                    continue
+                rel = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                if any(fnmatch.fnmatch(rel, pattern) for pattern in preserve):
+                    continue
+                if entry.is_symlink():
+                    entries[rel] = ("link", os.readlink(entry.path))
+                elif entry.is_dir():
+                    entries[rel] = ("dir", None)
+                    stack.append(rel)
+                else:
+                    entries[rel] = ("file", entry.stat().st_size)
+    return entries
+
+
+def diff_trees(
+        new: pathlib.Path,
+        live: pathlib.Path,
+        preserve: Iterable[str] = (),
+) -> TreeDiff:
+    """Compare ``new`` against ``live``.
+
+    Files are compared by size first and by digest only if the sizes match.
+    Paths matching a ``preserve`` pattern (:mod:`fnmatch` on the relative
+    path) are ignored on both sides.
+    """
+    preserve = tuple(preserve)
+    new_entries = _walk(new, preserve)
+    live_entries = _walk(live, preserve)
+    diff = TreeDiff()
+
+    for rel, (kind, detail) in sorted(new_entries.items()):
+        other = live_entries.get(rel)
+        if other is None:
+            diff.added.append(rel)
+        elif other[0] != kind:
+            diff.changed.append(rel)
+        elif kind == "dir":
+            continue
+        elif detail != other[1]:
+            diff.changed.append(rel)
+        elif kind == "file" and file_digest(new / rel) != file_digest(live / rel):
+            diff.changed.append(rel)
+        else:
+            diff.unchanged += 1
+
+    # Deepest first, so directories are emptied before they are removed
+    diff.removed = sorted(live_entries.keys() - new_entries.keys(), reverse=True)
+
+    return diff
+
+
+def _remove(path: pathlib.Path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def apply_diff(
+        diff: TreeDiff,
+        new: pathlib.Path,
+        live: pathlib.Path,
+):
+    """Move added and changed entries from ``new`` into ``live`` and delete
+    removed ones. ``new`` is consumed in the process."""
+    for rel in diff.added + diff.changed:
+        src = new / rel
+        dst = live / rel
+
+        if src.is_dir() and not src.is_symlink():
+            if os.path.lexists(dst) and (dst.is_symlink() or not dst.is_dir()):
+                _remove(dst)
+            dst.mkdir(exist_ok=True)
+            shutil.copystat(src, dst)
+            continue
+
+        if dst.is_dir() and not dst.is_symlink():
+            shutil.rmtree(dst)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(src, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            if src.is_symlink():
+                tmp = temp_path(dst)
+                os.symlink(os.readlink(src), tmp)
+                os.replace(tmp, dst)
+            else:
+                atomic_copy(src, dst)
+        _logger.debug("%s replaced", dst.as_posix())
+
+    for rel in diff.removed:
+        path = live / rel
+        if not os.path.lexists(path):
+            # Already removed with its parent directory
+            continue
+        _remove(path)
+        _logger.debug("%s removed", path.as_posix())
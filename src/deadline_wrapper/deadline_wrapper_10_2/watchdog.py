@@ -0,0 +1,220 @@
+"""
+Detect and stop hung Deadline daemons.
+
+A hung ``deadlineworker`` or ``deadlinercs`` keeps its process alive, so
+waiting for it to exit never returns. :class:`Watchdog` periodically looks
+for signs of life:
+
+- output (the caller reports every line with :meth:`Watchdog.touch`)
+- CPU time of the process and its descendants, sampled from ``/proc``
+- optionally, whether a TCP port accepts connections
+
+If none of them showed up for :attr:`WatchdogConfig.silence_timeout`
+seconds, the child is considered hung: an incident is recorded with the
+recent output, and the child gets SIGTERM and, after
+:attr:`WatchdogConfig.term_timeout`, SIGKILL. Restarting is up to the
+caller, see :attr:`Watchdog.fired`.
+"""
+
+import collections
+import dataclasses
+import json
+import logging
+import os
+import pathlib
+import signal
+import socket
+import subprocess
+import threading
+import time
+from typing import Deque, Dict, Optional
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+_logger = logging.getLogger(__name__)
+
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+@dataclasses.dataclass
+class WatchdogConfig:
+    # Seconds without output, CPU use or open port before the child is hung
+    silence_timeout: float = 600.0
+    # CPU use (fraction of one core) above which the child counts as busy
+    cpu_threshold: float = 0.05
+    port: Optional[int] = None
+    host: str = "127.0.0.1"
+    interval: float = 5.0
+    term_timeout: float = 30.0
+    # None: restart forever
+    max_restarts: Optional[int] = 3
+    # JSON lines file incidents are appended to
+    incidents: Optional[pathlib.Path] = None
+    tail_lines: int = 100
+
+
+def _proc_stat(pid: int) -> Optional[tuple]:
+    """``(ppid, utime + stime)`` in clock ticks, ``None`` if gone."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as fo:
+            data = fo.read()
+    except OSError:
+        return None
+    # The command name may contain spaces and parentheses
+    fields = data[data.rindex(b")") + 2:].split()
+    return int(fields[1]), int(fields[11]) + int(fields[12])
+
+
+def tree_cpu_ticks(pid: int) -> Optional[int]:
+    """CPU clock ticks used by ``pid`` and all its descendants so far."""
+    stats: Dict[int, tuple] = {}
+    for entry in os.scandir("/proc"):
+        if entry.name.isdigit():
+            stat = _proc_stat(int(entry.name))
+            if stat is not None:
+                stats[int(entry.name)] = stat
+
+    if pid not in stats:
+        return None
+
+    children = collections.defaultdict(list)
+    for child, (ppid, _) in stats.items():
+        children[ppid].append(child)
+
+    ticks = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        ticks += stats[current][1]
+        stack.extend(children[current])
+    return ticks
+
+
+def port_alive(host: str, port: int, timeout: float = 1.0) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class Watchdog(threading.Thread):
+    """Watch ``proc`` and stop it when it hangs.
+
+    Args:
+      proc (subprocess.Popen): child to watch
+      config (WatchdogConfig): thresholds
+      tail (Deque[str]): recent output, recorded with an incident
+    """
+
+    def __init__(
+            self,
+            proc: subprocess.Popen,
+            config: WatchdogConfig,
+            tail: Optional[Deque[str]] = None,
+    ):
+        super().__init__(name=f"watchdog-{proc.pid}", daemon=True)
+        self.proc = proc
+        self.config = config
+        if tail is None:
+            tail = collections.deque(maxlen=config.tail_lines)
+        self.tail = tail
+        self.fired = False
+        self.last_output = time.monotonic()
+        self.last_alive = self.last_output
+        self._stop_event = threading.Event()
+
+    def touch(self, line: Optional[str] = None):
+        """Report output of the child."""
+        self.last_output = time.monotonic()
+        if line is not None:
+            self.tail.append(line)
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+    def run(self):
+        config = self.config
+        last_ticks = tree_cpu_ticks(self.proc.pid)
+        last_sample = time.monotonic()
+
+        while not self._stop_event.wait(config.interval):
+            if self.proc.poll() is not None:
+                return
+
+            now = time.monotonic()
+            ticks = tree_cpu_ticks(self.proc.pid)
+            if ticks is None:
+                return
+            elapsed = max(now - last_sample, 1e-6)
+            cpu = (ticks - (last_ticks or 0)) / CLOCK_TICKS / elapsed
+            last_ticks, last_sample = ticks, now
+
+            port = None
+            if config.port is not None:
+                port = port_alive(config.host, config.port)
+
+            self.last_alive = max(self.last_alive, self.last_output)
+            if cpu >= config.cpu_threshold or port:
+                self.last_alive = now
+
+            if now - self.last_alive >= config.silence_timeout:
+                self._fire(silence=now - self.last_output, cpu=cpu, port=port)
+                return
+
+    def _fire(self, silence: float, cpu: float, port: Optional[bool]):
+        self.fired = True
+        incident = {
+            "time": time.time(),
+            "pid": self.proc.pid,
+            "cmd": self.proc.args,
+            "silence": silence,
+            "cpu": cpu,
+            "port": port,
+            "tail": list(self.tail),
+        }
+        _logger.error(
+            "%s (pid %s) looks hung: no output for %.0fs, cpu %.3f, port %s. "
+            "Last output:\n%s",
+            self.proc.args, self.proc.pid, silence, cpu, port,
+            "\n".join(list(self.tail)[-20:]),
+        )
+
+        if self.config.incidents is not None:
+            self.config.incidents.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.config.incidents, "a") as fo:
+                fo.write(json.dumps(incident, default=str) + "\n")
+
+        terminate(self.proc, self.config.term_timeout)
+
+
+def _signal(proc: subprocess.Popen, signum: int):
+    # Children started with start_new_session=True are signalled as a whole
+    # process group, so descendants do not keep the output pipes open.
+    try:
+        if os.getpgid(proc.pid) == proc.pid:
+            os.killpg(proc.pid, signum)
+        else:
+            proc.send_signal(signum)
+    except ProcessLookupError:
+        pass
+
+
+def terminate(
+        proc: subprocess.Popen,
+        timeout: float,
+) -> int:
+    """SIGTERM, then SIGKILL after ``timeout`` seconds. Returns the exit code."""
+    if proc.poll() is None:
+        _signal(proc, signal.SIGTERM)
+        try:
+            proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            _logger.error("%s (pid %s) ignored SIGTERM, killing", proc.args, proc.pid)
+            _signal(proc, signal.SIGKILL)
+    return proc.wait()
@@ -0,0 +1,144 @@
+import sys
+import time
+
+from deadline_wrapper.deadline_wrapper_10_2 import autoscale
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+# Prints its instance name, then waits to be stopped
+FAKE_WORKER = [
+    sys.executable, "-c",
+    "import sys, time; print(sys.argv[-1], flush=True); time.sleep(60)",
+]
+
+IDLE = autoscale.HostLoad(load=0.1, cpus=4, mem_total=100, mem_available=80)
+
+
+class Demand(autoscale.DemandSource):
+
+    def __init__(self, value):
+        self.value = value
+
+    def pending(self):
+        return self.value
+
+
+def test_read_host_load(tmp_path):
+    (tmp_path / "loadavg").write_text("3.50 2.00 1.00 2/345 6789\n")
+    (tmp_path / "meminfo").write_text(
+        "MemTotal:       16000000 kB\n"
+        "MemFree:         1000000 kB\n"
+        "MemAvailable:    4000000 kB\n"
+    )
+
+    load = autoscale.read_host_load(tmp_path)
+
+    assert load.load == 3.5
+    assert load.mem_available_fraction == 0.25
+
+
+def test_file_demand(tmp_path):
+    path = tmp_path / "pending"
+    demand = autoscale.demand_source(path.as_posix())
+
+    assert demand.pending() is None
+    path.write_text("7\n")
+    assert demand.pending() == 7
+    path.write_text('{"pending": 3}')
+    assert demand.pending() == 3
+
+
+def test_desired_workers():
+    config = autoscale.AutoscaleConfig(min_workers=1, max_workers=4, tasks_per_worker=2)
+    busy = autoscale.HostLoad(load=8.0, cpus=4, mem_total=100, mem_available=80)
+    swapping = autoscale.HostLoad(load=0.1, cpus=4, mem_total=100, mem_available=5)
+
+    assert autoscale.desired_workers(1, 5, IDLE, config) == 3
+    assert autoscale.desired_workers(1, 100, IDLE, config) == 4
+    assert autoscale.desired_workers(3, 0, IDLE, config) == 1
+    assert autoscale.desired_workers(2, None, IDLE, config) == 2
+    # No headroom
+    assert autoscale.desired_workers(2, 100, busy, config) == 2
+    assert autoscale.desired_workers(3, 100, swapping, config) == 2
+
+
+def test_autoscaler():
+    demand = Demand(2)
+    scaler = autoscale.Autoscaler(
+        cmd=FAKE_WORKER,
+        demand=demand,
+        config=autoscale.AutoscaleConfig(
+            max_workers=3,
+            scale_up_after=2,
+            scale_down_after=2,
+            cooldown=0.0,
+            drain_timeout=5.0,
+        ),
+        read_load=lambda: IDLE,
+    )
+
+    try:
+        # Hysteresis: the first check only counts
+        assert scaler.step() == 0
+        assert scaler.step() == 2
+        assert sorted(scaler.instances) == ["autoscale-01", "autoscale-02"]
+
+        demand.value = 1
+        assert scaler.step() == 2
+        assert scaler.step() == 1
+        # The newest instance is drained
+        assert scaler.instances["autoscale-02"].draining is not None
+
+        for _ in range(50):
+            scaler.reap()
+            if len(scaler.instances) == 1:
+                break
+            time.sleep(0.1)
+        assert list(scaler.instances) == ["autoscale-01"]
+    finally:
+        scaler.shutdown()
+
+    assert scaler.instances == {}
+
+
+def _scaler(drain_cmd, drain_timeout):
+    return autoscale.Autoscaler(
+        cmd=FAKE_WORKER,
+        demand=Demand(1),
+        config=autoscale.AutoscaleConfig(
+            min_workers=1,
+            max_workers=1,
+            drain_timeout=drain_timeout,
+        ),
+        drain_cmd=drain_cmd,
+        read_load=lambda: IDLE,
+    )
+
+
+def test_drain_does_not_block():
+    # A drain command that hangs
+    scaler = _scaler(
+        lambda name: [sys.executable, "-c", "import time; time.sleep(60)"],
+        drain_timeout=0.5,
+    )
+    assert scaler.step() == 1
+
+    start = time.monotonic()
+    scaler.shutdown()
+    assert time.monotonic() - start < 10.0
+    assert scaler.instances == {}
+
+
+def test_drain_failure_falls_back_to_signal():
+    scaler = _scaler(
+        lambda name: [sys.executable, "-c", "raise SystemExit(1)"],
+        drain_timeout=60.0,
+    )
+    assert scaler.step() == 1
+
+    start = time.monotonic()
+    scaler.shutdown()
+    assert time.monotonic() - start < 10.0
+    assert scaler.instances == {}
@@ -0,0 +1,82 @@
+import io
+import json
+import threading
+import time
+
+from deadline_wrapper.deadline_wrapper_10_2 import batch
+
+
+def _validate(sub_command, fields):
+    if sub_command not in ("sleep", "fail"):
+        raise ValueError(f"Unsupported sub_command {sub_command!r}")
+    return sub_command, fields
+
+
+def _run(lines, **kwargs):
+    output = io.StringIO()
+    executed = []
+
+    def _execute(prepared):
+        sub_command, fields = prepared
+        executed.append(threading.current_thread().name)
+        if sub_command == "fail":
+            raise RuntimeError("boom")
+        time.sleep(fields.get("seconds", 0))
+        return fields
+
+    failures = batch.run_batch(
+        lines=[json.dumps(line) if isinstance(line, dict) else line for line in lines],
+        validate=_validate,
+        execute=_execute,
+        output=output,
+        **kwargs,
+    )
+    return failures, [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_run_batch_results():
+    failures, results = _run([
+        {"id": "a", "sub_command": "sleep"},
+        "not json",
+        {"id": "c", "sub_command": "nope"},
+        {"id": "b", "sub_command": "fail"},
+        "",
+    ])
+    assert failures == 3
+    assert [(r["index"], r["exit_status"]) for r in results] == [
+        (0, 0), (1, 2), (2, 2), (3, 1),
+    ]
+    assert results[0]["id"] == "a" and results[0]["result"] == {}
+    assert "id" not in results[1]
+    assert (results[2]["id"], results[2]["sub_command"]) == ("c", "nope")
+    assert "RuntimeError: boom" in results[3]["error"]
+
+
+def test_run_batch_parallel_independent():
+    start = time.monotonic()
+    failures, results = _run(
+        [
+            {"id": i, "sub_command": "sleep", "seconds": 0.3, "independent": True}
+            for i in range(4)
+        ]
+        + [{"id": "last", "sub_command": "sleep"}],
+        jobs=4,
+    )
+    assert failures == 0
+    assert time.monotonic() - start < 1.0
+    # The barrier runs after all independent operations finished
+    assert results[-1]["id"] == "last"
+    assert sorted(r["id"] for r in results[:-1]) == [0, 1, 2, 3]
+
+
+def test_run_batch_exclusive():
+    start = time.monotonic()
+    _run(
+        [
+            {"sub_command": "sleep", "seconds": 0.2, "independent": True}
+            for _ in range(3)
+        ],
+        jobs=3,
+        exclusive=("sleep",),
+    )
+    assert time.monotonic() - start >= 0.6
@@ -0,0 +1,86 @@
+import sys
+
+import pytest
+
+from deadline_wrapper.deadline_wrapper_10_2 import child
+
+
+def _python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_run_child_counts_and_keeps_tail():
+    lines = []
+    result = child.run_child(
+        _python(
+            "import sys\n"
+            "for i in range(1000): print(f'line {i}')\n"
+            "print('error', file=sys.stderr)\n"
+        ),
+        functions=(lines.append, lines.append),
+        tail_lines=5,
+    )
+    assert result.returncode == 0
+    assert len(lines) == 1001
+    assert result.stdout.lines == 1000
+    assert result.stdout.bytes == sum(len(f"line {i}\n") for i in range(1000))
+    assert result.stdout.tail == [f"line {i}" for i in range(995, 1000)]
+    assert result.stderr.tail == ["error"]
+    assert len(result.tail) == 5
+    assert child.check_result(result) is result
+
+
+def test_run_child_cuts_long_lines():
+    result = child.run_child(
+        _python(f"print('x' * {child.MAX_LINE_LENGTH * 2 + 1})"),
+        functions=(lambda line: None, lambda line: None),
+    )
+    assert result.stdout.lines == 3
+    assert max(len(line) for line in result.stdout.tail) == child.MAX_LINE_LENGTH
+
+
+def test_check_result_raises_with_tail():
+    result = child.run_child(
+        _python("import sys; print('broken', file=sys.stderr); sys.exit(3)"),
+        functions=(lambda line: None, lambda line: None),
+    )
+    with pytest.raises(child.ChildProcessFailed, match="exited with 3") as e:
+        child.check_result(result)
+    assert "broken" in str(e.value)
+    assert e.value.result.returncode == 3
+
+
+def test_timeout_stops_process_group():
+    result = child.run_child(
+        # The grandchild would keep the pipes open if only the child was stopped
+        _python(
+            "import subprocess, sys, time\n"
+            "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+            "print('waiting for input', flush=True)\n"
+            "time.sleep(60)\n"
+        ),
+        functions=(lambda line: None, lambda line: None),
+        timeout=1.0,
+        start_new_session=True,
+    )
+    assert result.timed_out == "timeout"
+    assert result.duration < 10
+    assert result.tail == ["waiting for input"]
+    with pytest.raises(child.ChildProcessFailed, match="stopped \\(timeout\\)"):
+        child.check_result(result)
+
+
+def test_silence_timeout():
+    result = child.run_child(
+        _python(
+            "import time\n"
+            "for i in range(3):\n"
+            "    print(i, flush=True)\n"
+            "    time.sleep(0.2)\n"
+            "time.sleep(60)\n"
+        ),
+        functions=(lambda line: None, lambda line: None),
+        silence_timeout=1.0,
+    )
+    assert result.timed_out == "silence"
+    assert result.stdout.lines == 3
@@ -0,0 +1,112 @@
+import os
+import pathlib
+
+import pytest
+
+from deadline_wrapper.deadline_wrapper_10_2 import clone
+from deadline_wrapper.deadline_wrapper_10_2.deadline_wrapper import clone_client
+
+
+def _golden(root):
+    (root / "bin").mkdir(parents=True)
+    (root / "bin" / "deadlineworker").write_bytes(b"\x7fELF")
+    (root / "lib").mkdir()
+    (root / "lib" / "libfoo.so").write_bytes(b"lib")
+    os.symlink(root / "lib" / "libfoo.so", root / "lib" / "libfoo.so.1")
+    (root / "deadline.ini").write_text(
+        "[Deadline]\n"
+        f"InstallDir={root.as_posix()}\n"
+        "HttpListenPort=8888\n"
+        "WebServiceHttpListenPort = 8899\n"
+    )
+    return root
+
+
+def test_rewrite_ini_ports():
+    data = b"HttpListenPort=8888\nTlsListenPort=4433\nWebServiceHttpListenPort = 8899\n"
+    applied = set()
+    assert clone.rewrite_ini_ports(
+        data, {"httpport": 9000, "webservice_httpport": 9001}, applied
+    ) == b"HttpListenPort=9000\nTlsListenPort=4433\nWebServiceHttpListenPort = 9001\n"
+    assert applied == {"httpport", "webservice_httpport"}
+
+    applied = set()
+    clone.rewrite_ini_ports(b"TlsListenPort=4433\n", {"httpport": 9000}, applied)
+    assert applied == set()
+
+
+def test_clone_tree(tmp_path):
+    source = _golden(tmp_path / "golden")
+    target = tmp_path / "instance_1"
+
+    stats = clone.clone_tree(
+        source=source,
+        target=target,
+        rewrite=lambda rel, data: clone.rewrite_ini_ports(
+            data.replace(source.as_posix().encode(), target.as_posix().encode()),
+            {"httpport": 9000},
+        ),
+    )
+
+    assert (stats.linked, stats.copied, stats.symlinks) == (2, 1, 1)
+    assert os.path.samefile(
+        source / "bin" / "deadlineworker", target / "bin" / "deadlineworker"
+    )
+    assert (
+        os.readlink(target / "lib" / "libfoo.so.1")
+        == (target / "lib" / "libfoo.so").as_posix()
+    )
+
+    ini = (target / "deadline.ini").read_text()
+    assert f"InstallDir={target.as_posix()}\n" in ini
+    assert "HttpListenPort=9000\n" in ini
+    assert "WebServiceHttpListenPort = 8899\n" in ini
+    assert "HttpListenPort=8888\n" in (source / "deadline.ini").read_text()
+
+
+def test_replace_path():
+    data = b"Root=/opt/D\nBin=/opt/D/bin\nOther=/opt/Deadline10\nX=/x/opt/D\n"
+    assert clone.replace_path(
+        data, pathlib.Path("/opt/D"), pathlib.Path("/opt/E")
+    ) == b"Root=/opt/E\nBin=/opt/E/bin\nOther=/opt/Deadline10\nX=/x/opt/D\n"
+
+
+def test_instance_ini():
+    ports = {"httpport": 9000, "webservice_httpport": 9001}
+    assert clone.instance_ini(
+        b"[Deadline]\nHttpListenPort=8080\n[Other]\nA=1\n", ports
+    ) == (
+        b"[Deadline]\nWebServiceHttpListenPort=9001\n"
+        b"HttpListenPort=9000\n[Other]\nA=1\n"
+    )
+    assert clone.instance_ini(b"", ports) == (
+        b"[Deadline]\nHttpListenPort=9000\nWebServiceHttpListenPort=9001\n"
+    )
+
+
+def test_clone_client_host_ini(tmp_path):
+    source = tmp_path / "Deadline10"
+    _golden(source)
+    # As installed: the settings are in the host's deadline.ini, not the prefix
+    (source / "deadline.ini").unlink()
+    host_ini = tmp_path / "var" / "deadline.ini"
+    host_ini.parent.mkdir()
+    host_ini.write_text(
+        f"[Deadline]\nInstallDir={source.as_posix()}\nHttpListenPort=8080\n"
+    )
+    targets = [tmp_path / "Deadline10_1", tmp_path / "Deadline10_2"]
+
+    clone_client(
+        source=source,
+        targets=targets,
+        httpports=[9000, 9010],
+        webservice_httpports=[9001, 9011],
+        host_ini=host_ini,
+    )
+
+    for target, httpport in zip(targets, [9000, 9010]):
+        ini = (target / clone.INSTANCE_INI).read_text()
+        assert f"InstallDir={target.as_posix()}\n" in ini
+        assert f"HttpListenPort={httpport}\n" in ini
+        assert f"WebServiceHttpListenPort={httpport + 1}\n" in ini
+    assert "8080" in host_ini.read_text()
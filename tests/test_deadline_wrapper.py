@@ -1,8 +1,12 @@
 import pathlib
 import tempfile
 import logging
+import threading
+
+import pytest
 
 import deadline_wrapper.deadline_wrapper_10_2.deadline_wrapper as dw_10_2
+from deadline_wrapper.deadline_wrapper_10_2.locking import LOCK_NAME, PrefixLock
 
 
 def test_deadline_wrapper():
@@ -22,3 +26,97 @@ def test_deadline_wrapper():
             dbhost="localhost",
             dbport=27017,
         )
+
+
+def test_install_client_failure(tmp_path):
+    installer = tmp_path / "installer.run"
+    installer.write_text("#!/bin/sh\necho 'cannot install' >&2\nexit 1\n")
+    installer.chmod(0o755)
+
+    with pytest.raises(dw_10_2.ChildProcessFailed, match="cannot install") as e:
+        dw_10_2.install_client(
+            installer=installer,
+            deadline_version="10.2.1.1",
+            prefix=tmp_path / "Deadline10",
+            repositorydir=tmp_path / "DeadlineRepository10",
+            httpport=8888,
+            webservice_httpport=8899,
+        )
+
+    assert e.value.result.returncode == 1
+    assert e.value.result.stderr.lines == 1
+
+
+def test_install_client_retries(tmp_path):
+    # Hangs on the first run, succeeds on the second
+    installer = tmp_path / "installer.run"
+    installer.write_text(
+        "#!/bin/sh\n"
+        "prefix=$(echo \"$@\" | sed 's/.*--prefix \\([^ ]*\\).*/\\1/')\n"
+        "mkdir -p \"$prefix\"\n"
+        "if [ -e " + (tmp_path / "attempted").as_posix() + " ]; then\n"
+        "    touch \"$prefix/complete\"\n"
+        "    exit 0\n"
+        "fi\n"
+        "touch " + (tmp_path / "attempted").as_posix() + " \"$prefix/partial\"\n"
+        "echo 'Press [Enter] to continue'\n"
+        "sleep 60\n"
+    )
+    installer.chmod(0o755)
+    prefix = tmp_path / "Deadline10"
+
+    result = dw_10_2.install_client(
+        installer=installer,
+        deadline_version="10.2.1.1",
+        prefix=prefix,
+        repositorydir=tmp_path / "DeadlineRepository10",
+        httpport=8888,
+        webservice_httpport=8899,
+        limits=dw_10_2.RunLimits(silence_timeout=1.0, retries=1, backoff=0.0),
+    )
+
+    assert result.returncode == 0
+    assert [attempt.timed_out for attempt in result.attempts] == ["silence"]
+    assert sorted(p.name for p in prefix.iterdir()) == [LOCK_NAME, "complete"]
+
+
+@pytest.mark.parametrize("fields", [
+    {"help": True},
+    # Abbreviation of --help, caught by the parser itself
+    {"h": True},
+    {"version": True},
+    {"trace": "/tmp/trace.json"},
+    {"repositorydir": "/tmp", "source": "/tmp", "bogus": True},
+])
+def test_args_from_fields_rejects(fields, capsys):
+    with pytest.raises(ValueError):
+        dw_10_2.args_from_fields("sync-custom", fields)
+    assert capsys.readouterr().out == ""
+
+
+def test_install_timeout_used_up_by_lock(tmp_path):
+    installer = tmp_path / "installer.run"
+    installer.write_text("#!/bin/sh\ntouch " + (tmp_path / "ran").as_posix() + "\n")
+    installer.chmod(0o755)
+    prefix = tmp_path / "Deadline10"
+
+    # Another node installing for longer than our whole --install-timeout
+    lock = PrefixLock(prefix)
+    lock.acquire()
+    lock.set_state("installing")
+    release = threading.Timer(0.5, lock.release)
+    release.start()
+
+    with pytest.raises(TimeoutError):
+        dw_10_2.install_client(
+            installer=installer,
+            deadline_version="10.2.1.1",
+            prefix=prefix,
+            repositorydir=tmp_path / "DeadlineRepository10",
+            httpport=8888,
+            webservice_httpport=8899,
+            limits=dw_10_2.RunLimits(total_timeout=0.2),
+        )
+    release.join()
+
+    assert not (tmp_path / "ran").exists()
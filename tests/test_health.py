@@ -0,0 +1,93 @@
+import json
+import os
+import pathlib
+import sys
+import threading
+import time
+
+from deadline_wrapper.deadline_wrapper_10_2 import deadline_wrapper, health
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+
+def test_ready_pattern(tmp_path):
+    path = tmp_path / "state.json"
+    state = health.RunnerState(path, ready_pattern=r"Listening on port \d+")
+
+    assert health.check(path) == f"{path} does not exist"
+
+    state.update(status="starting")
+    assert health.check(path) == "status starting"
+
+    state.update(status="running", child_pid=os.getpid())
+    assert health.check(path) == "not ready"
+    assert health.check(path, require_ready=False) is None
+
+    state.output("Starting up")
+    state.output("Listening on port 8888")
+    assert health.check(path) is None
+    assert json.loads(path.read_text())["ready"]
+
+    state.update(status="exited", returncode=1)
+    assert health.check(path) == "status exited"
+
+
+def test_runner_tailed_logs(tmp_path, monkeypatch):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    # Silent on stdout, like a worker that only writes its log file
+    child = [
+        sys.executable, "-c",
+        "import pathlib, time\n"
+        "time.sleep(0.3)\n"
+        f"pathlib.Path({(logs / 'worker.log').as_posix()!r})"
+        ".write_text('Listening on port 8888\\n')\n"
+        "time.sleep(1.0)\n",
+    ]
+    monkeypatch.setattr(deadline_wrapper, "_runner_cmd", lambda **kwargs: child)
+    path = tmp_path / "state.json"
+
+    thread = threading.Thread(target=deadline_wrapper.runner, kwargs=dict(
+        executable=pathlib.Path(sys.executable),
+        nogui=True,
+        nosplash=True,
+        tail_logs=logs,
+        state_file=path,
+        ready_pattern=r"Listening on port \d+",
+    ))
+    thread.start()
+
+    deadline = time.monotonic() + 5.0
+    while health.check(path) is not None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert health.check(path) is None
+    assert json.loads(path.read_text())["last_output"] is not None
+
+    thread.join()
+
+
+def test_silence(tmp_path):
+    path = tmp_path / "state.json"
+    state = health.RunnerState(path)
+    state.update(status="running", child_pid=os.getpid())
+
+    assert health.check(path, max_silence=60) is None
+
+    state.output("Waiting for jobs")
+    state.state["last_output"] -= 3600
+    state.update()
+    assert health.check(path, max_silence=60).startswith("no output for")
+
+
+def test_main(tmp_path, capsys):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps({
+        "status": "running",
+        "child_pid": 2 ** 22 + 1,
+        "ready": True,
+    }))
+
+    assert health.main(["--state-file", path.as_posix()]) == 1
+    assert "is not running" in capsys.readouterr().out
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import threading
+
+import pytest
+
+from deadline_wrapper.deadline_wrapper_10_2 import installer_cache
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+
+@pytest.fixture
+def installer(tmp_path):
+    path = tmp_path / "nfs" / "DeadlineClient-10.2.1.1-linux-x64-installer.run"
+    path.parent.mkdir()
+    path.write_bytes(os.urandom(3 * 1024 * 1024 + 17))
+    path.chmod(0o755)
+    return path
+
+
+def _sha256(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_cache_installer(tmp_path, installer):
+    cache = tmp_path / "cache"
+    sha256 = _sha256(installer)
+
+    cached = installer_cache.cache_installer(
+        installer, cache_dir=cache, sha256=sha256, chunk_size=1024 * 1024,
+    )
+
+    assert cached.parent == cache
+    assert cached.read_bytes() == installer.read_bytes()
+    assert os.access(cached, os.X_OK)
+
+    # The source is not read again
+    installer.unlink()
+    assert installer_cache.cache_installer(
+        installer, cache_dir=cache, sha256=sha256,
+    ) == cached
+
+
+def test_resume(tmp_path, installer):
+    cache = tmp_path / "cache"
+    sha256 = _sha256(installer)
+    target = installer_cache.cache_path(installer, cache, sha256)
+    part = target.with_name(f".{target.name}.part")
+    part.parent.mkdir(parents=True)
+    part.write_bytes(installer.read_bytes()[:1024 * 1024 + 5])
+
+    cached = installer_cache.cache_installer(installer, cache_dir=cache, sha256=sha256)
+
+    assert cached == target
+    assert cached.read_bytes() == installer.read_bytes()
+    assert not part.exists()
+
+
+def test_no_resume_without_sha256(tmp_path, installer):
+    cache = tmp_path / "cache"
+    target = installer_cache.cache_path(installer, cache)
+    part = target.with_name(f".{target.name}.part")
+    part.parent.mkdir(parents=True)
+    # A damaged partial copy, nothing to verify it against
+    part.write_bytes(b"\0" * (1024 * 1024))
+
+    cached = installer_cache.cache_installer(installer, cache_dir=cache)
+
+    assert cached.read_bytes() == installer.read_bytes()
+
+
+def test_checksum_mismatch(tmp_path, installer):
+    cache = tmp_path / "cache"
+
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        installer_cache.cache_installer(installer, cache_dir=cache, sha256="0" * 64)
+
+    assert not any(p.name.endswith(".run") for p in cache.iterdir())
+
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        installer_cache.stage_installer(installer, sha256="0" * 64)
+
+
+def test_concurrent(tmp_path, installer):
+    cache = tmp_path / "cache"
+    results = []
+
+    def _copy():
+        results.append(installer_cache.cache_installer(installer, cache_dir=cache))
+
+    threads = [threading.Thread(target=_copy) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(results)) == 1
+    assert results[0].read_bytes() == installer.read_bytes()
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from deadline_wrapper.deadline_wrapper_10_2.instrumentation import (
+    PhaseHook,
+    Tracer,
+)
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+
+class RecordingHook(PhaseHook):
+
+    def __init__(self):
+        self.calls = []
+
+    def on_phase_start(self, name, attrs):
+        self.calls.append(("start", name))
+
+    def on_phase_end(self, name, duration, attrs, error):
+        self.calls.append(("end", name, type(error).__name__ if error else None))
+
+
+def test_hooks_nested_phases():
+    tracer = Tracer()
+    hook = tracer.register_hook(RecordingHook())
+
+    with tracer.phase("outer"):
+        with tracer.phase("inner"):
+            pass
+
+    assert hook.calls == [
+        ("start", "outer"),
+        ("start", "inner"),
+        ("end", "inner", None),
+        ("end", "outer", None),
+    ]
+    # Not recording by default
+    assert tracer.events == []
+
+    tracer.unregister_hook(hook)
+    with tracer.phase("other"):
+        pass
+    assert len(hook.calls) == 4
+
+
+def test_phase_error():
+    tracer = Tracer()
+    tracer.record = True
+    hook = tracer.register_hook(RecordingHook())
+
+    with pytest.raises(ValueError):
+        with tracer.phase("failing", prefix="/opt"):
+            raise ValueError("boom")
+
+    assert hook.calls[-1] == ("end", "failing", "ValueError")
+    (event,) = tracer.events
+    assert event["args"]["prefix"] == "/opt"
+    assert "boom" in event["args"]["error"]
+
+
+class BrokenHook(PhaseHook):
+
+    def on_phase_start(self, name, attrs):
+        raise RuntimeError("start")
+
+    def on_phase_end(self, name, duration, attrs, error):
+        raise RuntimeError("end")
+
+
+def test_hook_errors_contained():
+    tracer = Tracer()
+    tracer.register_hook(BrokenHook())
+    hook = tracer.register_hook(RecordingHook())
+
+    with tracer.phase("ok"):
+        pass
+
+    # The phase's own error is not masked by the hook's
+    with pytest.raises(ValueError):
+        with tracer.phase("failing"):
+            raise ValueError("boom")
+
+    assert hook.calls == [
+        ("start", "ok"),
+        ("end", "ok", None),
+        ("start", "failing"),
+        ("end", "failing", "ValueError"),
+    ]
+
+
+def test_write_chrome_trace(tmp_path):
+    tracer = Tracer()
+    tracer.record = True
+
+    with tracer.phase("installer", prefix="/opt"):
+        pass
+
+    trace = tmp_path / "trace.json"
+    tracer.write_chrome_trace(trace)
+
+    data = json.loads(trace.read_text())
+    (event,) = data["traceEvents"]
+    assert event["name"] == "installer"
+    assert event["ph"] == "X"
+    assert event["dur"] >= 0
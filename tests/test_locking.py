@@ -0,0 +1,166 @@
+import fcntl
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from deadline_wrapper.deadline_wrapper_10_2 import locking
+from deadline_wrapper.deadline_wrapper_10_2.deadline_wrapper import (
+    empty_dir,
+    install_client,
+)
+from deadline_wrapper.deadline_wrapper_10_2.fsutil import is_empty_dir
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+
+def test_one_install_many_reuses(tmp_path):
+    prefix = tmp_path / "DeadlineRepository10"
+    installs = []
+
+    def _node():
+        with locking.PrefixLock(prefix, poll=0.01, max_poll=0.05) as lock:
+            if not (prefix / "deadline.ini").exists():
+                lock.set_state("installing")
+                installs.append(threading.get_ident())
+                time.sleep(0.2)
+                (prefix / "deadline.ini").write_text("ok")
+            lock.set_state("complete")
+
+    threads = [threading.Thread(target=_node) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(installs) == 1
+    record = json.loads(locking.lock_path(prefix).read_text())
+    assert record["state"] == "complete"
+    assert record["pid"] == os.getpid()
+
+
+def test_interrupted(tmp_path):
+    prefix = tmp_path / "prefix"
+
+    with pytest.raises(RuntimeError):
+        with locking.PrefixLock(prefix) as lock:
+            lock.set_state("installing")
+            raise RuntimeError("installer failed")
+
+    with locking.PrefixLock(prefix) as lock:
+        assert lock.interrupted
+        assert lock.previous["state"] == "failed"
+        lock.set_state("complete")
+
+    with locking.PrefixLock(prefix) as lock:
+        assert not lock.interrupted
+
+
+def test_timeout(tmp_path):
+    prefix = tmp_path / "prefix"
+
+    with locking.PrefixLock(prefix):
+        with pytest.raises(TimeoutError):
+            locking.PrefixLock(prefix, timeout=0.2, poll=0.05).acquire()
+
+
+def test_stale_lock(tmp_path):
+    prefix = tmp_path / "prefix"
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+
+    if None in locking._namespace().values():
+        pytest.skip("No boot id or PID namespace to compare")
+
+    # A lock the file system kept for a process that is gone
+    path = locking.lock_path(prefix)
+    path.parent.mkdir()
+    path.write_text(json.dumps({
+        **locking._namespace(),
+        "pid": dead.pid,
+        "state": "installing",
+    }))
+    with open(path) as lingering:
+        fcntl.flock(lingering, fcntl.LOCK_EX)
+
+        with locking.PrefixLock(prefix, timeout=5.0, poll=0.01) as lock:
+            assert lock.previous == {}
+
+
+def test_stale_lock_other_namespace(tmp_path):
+    prefix = tmp_path / "prefix"
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+
+    # Same hostname, but another container's PID namespace
+    path = locking.lock_path(prefix)
+    path.parent.mkdir()
+    path.write_text(json.dumps({
+        "host": socket.gethostname(),
+        "boot_id": locking._read_boot_id(),
+        "pidns": "pid:[0]",
+        "pid": dead.pid,
+        "state": "installing",
+    }))
+    with open(path) as lingering:
+        fcntl.flock(lingering, fcntl.LOCK_EX)
+
+        with pytest.raises(TimeoutError):
+            locking.PrefixLock(prefix, timeout=0.2, poll=0.05).acquire()
+
+
+def test_empty_dir_keeps_lock(tmp_path):
+    prefix = tmp_path / "prefix"
+
+    with locking.PrefixLock(prefix) as lock:
+        (prefix / "bin").mkdir()
+        (prefix / "deadline.ini").write_text("ok")
+        assert not is_empty_dir(prefix)
+
+        empty_dir(prefix)
+
+        assert is_empty_dir(prefix)
+        assert lock.path.exists()
+
+
+def test_install_client_concurrent(tmp_path):
+    installer = tmp_path / "installer.py"
+    installer.write_text(
+        "#!" + sys.executable + "\n"
+        "import pathlib, sys, time\n"
+        "prefix = pathlib.Path(sys.argv[sys.argv.index('--prefix') + 1])\n"
+        "time.sleep(0.2)\n"
+        "prefix.mkdir(parents=True, exist_ok=True)\n"
+        "with open(prefix.parent / 'runs', 'a') as fo:\n"
+        "    fo.write('run\\n')\n"
+        "(prefix / 'deadline.ini').write_text('ok')\n"
+    )
+    installer.chmod(0o755)
+    prefix = tmp_path / "Deadline10"
+    results = []
+
+    def _node():
+        results.append(install_client(
+            installer=installer,
+            deadline_version="10.2.1.1",
+            prefix=prefix,
+            repositorydir=tmp_path / "DeadlineRepository10",
+            httpport=8888,
+            webservice_httpport=8899,
+        ))
+
+    threads = [threading.Thread(target=_node) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert (tmp_path / "runs").read_text() == "run\n"
+    assert sum(result is not None for result in results) == 1
@@ -0,0 +1,86 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+from deadline_wrapper.deadline_wrapper_10_2 import preflight
+
+
+def _serve(handler, port=0):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", port))
+    server.listen()
+
+    def accept():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                handler(conn)
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server
+
+
+def _fake_mongo(conn):
+    header = conn.recv(16)
+    length, request_id, _, _ = struct.unpack("<iiii", header)
+    conn.recv(length - 16)
+    body = struct.pack("<I", 0) + b"\x00" + struct.pack("<i", 5) + b"\x00"
+    conn.sendall(struct.pack("<iiii", 16 + len(body), 1, request_id, 2013) + body)
+
+
+def _unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_probe_db_tcp():
+    with _serve(lambda conn: None) as server:
+        port = server.getsockname()[1]
+        assert preflight.probe_db("127.0.0.1", port, hello=False) < 1.0
+
+
+def test_probe_db_hello():
+    with _serve(_fake_mongo) as server:
+        port = server.getsockname()[1]
+        assert preflight.probe_db("127.0.0.1", port, hello=True) < 1.0
+
+
+def test_probe_db_hello_rejects_non_mongo():
+    def _http(conn):
+        conn.sendall(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+
+    with _serve(_http) as server:
+        port = server.getsockname()[1]
+        with pytest.raises(preflight.DatabaseUnreachable):
+            preflight.probe_db("127.0.0.1", port, hello=True, timeout=0.5)
+
+
+def test_wait_for_db_gives_up_fast():
+    with pytest.raises(preflight.DatabaseUnreachable, match="3 attempts"):
+        preflight.wait_for_db(
+            "127.0.0.1", _unused_port(), timeout=0.2, retries=2, backoff=0.01
+        )
+
+
+def test_wait_for_db_waits_for_late_server():
+    port = _unused_port()
+    servers = []
+
+    timer = threading.Timer(0.2, lambda: servers.append(_serve(_fake_mongo, port)))
+    timer.start()
+    try:
+        elapsed = preflight.wait_for_db(
+            "127.0.0.1", port, timeout=0.2, wait=5.0, backoff=0.02
+        )
+        assert 0.2 <= elapsed < 5.0
+    finally:
+        timer.cancel()
+        for server in servers:
+            server.close()
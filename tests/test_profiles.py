@@ -0,0 +1,77 @@
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+from deadline_wrapper.deadline_wrapper_10_2 import deadline_wrapper, profiles
+from deadline_wrapper.deadline_wrapper_10_2.deadline_wrapper import _client_cmd
+
+__author__ = "Michael Mussato"
+__copyright__ = "Michael Mussato"
+__license__ = "MIT"
+
+
+def _client_args(version):
+    return _client_cmd(
+        installer=pathlib.Path("/installer.run"),
+        deadline_version=version,
+        prefix=pathlib.Path("/opt/Thinkbox/Deadline10"),
+        repositorydir=pathlib.Path("/opt/Thinkbox/DeadlineRepository10"),
+        httpport=8888,
+        webservice_httpport=8899,
+    )
+
+
+def test_available_versions():
+    versions = profiles.available_versions()
+    assert "10.2.1.1" in versions
+    assert "10.4.0.10" in versions
+    assert versions.index("10.2.1.1") < versions.index("10.4.0.10")
+
+
+def test_remotecontrol_only_in_10_4():
+    cmd_10_2 = _client_args("10.2.1.1")
+    cmd_10_4 = _client_args("10.4.0.10")
+
+    assert "--remotecontrol" not in cmd_10_2
+    assert cmd_10_4[cmd_10_4.index("--remotecontrol") + 1] == "NotBlocked"
+    assert cmd_10_2[cmd_10_2.index("--httpport") + 1] == "8888"
+
+
+def test_unsupported():
+    with pytest.raises(ValueError, match="Unsupported Deadline version"):
+        profiles.get_profile("9.0.0.0")
+
+    profile = profiles.get_profile("10.2.1.1")
+    with pytest.raises(ValueError, match="--remotecontrol"):
+        profile.installer_args("client", remotecontrol="NotBlocked")
+
+
+def test_binary():
+    profile = profiles.get_profile("10.2.1.1")
+    assert profile.binary(pathlib.Path("/opt"), "worker") == pathlib.Path(
+        "/opt/bin/deadlineworker"
+    )
+
+
+def test_resolve_executable():
+    worker = deadline_wrapper.resolve_executable("10.2.1.1", roles=("worker",))
+    assert worker == pathlib.Path("/opt/Thinkbox/Deadline10/bin/deadlineworker")
+
+    # Clones have their binaries in another prefix
+    rcs = pathlib.Path("/opt/Thinkbox/Deadline10_1/bin/deadlinercs")
+    assert deadline_wrapper.resolve_executable("10.2.1.1", rcs) == rcs
+
+    with pytest.raises(ValueError, match="not a Deadline 10.2.1.1"):
+        deadline_wrapper.resolve_executable("10.2.1.1", pathlib.Path("/bin/sh"))
+
+
+def test_parse_args_loads_no_profile():
+    code = (
+        "import sys\n"
+        "from deadline_wrapper.deadline_wrapper_10_2 import deadline_wrapper\n"
+        "deadline_wrapper.parse_args(['run', '--executable', '/bin/deadlinercs'])\n"
+        "assert not [m for m in sys.modules if '.profiles.v' in m], sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,90 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from deadline_wrapper.deadline_wrapper_10_2 import server
+
+
+@pytest.fixture
+def running(tmp_path):
+    socket_path = tmp_path / "wrapper.sock"
+    service = server.Service(
+        handlers={
+            "echo": lambda fields: fields,
+            "fail": lambda fields: 1 / 0,
+            "path": lambda fields: tmp_path,
+        },
+    )
+    wrapper_server = server.WrapperServer(socket_path, service)
+    thread = threading.Thread(target=wrapper_server.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path, service
+    wrapper_server.shutdown()
+    wrapper_server.server_close()
+    service.shutdown(timeout=1.0)
+
+
+def test_requests(running, tmp_path):
+    socket_path, _ = running
+
+    response = server.request(socket_path, "echo", value=[1, 2])
+    assert response["ok"] and response["result"] == {"value": [1, 2]}
+
+    assert server.request(socket_path, "path")["result"] == tmp_path.as_posix()
+
+    response = server.request(socket_path, "fail")
+    assert not response["ok"] and "ZeroDivisionError" in response["error"]
+
+    assert not server.request(socket_path, "nope")["ok"]
+
+    metrics = server.request(socket_path, "metrics")["result"]
+    assert metrics["requests"] == {"echo": 1, "path": 1, "fail": 1, "metrics": 1}
+    assert metrics["errors"] == {"fail": 1}
+
+
+def test_children(running):
+    socket_path, service = running
+
+    child = service.start_child(
+        [
+            sys.executable, "-c",
+            "import time; print('ready', flush=True); time.sleep(60)",
+        ],
+        name="sleeper",
+    )
+    assert child["running"]
+
+    for _ in range(100):
+        status = server.request(socket_path, "status", id=child["id"])["result"]
+        if status["tail"]:
+            break
+        time.sleep(0.05)
+    assert status["tail"] == ["ready"]
+
+    status = server.request(socket_path, "status")["result"]
+    assert [c["id"] for c in status["children"]] == ["sleeper-1"]
+
+    stopped = server.request(socket_path, "stop", id=child["id"], timeout=5)["result"]
+    assert not stopped["running"]
+    assert server.request(socket_path, "metrics")["result"]["children_running"] == 0
+
+
+def test_refuses_second_server(running):
+    socket_path, service = running
+    with pytest.raises(RuntimeError):
+        server.WrapperServer(socket_path, service)
+
+
+def test_prune_exited(running, monkeypatch):
+    _, service = running
+    monkeypatch.setattr(server, "KEEP_EXITED", 1)
+
+    for _ in range(3):
+        service.start_child([sys.executable, "-c", "pass"], name="quick")
+    for child in list(service.children.values()):
+        child.proc.wait()
+    service.start_child([sys.executable, "-c", "pass"], name="quick")
+
+    assert sorted(service.children) == ["quick-3", "quick-4"]
@@ -0,0 +1,57 @@
+import fnmatch
+import os
+
+from deadline_wrapper.deadline_wrapper_10_2 import fsutil, sync
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(data)
+
+
+def test_sync_tree(tmp_path):
+    source = tmp_path / "source"
+    destination = tmp_path / "repository" / "custom"
+    index = tmp_path / "index.json"
+
+    _write(source / "plugins" / "Foo" / "Foo.py", "foo")
+    _write(source / "events" / "Bar" / "Bar.py", "bar")
+    _write(source / "plugins" / "Foo" / "__pycache__" / "Foo.pyc", "")
+    _write(destination / "scripts" / "theirs.py", "not ours")
+
+    stats = sync.sync_tree(source, destination, index_path=index)
+    assert (stats.scanned, stats.copied) == (2, 2)
+    assert (destination / "plugins" / "Foo" / "Foo.py").read_text() == "foo"
+    assert not (destination / "plugins" / "Foo" / "__pycache__").exists()
+
+    # Unchanged: nothing hashed, nothing copied
+    stats = sync.sync_tree(source, destination, index_path=index)
+    assert (stats.hashed, stats.copied) == (0, 0)
+
+    # Touched but identical: hashed, not copied
+    os.utime(source / "events" / "Bar" / "Bar.py", ns=(0, 0))
+    stats = sync.sync_tree(source, destination, index_path=index)
+    assert (stats.hashed, stats.copied) == (1, 0)
+
+    _write(source / "plugins" / "Foo" / "Foo.py", "foo v2")
+    stats = sync.sync_tree(source, destination, index_path=index)
+    assert stats.copied == 1
+    assert (destination / "plugins" / "Foo" / "Foo.py").read_text() == "foo v2"
+    assert not list(destination.rglob(".*.tmp-*"))
+
+    (source / "events" / "Bar" / "Bar.py").unlink()
+    stats = sync.sync_tree(source, destination, index_path=index)
+    assert stats.deleted == 0
+    assert (destination / "events" / "Bar" / "Bar.py").exists()
+
+    stats = sync.sync_tree(source, destination, index_path=index, delete=True)
+    assert stats.deleted == 1
+    assert not (destination / "events").exists()
+    assert (destination / "scripts" / "theirs.py").exists()
+
+
+def test_temp_path_unique(tmp_path):
+    path = tmp_path / "plugin.py"
+    names = {fsutil.temp_path(path).name for _ in range(100)}
+    assert len(names) == 100
+    assert all(fnmatch.fnmatch(name, ".plugin.py.tmp-*") for name in names)
@@ -0,0 +1,67 @@
+import os
+import queue
+import time
+
+import pytest
+
+from deadline_wrapper.deadline_wrapper_10_2 import tail
+
+
+def _collect(lines, count, timeout=5.0):
+    collected = []
+    deadline = time.monotonic() + timeout
+    while len(collected) < count and time.monotonic() < deadline:
+        try:
+            collected.append(lines.get(timeout=0.05))
+        except queue.Empty:
+            pass
+    return collected
+
+
+@pytest.fixture(params=["inotify", "polling"])
+def tailer(request, tmp_path, monkeypatch):
+    if request.param == "polling":
+        monkeypatch.setattr(tail.LogTailer, "_watch", lambda self: None)
+
+    (tmp_path / "worker.log").write_text("old line\n")
+    lines = queue.Queue()
+    tailer = tail.LogTailer(
+        directory=tmp_path,
+        emit=lambda source, line: lines.put((source, line)),
+        poll_interval=0.05,
+    )
+    tailer.start()
+    time.sleep(0.2)
+    yield tmp_path, tailer, lines
+    tailer.stop(timeout=5.0)
+
+
+def test_tail_append_and_rotate(tailer):
+    directory, _, lines = tailer
+
+    with open(directory / "worker.log", "a") as fo:
+        fo.write("first\nsecond ")
+        fo.flush()
+        assert _collect(lines, 1) == [("worker.log", "first")]
+        fo.write("half\n")
+    assert _collect(lines, 1) == [("worker.log", "second half")]
+
+    (directory / "other.txt").write_text("ignored\n")
+    (directory / "rcs.log").write_text("new file\n")
+    assert _collect(lines, 1) == [("rcs.log", "new file")]
+
+    # Rotation: rename away, then a fresh file under the same name
+    with open(directory / "worker.log", "a") as fo:
+        fo.write("before rotation\n")
+    os.rename(directory / "worker.log", directory / "worker.log.1")
+    (directory / "worker.log").write_text("after rotation\n")
+    assert sorted(_collect(lines, 2)) == [
+        ("worker.log", "after rotation"),
+        ("worker.log", "before rotation"),
+    ]
+
+    # Truncation (detected by size, so the new content must be shorter)
+    (directory / "rcs.log").write_text("cut\n")
+    assert _collect(lines, 1) == [("rcs.log", "cut")]
+
+    assert _collect(lines, 1, timeout=0.3) == []
@@ -0,0 +1,92 @@
+import errno
+import os
+import pathlib
+import subprocess
+import sys
+import textwrap
+
+from deadline_wrapper.deadline_wrapper_10_2 import upgrade
+
+FAKE_INSTALLER = textwrap.dedent(
+    """
+    import os, pathlib, sys
+
+    version = sys.argv[1]
+    prefix = pathlib.Path(sys.argv[sys.argv.index("--prefix") + 1])
+    (prefix / "bin").mkdir(parents=True, exist_ok=True)
+    (prefix / "bin" / "deadlineworker").write_text("worker " + version)
+    (prefix / "bin" / "deadlinecommand").write_text("command")
+    (prefix / "lib").mkdir(exist_ok=True)
+    lib = prefix / "lib" / ("libnew.so" if version == "10.4" else "libold.so")
+    lib.write_text("lib")
+    # Installers create absolute links into the prefix
+    os.symlink(lib, lib.with_name(lib.name + ".1"))
+    (prefix / "custom" / "plugins").mkdir(parents=True, exist_ok=True)
+    (prefix / "settings.ini").write_text(f"Root={prefix.as_posix()}\\n")
+    """
+)
+
+
+def _install(tmp_path, version, prefix):
+    script = tmp_path / "installer.py"
+    script.write_text(FAKE_INSTALLER)
+    subprocess.run(
+        [sys.executable, script.as_posix(), version, "--prefix", prefix.as_posix()],
+        check=True,
+    )
+
+
+def test_upgrade(tmp_path):
+    live = tmp_path / "DeadlineRepository10"
+    _install(tmp_path, "10.2", live)
+    (live / "custom" / "plugins" / "Ours.py").write_text("ours")
+    command_inode = os.stat(live / "bin" / "deadlinecommand").st_ino
+
+    staging = upgrade.staging_dir(live)
+    _install(tmp_path, "10.4", staging)
+    assert upgrade.relocate(staging, staging, live) == 2
+
+    diff = upgrade.diff_trees(staging, live, preserve=upgrade.REPOSITORY_PRESERVE)
+    assert diff.added == ["lib/libnew.so", "lib/libnew.so.1"]
+    assert diff.changed == ["bin/deadlineworker"]
+    assert diff.removed == ["lib/libold.so.1", "lib/libold.so"]
+    assert diff.unchanged == 2
+
+    upgrade.apply_diff(diff, new=staging, live=live)
+
+    assert (live / "bin" / "deadlineworker").read_text() == "worker 10.4"
+    assert (live / "lib" / "libnew.so").exists()
+    assert os.readlink(live / "lib" / "libnew.so.1") == (
+        live / "lib" / "libnew.so"
+    ).as_posix()
+    assert not (live / "lib" / "libold.so").exists()
+    assert (live / "settings.ini").read_text() == f"Root={live.as_posix()}\n"
+    assert (live / "custom" / "plugins" / "Ours.py").read_text() == "ours"
+    # Unchanged files are not touched
+    assert os.stat(live / "bin" / "deadlinecommand").st_ino == command_inode
+
+    assert not upgrade.diff_trees(live, live, preserve=upgrade.REPOSITORY_PRESERVE)
+
+
+def test_upgrade_cross_device(tmp_path, monkeypatch):
+    live = tmp_path / "DeadlineRepository10"
+    _install(tmp_path, "10.2", live)
+    staging = upgrade.staging_dir(live)
+    _install(tmp_path, "10.4", staging)
+    upgrade.relocate(staging, staging, live)
+    diff = upgrade.diff_trees(staging, live, preserve=upgrade.REPOSITORY_PRESERVE)
+
+    replace = os.replace
+
+    def _replace(src, dst):
+        # As if the staged file was on another filesystem
+        if staging in pathlib.Path(src).parents:
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", _replace)
+    upgrade.apply_diff(diff, new=staging, live=live)
+
+    assert (live / "bin" / "deadlineworker").read_text() == "worker 10.4"
+    assert (live / "lib" / "libnew.so").exists()
+    assert not upgrade.diff_trees(staging, live, preserve=upgrade.REPOSITORY_PRESERVE)
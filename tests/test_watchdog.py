@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import time
+
+from deadline_wrapper.deadline_wrapper_10_2 import watchdog
+
+CONFIG = dict(silence_timeout=0.5, interval=0.1, term_timeout=1.0)
+
+
+def _spawn(code):
+    return subprocess.Popen([sys.executable, "-c", code], start_new_session=True)
+
+
+def test_tree_cpu_ticks():
+    assert watchdog.tree_cpu_ticks(os.getpid()) > 0
+    assert watchdog.tree_cpu_ticks(2 ** 22 + 1) is None
+
+
+def test_watchdog_fires_on_silent_idle_child(tmp_path):
+    proc = _spawn("import time; time.sleep(60)")
+    incidents = tmp_path / "incidents.jsonl"
+    dog = watchdog.Watchdog(
+        proc=proc,
+        config=watchdog.WatchdogConfig(incidents=incidents, **CONFIG),
+    )
+    dog.touch("last words")
+    dog.start()
+
+    assert proc.wait(timeout=5) != 0
+    dog.stop()
+    assert dog.fired
+    assert '"tail": ["last words"]' in incidents.read_text()
+
+
+def test_watchdog_spares_busy_child():
+    proc = _spawn("while True: pass")
+    dog = watchdog.Watchdog(proc=proc, config=watchdog.WatchdogConfig(**CONFIG))
+    dog.start()
+    try:
+        time.sleep(1.2)
+        assert proc.poll() is None
+        assert not dog.fired
+    finally:
+        dog.stop()
+        watchdog.terminate(proc, timeout=1.0)
+
+
+def test_watchdog_spares_talking_child():
+    proc = _spawn("import time; time.sleep(60)")
+    dog = watchdog.Watchdog(proc=proc, config=watchdog.WatchdogConfig(**CONFIG))
+    dog.start()
+    try:
+        for _ in range(12):
+            dog.touch("still here")
+            time.sleep(0.1)
+        assert not dog.fired
+    finally:
+        dog.stop()
+        watchdog.terminate(proc, timeout=1.0)